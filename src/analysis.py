@@ -0,0 +1,262 @@
+import multiprocessing
+import os
+import threading
+import wave
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import numpy as np
+import database
+from playlist import Playlist, PlaylistManager, SongNode
+
+ANALYSIS_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+# Decoded at this rate, mixed to mono: plenty for loudness and tempo
+ANALYSIS_RATE = 22050
+# Loudness of the loudest 5% of 50ms blocks that playback aims for. pygame can
+# only turn the volume down, so the target sits below typical masters.
+REFERENCE_DBFS = -20.0
+MIN_GAIN_DB, MAX_GAIN_DB = -24.0, 12.0
+BLOCK_SECONDS = 0.05
+ONSET_HOP = 256
+ONSET_SMOOTHING = np.hanning(7) / np.hanning(7).sum()
+MIN_BPM, MAX_BPM = 60.0, 200.0
+# Results written to the database per batch while a run is in progress
+SAVE_BATCH = 200
+
+# (duration seconds, loudness dBFS, bpm); any may be None
+Analysis = Tuple[Optional[float], Optional[float], Optional[float]]
+
+# ===== DSP on float32 mono samples in [-1, 1] =====
+def loudness_dbfs(samples: np.ndarray, rate: int) -> Optional[float]:
+    # ReplayGain-style: RMS over 50ms blocks, level of the loudest 5%
+    block = int(rate * BLOCK_SECONDS)
+    n = len(samples) // block
+    if n == 0:
+        return None
+    frames = samples[:n * block].reshape(n, block)
+    rms = np.sqrt(np.einsum("ij,ij->i", frames, frames) / block)
+    level = float(np.percentile(rms, 95))
+    return float(20.0 * np.log10(max(level, 1e-9)))
+
+def gain_db(loudness: Optional[float]) -> Optional[float]:
+    if loudness is None:
+        return None
+    return float(min(MAX_GAIN_DB, max(MIN_GAIN_DB, REFERENCE_DBFS - loudness)))
+
+def estimate_bpm(samples: np.ndarray, rate: int) -> Optional[float]:
+    # Onset strength from rises in log energy, then the autocorrelation lag
+    # that repeats best, weighted towards common tempos around 120 BPM
+    n = len(samples) // ONSET_HOP
+    fps = rate / ONSET_HOP
+    if n < fps * 4:
+        return None
+    frames = samples[:n * ONSET_HOP].reshape(n, ONSET_HOP)
+    energy = np.log(np.einsum("ij,ij->i", frames, frames) + 1e-10)
+    onset = np.maximum(np.diff(energy), 0.0)
+    # Widen the peaks so beats that fall between frames still line up
+    onset = np.convolve(onset, ONSET_SMOOTHING, mode="same")
+    onset -= onset.mean()
+    spectrum = np.fft.rfft(onset, 2 * len(onset))
+    ac = np.fft.irfft(spectrum * np.conj(spectrum))[:len(onset)]
+    lo, hi = int(60.0 * fps / MAX_BPM), int(np.ceil(60.0 * fps / MIN_BPM))
+    if hi >= len(ac) - 1 or ac[0] <= 0:
+        return None
+    lags = np.arange(lo, hi + 1)
+    prior = np.exp(-0.5 * np.log2(60.0 * fps / lags / 120.0) ** 2)
+    best = lo + int(np.argmax(ac[lo:hi + 1] * prior))
+    # Parabolic interpolation between neighbouring lags
+    a, b, c = ac[best - 1], ac[best], ac[best + 1]
+    denom = a - 2 * b + c
+    lag = best + (0.5 * (a - c) / denom if denom else 0.0)
+    return round(float(60.0 * fps / lag), 1)
+
+# ===== Decoding (worker processes) =====
+def _init_worker():
+    # No audio device is needed to decode
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+def _decode_pygame(path: str) -> Tuple[np.ndarray, int]:
+    import pygame
+    if not pygame.mixer.get_init():
+        pygame.mixer.init(frequency=ANALYSIS_RATE, size=-16, channels=1)
+    rate, _, _ = pygame.mixer.get_init()
+    pcm = pygame.sndarray.array(pygame.mixer.Sound(path))
+    return pcm, rate
+
+def _decode_wave(path: str) -> Tuple[np.ndarray, int]:
+    with wave.open(path, "rb") as w:
+        width, channels, rate = w.getsampwidth(), w.getnchannels(), w.getframerate()
+        raw = w.readframes(w.getnframes())
+    if width != 2:
+        raise ValueError(f"unsupported sample width: {width}")
+    return np.frombuffer(raw, dtype="<i2").reshape(-1, channels), rate
+
+def decode_mono(path: str) -> Tuple[np.ndarray, int]:
+    try:
+        pcm, rate = _decode_pygame(path)
+    except Exception:
+        if not path.lower().endswith(".wav"):
+            raise
+        pcm, rate = _decode_wave(path)
+    samples = pcm.astype(np.float32) / 32768.0
+    if samples.ndim == 2:
+        samples = samples.mean(axis=1)
+    return samples, rate
+
+def analyze_file(path: str) -> Analysis:
+    samples, rate = decode_mono(path)
+    return len(samples) / float(rate), loudness_dbfs(samples, rate), estimate_bpm(samples, rate)
+
+def _analyze_safe(path: str) -> Analysis:
+    try:
+        return analyze_file(path)
+    except Exception:
+        return None, None, None  # stored anyway, so broken files aren't retried until they change
+
+# ===== Pipeline =====
+class AudioAnalyzer:
+    def __init__(self, workers: int = ANALYSIS_WORKERS, db_path: Optional[str] = None):
+        self.workers = workers
+        self.db_path = db_path or database.DB_PATH
+        self._cancel = threading.Event()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def run(self, paths: Iterable[str], progress: Optional[Callable[[int, int], None]] = None) -> int:
+        # Analyze files whose (size, mtime) changed since their cached result, in
+        # worker processes; returns how many were analyzed
+        self._cancel.clear()
+        cached = database.load_analysis(self.db_path)
+        stale: List[Tuple[str, int, float]] = []
+        for path in set(paths):
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            row = cached.get(path)
+            if row is None or row[0] != st.st_size or row[1] != st.st_mtime:
+                stale.append((path, st.st_size, st.st_mtime))
+        if progress:
+            progress(0, len(stale))
+        if not stale:
+            return 0
+
+        done = 0
+        rows = []
+        # spawn, not fork: the GUI process has Tk and several threads running
+        ctx = multiprocessing.get_context("spawn")
+        pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=ctx, initializer=_init_worker)
+        try:
+            for (path, size, mtime), (duration, loudness, bpm) in zip(
+                    stale, pool.map(_analyze_safe, [p for p, _, _ in stale], chunksize=4)):
+                rows.append((path, size, mtime, duration, loudness, gain_db(loudness), bpm))
+                done += 1
+                if len(rows) >= SAVE_BATCH:
+                    database.save_analysis(rows, self.db_path)
+                    rows = []
+                if progress and (done % 10 == 0 or done == len(stale)):
+                    progress(done, len(stale))
+                if self._cancel.is_set():
+                    break
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+            database.save_analysis(rows, self.db_path)
+        return done
+
+class AnalysisCache:
+    # In-memory view of the analysis table for the Tk and player threads.
+    # reload() swaps in a new dict, so readers never see a partial update.
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path or database.DB_PATH
+        # path -> (duration, loudness, gain, bpm)
+        self._by_path: Dict[str, Tuple[float, Optional[float], Optional[float], Optional[float]]] = {}
+        # Bumped by reload(), so totals derived from the old results are redone
+        self.version = 0
+
+    def reload(self):
+        self._by_path = {path: row[2:] for path, row in database.load_analysis(self.db_path).items()
+                         if row[2] is not None}
+        self.version += 1
+
+    def __len__(self) -> int:
+        return len(self._by_path)
+
+    def duration(self, path: str) -> Optional[float]:
+        row = self._by_path.get(path)
+        return row[0] if row else None
+
+    def loudness(self, path: str) -> Optional[float]:
+        row = self._by_path.get(path)
+        return row[1] if row else None
+
+    def gain(self, path: str) -> Optional[float]:
+        row = self._by_path.get(path)
+        return row[2] if row else None
+
+    def bpm(self, path: str) -> Optional[float]:
+        row = self._by_path.get(path)
+        return row[3] if row else None
+
+    def total_duration(self, paths: Iterable[str]) -> Tuple[float, int]:
+        # (seconds for analyzed tracks, number of tracks without a result)
+        total, missing = 0.0, 0
+        get = self._by_path.get
+        for path in paths:
+            row = get(path)
+            if row is None:
+                missing += 1
+            else:
+                total += row[0]
+        return total, missing
+
+class PlaylistDurations:
+    # Running (seconds, tracks not analyzed) per playlist for the status bar.
+    # A playlist is summed once when first asked for and then kept current
+    # from the change tracker's add/remove events, so an edit costs O(songs
+    # changed). Smart playlists change outside the tracker and are summed
+    # again when their length moves; a reload of the cache starts over.
+    def __init__(self, pm: PlaylistManager, cache: AnalysisCache):
+        self.cache = cache
+        # playlist -> [seconds, not analyzed, songs counted]
+        self._totals: Dict[Playlist, List] = {}
+        self._version = cache.version
+        pm.tracker.listeners.append(self._on_event)
+
+    def total(self, pl: Playlist) -> Tuple[float, int]:
+        if self._version != self.cache.version:
+            self._totals.clear()
+            self._version = self.cache.version
+        entry = self._totals.get(pl)
+        if entry is None or (pl.rules is not None and entry[2] != pl.length):
+            total, missing = self.cache.total_duration(node.filepath for node in pl)
+            entry = self._totals[pl] = [total, missing, pl.length]
+        return max(0.0, entry[0]), entry[1]
+
+    def _on_event(self, seq: int, kind: str, pl: Playlist, *details):
+        if kind == "relocate":
+            # Durations are looked up by path
+            self._totals.clear()
+            return
+        entry = self._totals.get(pl)
+        if entry is None:
+            return
+        if kind == "add":
+            self._count(entry, details[0], 1)
+        elif kind == "remove":
+            self._count(entry, details[0], -1)
+        elif kind == "remove_many":
+            for node, _ in details[0]:
+                self._count(entry, node, -1)
+        elif kind == "clear":
+            entry[:] = [0.0, 0, 0]
+        elif kind == "drop":
+            del self._totals[pl]
+
+    def _count(self, entry: List, node: SongNode, sign: int):
+        seconds = self.cache.duration(node.filepath)
+        if seconds is None:
+            entry[1] += sign
+        else:
+            entry[0] += sign * seconds
+        entry[2] += sign
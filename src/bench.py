@@ -0,0 +1,418 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+import database
+from playlist import PlaylistManager
+from playlist_io import export_file, import_file
+from scanner import TrackInfo, import_tracks
+from store import LogStore, MemoryStore, SqliteStore
+from utils import normalize_path, pretty_title
+
+# Individually timed operations per latency measurement
+SAMPLES = 2000
+# Cold starts of the GUI per library size in the startup suite
+STARTUP_RUNS = 5
+# Backends compared by the store suite
+STORE_BACKENDS = ("sqlite", "memory", "log")
+
+class LegacySongNode:
+    # The original node layout: a plain object with a __dict__ and its own strings
+    def __init__(self, title: str, filepath: str):
+        self.title = title
+        self.filepath = filepath
+        self.prev = None
+        self.next = None
+
+def synthetic_songs(n_songs: int, n_unique: int):
+    for i in range(n_songs):
+        k = i % n_unique
+        # Built fresh each time, as if read from disk or SQLite
+        yield "".join(("Track ", str(k))), "".join(("/music/library/artist_", str(k % 500), "/track_", str(k), ".mp3"))
+
+def build_library(n_songs: int, n_playlists: int, n_unique: int = 0) -> PlaylistManager:
+    pm = PlaylistManager()
+    songs = synthetic_songs(n_songs, n_unique or n_songs)
+    per = max(1, n_songs // n_playlists)
+    for p in range(n_playlists):
+        name = f"Playlist {p:04d}"
+        pm.create_playlist(name)
+        pl = pm.playlists[name]
+        for _ in range(per if p < n_playlists - 1 else n_songs - per * (n_playlists - 1)):
+            pl.add_song(*next(songs))
+    return pm
+
+# ===== Measurement helpers =====
+def percentiles(samples_ns: List[int]) -> Dict[str, float]:
+    if not samples_ns:
+        return {}
+    xs = sorted(samples_ns)
+    def pick(q):
+        return round(xs[min(len(xs) - 1, int(q * len(xs)))] / 1000.0, 3)
+    return {"p50_us": pick(0.50), "p95_us": pick(0.95), "p99_us": pick(0.99), "max_us": round(xs[-1] / 1000.0, 3)}
+
+def latency(fn: Callable, args_list: List) -> Dict[str, float]:
+    samples = []
+    for args in args_list:
+        t0 = time.perf_counter_ns()
+        fn(*args)
+        samples.append(time.perf_counter_ns() - t0)
+    return percentiles(samples)
+
+def throughput(count: int, seconds: float) -> float:
+    return round(count / seconds, 1) if seconds > 0 else float("inf")
+
+def peak_memory(fn: Callable, *args) -> int:
+    # Second run under tracemalloc, so timings above are not skewed by tracing
+    gc.collect()
+    tracemalloc.start()
+    try:
+        fn(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+# ===== Benchmarks =====
+def bench_playlist(n_songs: int, n_playlists: int) -> dict:
+    rng = random.Random(42)
+    t0 = time.perf_counter()
+    pm = build_library(n_songs, n_playlists)
+    build_s = time.perf_counter() - t0
+    pm.collect_changes()
+    pl = max(pm.playlists.values(), key=lambda p: p.length)
+    nodes = list(pl)
+    picks = [rng.choice(nodes) for _ in range(SAMPLES)]
+
+    t0 = time.perf_counter()
+    count = sum(1 for _ in pl)
+    iterate_s = time.perf_counter() - t0
+
+    result = {
+        "add_songs_per_s": throughput(n_songs, build_s),
+        "iterate_songs_per_s": throughput(count, iterate_s),
+        "search_song": latency(pl.search_song, [(n.title,) for n in picks]),
+        "find_by_path": latency(pl.find_by_path, [(n.filepath,) for n in picks]),
+        "insert_after": latency(pl.insert_after, [(n, "Inserted", "/music/inserted.mp3") for n in picks]),
+    }
+    nodes = list(pl)
+    result["move_song"] = latency(pl.move_song, [(rng.choice(nodes), rng.choice(nodes)) for _ in range(SAMPLES)])
+    victims = rng.sample(nodes, min(SAMPLES, len(nodes)))
+    result["delete_node"] = latency(pl.delete_node, [(n,) for n in victims])
+    result["peak_bytes"] = peak_memory(build_library, n_songs, n_playlists)
+    return result
+
+def bench_persistence(n_songs: int, n_playlists: int) -> dict:
+    rng = random.Random(7)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        database.init_db(path)
+        pm = build_library(n_songs, n_playlists)
+        result = {}
+
+        t0 = time.perf_counter()
+        database.save_changes(pm, path)
+        result["initial_save_s"] = round(time.perf_counter() - t0, 4)
+
+        # A typical edit: a few appends and deletes in one playlist
+        pl = next(iter(pm.playlists.values()))
+        edit_samples = []
+        for _ in range(50):
+            for _ in range(5):
+                pl.add_song("Edit", "/music/edit.mp3")
+            for node in rng.sample(list(pl), min(5, pl.length)):
+                pl.delete_node(node)
+            t0 = time.perf_counter_ns()
+            database.save_changes(pm, path)
+            edit_samples.append(time.perf_counter_ns() - t0)
+        result["incremental_save"] = percentiles(edit_samples)
+
+        t0 = time.perf_counter()
+        database.save_all_playlists(pm, path)
+        result["full_snapshot_s"] = round(time.perf_counter() - t0, 4)
+
+        t0 = time.perf_counter()
+        lazy = database.load_all_playlists(db_path=path)
+        result["lazy_load_s"] = round(time.perf_counter() - t0, 4)
+        unloaded = next((p for p in lazy.playlists.values() if not p.loaded), None)
+        if unloaded:
+            t0 = time.perf_counter()
+            unloaded.ensure_loaded()
+            result["playlist_page_in_s"] = round(time.perf_counter() - t0, 4)
+
+        t0 = time.perf_counter()
+        database.load_all_playlists(lazy=False, db_path=path)
+        result["eager_load_s"] = round(time.perf_counter() - t0, 4)
+        result["eager_load_peak_bytes"] = peak_memory(database.load_all_playlists, False, path)
+        result["db_bytes"] = os.path.getsize(path)
+        return result
+
+def _open_store(kind: str, folder: str):
+    if kind == "sqlite":
+        path = os.path.join(folder, "bench.db")
+        database.init_db(path)
+        return SqliteStore(path)
+    if kind == "log":
+        return LogStore(os.path.join(folder, "bench.log"))
+    return MemoryStore()
+
+def _store_case(kind: str, n_songs: int, n_playlists: int) -> dict:
+    rng = random.Random(11)
+    with tempfile.TemporaryDirectory() as tmp:
+        store = _open_store(kind, tmp)
+        try:
+            pm = build_library(n_songs, n_playlists)
+            result = {}
+            t0 = time.perf_counter()
+            store.apply([pm.collect_changes()])
+            result["initial_write_s"] = round(time.perf_counter() - t0, 4)
+
+            # Write-heavy: many small batches, as the persistence service sends them
+            pl = next(iter(pm.playlists.values()))
+            samples = []
+            for _ in range(200):
+                for _ in range(5):
+                    pl.add_song("Edit", "/music/edit.mp3")
+                for node in rng.sample(list(pl), min(5, pl.length)):
+                    pl.delete_node(node)
+                changes = pm.collect_changes()
+                t0 = time.perf_counter_ns()
+                store.apply([changes])
+                samples.append(time.perf_counter_ns() - t0)
+            result["batch_write"] = percentiles(samples)
+            result["batches_per_s"] = throughput(len(samples), sum(samples) / 1e9)
+
+            # Read-heavy: every playlist paged in from the open store...
+            t0 = time.perf_counter()
+            loaded = store.load()
+            for p in loaded.playlists.values():
+                p.ensure_loaded()
+            result["full_load_s"] = round(time.perf_counter() - t0, 4)
+            t0 = time.perf_counter()
+            store.snapshot(pm)
+            result["snapshot_s"] = round(time.perf_counter() - t0, 4)
+            if kind != "memory":
+                # ...and from a fresh process, which for the log means a replay
+                store.close()
+                store = _open_store(kind, tmp)
+                t0 = time.perf_counter()
+                loaded = store.load()
+                for p in loaded.playlists.values():
+                    p.ensure_loaded()
+                result["cold_load_s"] = round(time.perf_counter() - t0, 4)
+                result["disk_bytes"] = sum(entry.stat().st_size for entry in os.scandir(tmp))
+            return result
+        finally:
+            store.close()
+
+def bench_store(n_songs: int, n_playlists: int) -> dict:
+    # The same workload on each backend; the durable ones are ranked for
+    # write-heavy (batch throughput) and read-heavy (cold load) use
+    result = {kind: _store_case(kind, n_songs, n_playlists) for kind in STORE_BACKENDS}
+    durable = [kind for kind in STORE_BACKENDS if kind != "memory"]
+    result["recommended"] = {
+        "write_heavy": max(durable, key=lambda kind: result[kind]["batches_per_s"]),
+        "read_heavy": min(durable, key=lambda kind: result[kind]["cold_load_s"]),
+    }
+    return result
+
+def bench_utils(n: int) -> dict:
+    names = [f"Artist_{i % 300} - Some-Song_Title {i}.mp3" for i in range(n)]
+    paths = [f"~/music/../music/artist_{i % 300}/track_{i}.mp3" for i in range(n)]
+    t0 = time.perf_counter()
+    for name in names:
+        pretty_title(name)
+    pretty_s = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    for path in paths:
+        normalize_path(path)
+    normalize_s = time.perf_counter() - t0
+    return {
+        "pretty_title_per_s": throughput(n, pretty_s),
+        "normalize_path_per_s": throughput(n, normalize_s),
+    }
+
+def bench_import(n_songs: int) -> dict:
+    tracks = [TrackInfo(path, 0, 0.0, title) for title, path in synthetic_songs(n_songs, n_songs)]
+    pm = PlaylistManager()
+    pm.create_playlist("Import")
+    pl = pm.playlists["Import"]
+    t0 = time.perf_counter()
+    added = import_tracks(pl, tracks)
+    first_s = time.perf_counter() - t0
+    # Re-importing the same folder is pure dedup checks
+    t0 = time.perf_counter()
+    import_tracks(pl, tracks)
+    again_s = time.perf_counter() - t0
+    return {
+        "imported": added,
+        "import_tracks_per_s": throughput(n_songs, first_s),
+        "reimport_dedup_per_s": throughput(n_songs, again_s),
+    }
+
+def bench_io(n_songs: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        src = os.path.join(tmp, "library.m3u8")
+        with open(src, "w", encoding="utf-8") as f:
+            f.write("#EXTM3U\n")
+            for title, path in synthetic_songs(n_songs, n_songs):
+                f.write(f"#EXTINF:-1,{title}\n{path}\n")
+        pm = PlaylistManager()
+        t0 = time.perf_counter()
+        import_file(pm, src, "Imported")
+        import_s = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        export_file(pm, os.path.join(tmp, "out.jsonl"), ["Imported"])
+        export_s = time.perf_counter() - t0
+        return {
+            "m3u_import_per_s": throughput(n_songs, import_s),
+            "jsonl_export_per_s": throughput(n_songs, export_s),
+            "import_peak_bytes": peak_memory(import_file, PlaylistManager(), src, "Imported"),
+        }
+
+# ===== Memory layout comparison =====
+def _measure(build) -> dict:
+    gc.collect()
+    tracemalloc.start()
+    keep = build()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del keep
+    return {"current_bytes": current, "peak_bytes": peak}
+
+def _build_legacy(n_songs, n_unique, n_playlists):
+    playlists = []
+    per = n_songs // n_playlists
+    songs = synthetic_songs(n_songs, n_unique)
+    for _ in range(n_playlists):
+        head = tail = None
+        for _ in range(per):
+            node = LegacySongNode(*next(songs))
+            if head is None:
+                head = tail = node
+            else:
+                tail.next = node
+                node.prev = tail
+                tail = node
+        playlists.append(head)
+    return playlists
+
+def _build_current(n_songs, n_unique, n_playlists):
+    pm = build_library(n_songs, n_playlists, n_unique)
+    pm.collect_changes()
+    return pm
+
+def bench_memory(n_songs: int, n_unique: int, n_playlists: int) -> dict:
+    legacy = _measure(lambda: _build_legacy(n_songs, n_unique, n_playlists))
+    current = _measure(lambda: _build_current(n_songs, n_unique, n_playlists))
+    return {
+        "songs": n_songs,
+        "unique_tracks": n_unique,
+        "playlists": n_playlists,
+        "legacy": dict(legacy, bytes_per_song=legacy["current_bytes"] / n_songs),
+        "current": dict(current, bytes_per_song=current["current_bytes"] / n_songs),
+    }
+
+# ===== Driver =====
+def bench_startup(n_songs: int, n_playlists: int) -> dict:
+    # Boot the real GUI against a scratch library until it is interactive.
+    # Needs a display; without one the suite reports why it was skipped.
+    main_py = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+    with tempfile.TemporaryDirectory() as tmp:
+        database.init_db(os.path.join(tmp, "bench.db"))
+        database.save_changes(build_library(n_songs, n_playlists), os.path.join(tmp, "bench.db"))
+        report_path = os.path.join(tmp, "startup.json")
+        runs: Dict[str, List[float]] = {}
+        for _ in range(STARTUP_RUNS):
+            t0 = time.perf_counter()
+            proc = subprocess.run([sys.executable, main_py, "--db", os.path.join(tmp, "bench.db"),
+                                   "--startup-report", report_path], capture_output=True, text=True, timeout=120)
+            wall_ms = (time.perf_counter() - t0) * 1000
+            if proc.returncode != 0 or not os.path.exists(report_path):
+                lines = (proc.stderr or "no output").strip().splitlines()
+                return {"skipped": lines[-1] if lines else f"exit code {proc.returncode}"}
+            with open(report_path) as f:
+                stages = json.load(f)
+            os.remove(report_path)
+            for stage, ms in stages.items():
+                runs.setdefault(stage, []).append(ms)
+            runs.setdefault("process_exit", []).append(wall_ms)
+        # Medians; "interactive" is time to interactive from the first line of main.py
+        return {stage: round(sorted(ms)[len(ms) // 2], 1) for stage, ms in runs.items()}
+
+SUITES = ["playlist", "persistence", "store", "utils", "import", "io", "memory", "startup"]
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ""
+
+def run(suites: List[str], sizes: List[int], playlist_counts: List[int]) -> dict:
+    report = {
+        "revision": _git_revision(),
+        "python": platform.python_version(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": [],
+    }
+    for n_songs in sizes:
+        for n_playlists in playlist_counts:
+            if n_playlists > n_songs:
+                continue
+            case = {"songs": n_songs, "playlists": n_playlists}
+            if "playlist" in suites:
+                case["playlist"] = bench_playlist(n_songs, n_playlists)
+            if "persistence" in suites:
+                case["persistence"] = bench_persistence(n_songs, n_playlists)
+            if "store" in suites:
+                case["store"] = bench_store(n_songs, n_playlists)
+            if "memory" in suites:
+                case["memory"] = bench_memory(n_songs, max(1, n_songs // 10), n_playlists)
+            if "startup" in suites:
+                case["startup"] = bench_startup(n_songs, n_playlists)
+            report["results"].append(case)
+        if "utils" in suites:
+            report["results"].append({"songs": n_songs, "utils": bench_utils(n_songs)})
+        if "import" in suites:
+            report["results"].append({"songs": n_songs, "import": bench_import(n_songs)})
+        if "io" in suites:
+            report["results"].append({"songs": n_songs, "io": bench_io(n_songs)})
+    return report
+
+def _int_list(text: str) -> List[int]:
+    return [int(x.replace("_", "")) for x in text.split(",") if x]
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless benchmarks for playlist, persistence and import paths")
+    parser.add_argument("suites", nargs="*", default=[],
+                        help="suites to run (default: all)")
+    parser.add_argument("--songs", type=_int_list, default=[1_000, 10_000, 100_000],
+                        help="comma-separated library sizes, e.g. 1000,100000,1000000")
+    parser.add_argument("--playlists", type=_int_list, default=[1, 10, 100],
+                        help="comma-separated playlist counts, e.g. 1,100,1000")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+    unknown = set(args.suites) - set(SUITES)
+    if unknown:
+        parser.error(f"unknown suite(s): {', '.join(sorted(unknown))}; choose from {', '.join(SUITES)}")
+
+    report = run(args.suites or SUITES, args.songs, args.playlists)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+import sys
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from utils import normalize_path, normalize_paths
+
+class Track:
+    __slots__ = ("id", "path", "title", "size", "mtime", "hash")
+
+    def __init__(self, path: str, title: str, track_id: Optional[int] = None,
+                 size: Optional[int] = None, mtime: Optional[float] = None,
+                 content_hash: Optional[str] = None):
+        self.id: Optional[int] = track_id
+        self.path: str = path
+        self.title: str = sys.intern(title)
+        self.size: Optional[int] = size
+        self.mtime: Optional[float] = mtime
+        self.hash: Optional[str] = content_hash
+
+# Finds a stored track by normalized path: (id, title, size, mtime, hash) or None
+TrackLookup = Callable[[str], Optional[Tuple]]
+# Finds stored tracks for many normalized paths: (id, path, title, size, mtime, hash) rows
+TrackBulkLookup = Callable[[List[str]], Iterable[Tuple]]
+
+# Entries normalized and looked up together by get_or_create_many
+BATCH_SIZE = 2000
+
+class TrackCatalog:
+    # One Track per normalized path, shared by every playlist entry that refers
+    # to it. Tracks already in storage are pulled in on demand through lookup,
+    # so memory grows with the tracks in use rather than the whole library.
+    def __init__(self):
+        self._by_path: Dict[str, Track] = {}
+        # Ids of tracks whose file has disappeared
+        self.missing: Set[int] = set()
+        self.tracker = None  # playlist.ChangeTracker, set by PlaylistManager
+        self.lookup: Optional[TrackLookup] = None
+        self.lookup_many: Optional[TrackBulkLookup] = None
+        # Set by stores without SQL: loader pages of every stored track some
+        # playlist holds, which smart playlists then filter in Python
+        self.scan: Optional[Callable[[], Iterator[List[Tuple]]]] = None
+
+    def __len__(self) -> int:
+        return len(self._by_path)
+
+    def __iter__(self):
+        return iter(self._by_path.values())
+
+    def _register(self, track: Track) -> Track:
+        self._by_path[track.path] = track
+        return track
+
+    def find(self, filepath: str) -> Optional[Track]:
+        # In-memory only: every track referenced by a loaded playlist is here
+        return self._by_path.get(normalize_path(filepath))
+
+    def get(self, filepath: str) -> Optional[Track]:
+        # Like find(), but also pulls in a stored track; never creates one
+        path = normalize_path(filepath)
+        track = self._by_path.get(path)
+        if track is None and self.lookup is not None:
+            row = self.lookup(path)
+            if row is not None:
+                track = self.restore(row[0], sys.intern(path), *row[1:])
+        return track
+
+    def is_missing(self, track: Track) -> bool:
+        return track.id in self.missing
+
+    def set_missing(self, track: Track, missing: bool):
+        if (track.id in self.missing) == missing:
+            return
+        if missing:
+            self.missing.add(track.id)
+        else:
+            self.missing.discard(track.id)
+        if self.tracker:
+            self.tracker.track_missing(track, missing)
+
+    def relocate(self, track: Track, filepath: str) -> bool:
+        # The file moved: every playlist entry follows the shared track. Refused
+        # when another track already owns the new path.
+        path = sys.intern(normalize_path(filepath))
+        if path in self._by_path or (self.lookup is not None and self.lookup(path) is not None):
+            return False
+        old_path = track.path
+        del self._by_path[old_path]
+        track.path = path
+        self._register(track)
+        if self.tracker:
+            self.tracker.track_relocated(track, old_path)
+        return True
+
+    def restore(self, track_id: int, path: str, title: str, size: Optional[int] = None,
+                mtime: Optional[float] = None, content_hash: Optional[str] = None) -> Track:
+        # A track that already exists in storage, without recording a change
+        track = self._by_path.get(path)
+        if track is None:
+            track = self._register(Track(sys.intern(path), title, track_id, size, mtime, content_hash))
+        return track
+
+    def get_or_create(self, title: str, filepath: str, size: Optional[int] = None,
+                      mtime: Optional[float] = None, content_hash: Optional[str] = None) -> Track:
+        path = sys.intern(normalize_path(filepath))
+        track = self._by_path.get(path)
+        if track is None and self.lookup is not None:
+            row = self.lookup(path)
+            if row is not None:
+                track = self.restore(row[0], path, *row[1:])
+        if track is not None:
+            # Newer file facts (e.g. from a scan) refresh what we had
+            if (size is not None and size != track.size) or (content_hash and content_hash != track.hash) \
+                    or (mtime is not None and mtime != track.mtime):
+                track.size = size if size is not None else track.size
+                track.mtime = mtime if mtime is not None else track.mtime
+                track.hash = content_hash or track.hash
+                if self.tracker:
+                    self.tracker.track_updated(track)
+            return track
+        return self._create(path, title, size, mtime, content_hash)
+
+    def _create(self, path: str, title: str, size: Optional[int] = None,
+                mtime: Optional[float] = None, content_hash: Optional[str] = None) -> Track:
+        track = Track(path, title, None, size, mtime, content_hash)
+        if self.tracker:
+            self.tracker.track_added(track)
+        return self._register(track)
+
+    def get_or_create_many(self, entries: Iterable[Tuple[str, str]], base: Optional[str] = None) -> Iterator[Track]:
+        # (title, filepath) pairs in, one Track per pair out, in order. Paths are
+        # normalized a batch at a time (relative ones against base) and stored
+        # tracks are fetched with one query per batch instead of one per path.
+        batch: List[Tuple[str, str]] = []
+        for entry in entries:
+            batch.append(entry)
+            if len(batch) >= BATCH_SIZE:
+                yield from self._create_batch(batch, base)
+                batch = []
+        if batch:
+            yield from self._create_batch(batch, base)
+
+    def _create_batch(self, batch: List[Tuple[str, str]], base: Optional[str]) -> Iterator[Track]:
+        paths = normalize_paths([filepath for _, filepath in batch], base)
+        if self.lookup_many is not None:
+            missing = list({p for p in paths if p not in self._by_path})
+            if missing:
+                for row in self.lookup_many(missing):
+                    self.restore(*row)
+        for (title, _), path in zip(batch, paths):
+            track = self._by_path.get(path)
+            if track is None:
+                track = self._create(sys.intern(path), title)
+            yield track
@@ -0,0 +1,108 @@
+import argparse
+import sys
+import time
+import database
+import library
+from playlist_io import FORMATS, READERS, export_file, import_file
+
+# Headless counterpart to main.py: bulk playlist import/export without Tk or pygame.
+# Run it while the GUI is closed; both allocate ids from the same database.
+
+def cmd_list(pm, args) -> int:
+    for name in pm.get_all_names():
+        pl = pm.playlists[name]
+        if pl.rules is not None:
+            pl.ensure_loaded()
+            print(f"{pl.length:8d}  {name}  [smart: {pl.rules}]")
+        else:
+            print(f"{pl.length:8d}  {name}")
+    return 0
+
+def cmd_import(pm, args) -> int:
+    total = 0
+    t0 = time.perf_counter()
+    for path in args.files:
+        counts = import_file(pm, path, args.playlist, args.format, args.replace, args.skip_existing)
+        for name, added in counts.items():
+            print(f"{path}: {added} song(s) into '{name}'")
+            total += added
+    parsed_s = time.perf_counter() - t0
+    # Everything from every file lands in one transaction
+    database.save_changes(pm, args.db_path)
+    print(f"Imported {total} song(s) in {parsed_s:.2f}s, saved in {time.perf_counter() - t0 - parsed_s:.2f}s")
+    return 0
+
+def cmd_export(pm, args) -> int:
+    names = args.playlists or pm.get_all_names()
+    count = export_file(pm, args.output, names, args.format, args.relative)
+    print(f"Exported {count} song(s) from {len(names)} playlist(s) to {args.output}")
+    return 0
+
+def cmd_libraries(pm, args) -> int:
+    # Counts come from one query over the attached libraries
+    libraries = library.LibrarySet(active=args.db_path)
+    try:
+        totals = libraries.totals()
+    finally:
+        libraries.close()
+    for name, counts in list(totals["libraries"].items()) + [("(all)", totals["all"])]:
+        print(f"{counts['songs']:8d} songs  {counts['tracks']:8d} tracks  {counts['playlists']:5d} playlists  "
+              f"{counts['plays']:7d} plays  {name}")
+    return 0
+
+def cmd_find(pm, args) -> int:
+    libraries = library.LibrarySet(args.libraries or None, active=args.db_path)
+    try:
+        hits = libraries.search(args.query, args.limit)
+    finally:
+        libraries.close()
+    for hit in hits:
+        print(f"{hit.library}/{hit.playlist}: {hit.title}  ({hit.filepath})")
+    return 0
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Import and export playlists without starting the GUI")
+    parser.add_argument("--library", default=library.MAIN_LIBRARY,
+                        help="library to work on (default: main); a new name creates it")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    sub.add_parser("list", help="show playlists and song counts").set_defaults(func=cmd_list)
+
+    p = sub.add_parser("import", help=f"import {', '.join(sorted(FORMATS))} files")
+    p.add_argument("files", nargs="+")
+    p.add_argument("--playlist", help="target playlist for M3U/PLS files (default: the file name)")
+    p.add_argument("--format", choices=sorted(READERS), help="override detection by extension")
+    again = p.add_mutually_exclusive_group()
+    again.add_argument("--replace", action="store_true",
+                       help="empty each target playlist first, so a re-import does not append the songs again")
+    again.add_argument("--skip-existing", action="store_true",
+                       help="leave out songs whose file the target playlist already has")
+    p.set_defaults(func=cmd_import)
+
+    p = sub.add_parser("export", help="export playlists to a file")
+    p.add_argument("output")
+    p.add_argument("playlists", nargs="*", help="playlist names (default: all; M3U/PLS take exactly one)")
+    p.add_argument("--format", choices=sorted(READERS), help="override detection by extension")
+    p.add_argument("--relative", action="store_true", help="write paths relative to the output file")
+    p.set_defaults(func=cmd_export)
+
+    p = sub.add_parser("libraries", help="list libraries with their sizes")
+    p.set_defaults(func=cmd_libraries, load=False)
+
+    p = sub.add_parser("find", help="search song titles across libraries")
+    p.add_argument("query")
+    p.add_argument("libraries", nargs="*", help="library names (default: all)")
+    p.add_argument("--limit", type=int, default=50)
+    p.set_defaults(func=cmd_find, load=False)
+
+    args = parser.parse_args(argv)
+    try:
+        args.db_path = library.resolve_library(args.library, create=True)
+        pm = database.load_all_playlists(db_path=args.db_path) if getattr(args, "load", True) else None
+        return args.func(pm, args)
+    except (OSError, ValueError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
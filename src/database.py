@@ -1,15 +1,110 @@
 import os
+import queue
 import sqlite3
-from typing import Dict
-from playlist import PlaylistManager
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from playlist import PlaylistManager, ChangeSet, POSITION_GAP
 from utils import normalize_path
 
 BASE_DIR = os.path.dirname(os.path.dirname(__file__))
 DB_PATH = os.path.join(BASE_DIR, "database", "playlist.db")
+PAGE_SIZE = 2000
+POOL_SIZE = 8
+# Bound parameters per IN (...) query, under SQLite's default variable limit
+LOOKUP_CHUNK = 500
+# Stored in PRAGMA user_version by init_db; bump it with every schema change
+SCHEMA_VERSION = 1
+# Rows in one save past which its connection gets a bigger page cache: bulk
+# inserts touch the tracks indexes everywhere and thrash the default 2 MB
+BULK_ROWS = 10000
+BULK_CACHE_KIB = 65536
 
-def init_db():
-    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
-    conn = sqlite3.connect(DB_PATH)
+def open_connection(db_path: Optional[str] = None, check_same_thread: bool = True,
+                    read_only: bool = False) -> sqlite3.Connection:
+    # Long-lived connection tuned for frequent small writes from one thread.
+    # A read-only one leaves the file exactly as it is, journal mode included.
+    if read_only:
+        conn = sqlite3.connect(_read_only_uri(db_path or DB_PATH), uri=True, check_same_thread=check_same_thread)
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA cache_size=-16000")
+        return conn
+    conn = sqlite3.connect(db_path or DB_PATH, check_same_thread=check_same_thread)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-16000")
+    return conn
+
+def _read_only_uri(db_path: str) -> str:
+    return Path(os.path.abspath(db_path)).as_uri() + "?mode=ro"
+
+def schema_version(db_path: Optional[str] = None) -> int:
+    # Read without touching the file; 0 for databases init_db has not seen
+    # since versions were introduced
+    conn = sqlite3.connect(_read_only_uri(db_path or DB_PATH), uri=True)
+    try:
+        return conn.execute("PRAGMA user_version").fetchone()[0]
+    finally:
+        conn.close()
+
+class ConnectionPool:
+    # Up to `size` tuned connections shared by worker threads. In WAL mode
+    # readers don't block each other or the persistence writer, so concurrent
+    # requests each borrow one instead of opening their own.
+    def __init__(self, size: int = POOL_SIZE, db_path: Optional[str] = None, read_only: bool = False):
+        self.size = size
+        self.db_path = db_path or DB_PATH
+        self.read_only = read_only
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._opened = 0
+        self._lock = threading.Lock()
+        self._closed = False
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        conn = self._acquire()
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            if self._closed:
+                conn.close()
+            else:
+                self._idle.put(conn)
+
+    def _acquire(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._closed:
+                raise sqlite3.ProgrammingError("connection pool is closed")
+            grow = self._opened < self.size
+            if grow:
+                self._opened += 1
+        if grow:
+            return open_connection(self.db_path, check_same_thread=False, read_only=self.read_only)
+        return self._idle.get()
+
+    def close(self):
+        # Connections still borrowed are closed when they come back
+        with self._lock:
+            self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+def init_db(db_path: Optional[str] = None):
+    db_path = db_path or DB_PATH
+    os.makedirs(os.path.dirname(db_path), exist_ok=True)
+    conn = sqlite3.connect(db_path)
     c = conn.cursor()
 
     c.execute("""
@@ -19,93 +114,617 @@ def init_db():
       )
     """)
 
+    c.execute("""
+      CREATE TABLE IF NOT EXISTS tracks (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        path TEXT UNIQUE NOT NULL,
+        title TEXT NOT NULL,
+        size INTEGER,
+        mtime REAL,
+        hash TEXT
+      )
+    """)
+    columns = {row[1] for row in c.execute("PRAGMA table_info(tracks)")}
+    if "added" not in columns:
+        # When the track entered the library; unknown for tracks from older versions
+        c.execute("ALTER TABLE tracks ADD COLUMN added REAL")
+    if "missing" not in columns:
+        # Set while the file is gone from disk, until it reappears or is relocated
+        c.execute("ALTER TABLE tracks ADD COLUMN missing INTEGER NOT NULL DEFAULT 0")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_tracks_hash ON tracks (hash)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_tracks_title ON tracks (title COLLATE NOCASE)")
+
+    columns = {row[1] for row in c.execute("PRAGMA table_info(songs)")}
+    if "filepath" in columns:
+        _migrate_song_tracks(c, "position" in columns)
     c.execute("""
       CREATE TABLE IF NOT EXISTS songs (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         playlist_id INTEGER NOT NULL,
+        track_id INTEGER NOT NULL,
+        position INTEGER NOT NULL DEFAULT 0,
+        FOREIGN KEY (playlist_id) REFERENCES playlists(id) ON DELETE CASCADE,
+        FOREIGN KEY (track_id) REFERENCES tracks(id)
+      )
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_songs_playlist_position ON songs (playlist_id, position)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_songs_track ON songs (track_id)")
+
+    # Full-text index over track titles, kept in sync by triggers
+    has_fts = c.execute("SELECT 1 FROM sqlite_master WHERE name = 'tracks_fts'").fetchone()
+    c.execute("""
+      CREATE VIRTUAL TABLE IF NOT EXISTS tracks_fts
+      USING fts5(title, content='tracks', content_rowid='id', tokenize='trigram')
+    """)
+    c.executescript("""
+      CREATE TRIGGER IF NOT EXISTS tracks_fts_ai AFTER INSERT ON tracks BEGIN
+        INSERT INTO tracks_fts (rowid, title) VALUES (new.id, new.title);
+      END;
+      CREATE TRIGGER IF NOT EXISTS tracks_fts_ad AFTER DELETE ON tracks BEGIN
+        INSERT INTO tracks_fts (tracks_fts, rowid, title) VALUES ('delete', old.id, old.title);
+      END;
+      CREATE TRIGGER IF NOT EXISTS tracks_fts_au AFTER UPDATE OF title ON tracks BEGIN
+        INSERT INTO tracks_fts (tracks_fts, rowid, title) VALUES ('delete', old.id, old.title);
+        INSERT INTO tracks_fts (rowid, title) VALUES (new.id, new.title);
+      END;
+    """)
+    if not has_fts:
+        c.execute("INSERT INTO tracks_fts (tracks_fts) VALUES ('rebuild')")
+
+    c.execute("""
+      CREATE TABLE IF NOT EXISTS scan_cache (
+        path TEXT PRIMARY KEY,
+        size INTEGER NOT NULL,
+        mtime REAL NOT NULL,
         title TEXT NOT NULL,
-        filepath TEXT NOT NULL,
+        artist TEXT,
+        album TEXT,
+        duration REAL
+      )
+    """)
+    columns = {row[1] for row in c.execute("PRAGMA table_info(scan_cache)")}
+    if "hash" not in columns:
+        c.execute("ALTER TABLE scan_cache ADD COLUMN hash TEXT")
+
+    # Rule text of smart playlists; their songs are evaluated, never stored
+    c.execute("""
+      CREATE TABLE IF NOT EXISTS smart_playlists (
+        playlist_id INTEGER PRIMARY KEY,
+        rules TEXT NOT NULL,
         FOREIGN KEY (playlist_id) REFERENCES playlists(id) ON DELETE CASCADE
       )
     """)
 
+    # Small key/value facts about the database, e.g. the journal checkpoint
+    c.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value)")
+
+    # Audio analysis results, valid while the file's size and mtime match
+    c.execute("""
+      CREATE TABLE IF NOT EXISTS analysis (
+        path TEXT PRIMARY KEY,
+        size INTEGER NOT NULL,
+        mtime REAL NOT NULL,
+        duration REAL,
+        loudness REAL,
+        gain REAL,
+        bpm REAL
+      )
+    """)
+
+    # Append-only log of what was played; play_stats rolls it up per track
+    # in the same transaction, so views never scan the log
+    c.execute("""
+      CREATE TABLE IF NOT EXISTS play_events (
+        id INTEGER PRIMARY KEY,
+        track_id INTEGER NOT NULL,
+        playlist_id INTEGER,
+        started REAL NOT NULL,
+        ended REAL NOT NULL,
+        skipped INTEGER NOT NULL DEFAULT 0
+      )
+    """)
+    c.execute("""
+      CREATE TABLE IF NOT EXISTS play_stats (
+        track_id INTEGER PRIMARY KEY,
+        plays INTEGER NOT NULL DEFAULT 0,
+        skips INTEGER NOT NULL DEFAULT 0,
+        last_played REAL
+      )
+    """)
+    # For top-N across libraries in SQL (library.py)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_play_stats_plays ON play_stats (plays)")
+
+    c.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
     conn.commit()
     conn.close()
 
-def _get_playlist_id(conn, name: str) -> int:
-    c = conn.cursor()
-    c.execute("SELECT id FROM playlists WHERE name = ?", (name,))
-    row = c.fetchone()
-    if row:
-        return row[0]
-    c.execute("INSERT INTO playlists (name) VALUES (?)", (name,))
-    conn.commit()
-    return c.lastrowid
+def _migrate_song_tracks(c, has_position: bool):
+    # Songs used to carry their own title and filepath: move those into one
+    # tracks row per normalized path and rebuild songs around track_id
+    position = "position" if has_position else f"id * {POSITION_GAP}"
+    rows = c.execute(f"SELECT id, playlist_id, title, filepath, {position} FROM songs ORDER BY id").fetchall()
+    track_ids: Dict[str, int] = {}
+    songs = []
+    for sid, pid, title, filepath, pos in rows:
+        path = normalize_path(filepath)
+        tid = track_ids.get(path)
+        if tid is None:
+            c.execute("INSERT OR IGNORE INTO tracks (path, title) VALUES (?, ?)", (path, title))
+            tid = c.execute("SELECT id FROM tracks WHERE path = ?", (path,)).fetchone()[0]
+            track_ids[path] = tid
+        songs.append((sid, pid, tid, pos))
+    c.executescript("""
+      DROP TRIGGER IF EXISTS songs_fts_ai;
+      DROP TRIGGER IF EXISTS songs_fts_ad;
+      DROP TRIGGER IF EXISTS songs_fts_au;
+      DROP TABLE IF EXISTS songs_fts;
+      DROP INDEX IF EXISTS idx_songs_title;
+      DROP INDEX IF EXISTS idx_songs_playlist_position;
+      DROP TABLE songs;
+    """)
+    c.execute("""
+      CREATE TABLE songs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        playlist_id INTEGER NOT NULL,
+        track_id INTEGER NOT NULL,
+        position INTEGER NOT NULL DEFAULT 0,
+        FOREIGN KEY (playlist_id) REFERENCES playlists(id) ON DELETE CASCADE,
+        FOREIGN KEY (track_id) REFERENCES tracks(id)
+      )
+    """)
+    c.executemany("INSERT INTO songs (id, playlist_id, track_id, position) VALUES (?, ?, ?, ?)", songs)
 
-def save_all_playlists(pm: PlaylistManager):
-    conn = sqlite3.connect(DB_PATH)
+def apply_changes(conn, changes: ChangeSet):
     c = conn.cursor()
+    if len(changes.track_inserts) + len(changes.inserts) < BULK_ROWS:
+        _apply_changes(c, changes)
+        return
+    cache = c.execute("PRAGMA cache_size").fetchone()[0]
+    c.execute(f"PRAGMA cache_size = -{BULK_CACHE_KIB}")
+    try:
+        _apply_changes(c, changes)
+    finally:
+        c.execute(f"PRAGMA cache_size = {cache}")
+
+def _apply_changes(c, changes: ChangeSet):
+    if changes.track_inserts:
+        # Staged and copied in one statement: the tracks_fts trigger is several
+        # times cheaper per row inside a single INSERT ... SELECT than once per
+        # executemany row, which matters for bulk imports
+        c.execute(
+            "CREATE TEMP TABLE IF NOT EXISTS new_tracks "
+            "(id INTEGER, path TEXT, title TEXT, size INTEGER, mtime REAL, hash TEXT)"
+        )
+        c.executemany("INSERT INTO temp.new_tracks VALUES (?, ?, ?, ?, ?, ?)", changes.track_inserts)
+        c.execute(
+            "INSERT INTO tracks (id, path, title, size, mtime, hash, added) "
+            "SELECT id, path, title, size, mtime, hash, CAST(strftime('%s', 'now') AS REAL) FROM temp.new_tracks"
+        )
+        c.execute("DELETE FROM temp.new_tracks")
+    if changes.track_updates:
+        c.executemany(
+            "UPDATE tracks SET path = ?, size = ?, mtime = ?, hash = ? WHERE id = ?", changes.track_updates
+        )
+    if changes.track_missing:
+        c.executemany("UPDATE tracks SET missing = ? WHERE id = ?", changes.track_missing)
+    for op in changes.playlist_ops:
+        if op[0] == "create":
+            c.execute("INSERT INTO playlists (id, name) VALUES (?, ?)", (op[1], op[2]))
+            if op[3] is not None:
+                c.execute("INSERT INTO smart_playlists (playlist_id, rules) VALUES (?, ?)", (op[1], op[3]))
+        elif op[0] == "rename":
+            c.execute("UPDATE playlists SET name = ? WHERE id = ?", (op[2], op[1]))
+        elif op[0] == "drop":
+            c.execute("DELETE FROM songs WHERE playlist_id = ?", (op[1],))
+            c.execute("DELETE FROM smart_playlists WHERE playlist_id = ?", (op[1],))
+            c.execute("DELETE FROM playlists WHERE id = ?", (op[1],))
+    if changes.deletes:
+        c.executemany("DELETE FROM songs WHERE id = ?", [(sid,) for sid in changes.deletes])
+    if changes.moves:
+        c.executemany("UPDATE songs SET position = ? WHERE id = ?", changes.moves)
+    if changes.inserts:
+        c.executemany(
+            "INSERT INTO songs (id, playlist_id, track_id, position) VALUES (?, ?, ?, ?)", changes.inserts
+        )
+    if changes.seq:
+        _set_journal_seq(c, changes.seq)
+
+def _set_journal_seq(c, seq: int):
+    # Mutations up to seq are in the database; the journal only needs what follows
+    c.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('journal_seq', ?)", (seq,))
 
-    # Get existing playlists from DB
-    c.execute("SELECT name FROM playlists")
-    existing_names = {row[0] for row in c.fetchall()}
+def _release_paths(c, tracks: List[Tuple[int, str]]):
+    # A stored row holding a catalog track's path under another id would make
+    # the upsert fail on the unique path. The catalog's id wins: the old row's
+    # play history moves over to it and the row is dropped (songs are rewritten).
+    c.execute("CREATE TEMP TABLE IF NOT EXISTS snapshot_tracks (id INTEGER, path TEXT)")
+    c.execute("DELETE FROM temp.snapshot_tracks")
+    c.executemany("INSERT INTO temp.snapshot_tracks VALUES (?, ?)", tracks)
+    clashes = c.execute(
+        "SELECT t.id, s.id FROM tracks t JOIN temp.snapshot_tracks s ON s.path = t.path WHERE t.id != s.id"
+    ).fetchall()
+    c.execute("DELETE FROM temp.snapshot_tracks")
+    for old, new in clashes:
+        c.execute("UPDATE play_events SET track_id = ? WHERE track_id = ?", (new, old))
+        c.execute(
+            "INSERT INTO play_stats (track_id, plays, skips, last_played) "
+            "SELECT ?, plays, skips, last_played FROM play_stats WHERE track_id = ? "
+            "ON CONFLICT (track_id) DO UPDATE SET plays = plays + excluded.plays, "
+            "skips = skips + excluded.skips, last_played = MAX(last_played, excluded.last_played)",
+            (new, old)
+        )
+        c.execute("DELETE FROM play_stats WHERE track_id = ?", (old,))
+        c.execute("DELETE FROM tracks WHERE id = ?", (old,))
 
-    current_names = set(pm.get_all_names())
+def load_journal_seq(db_path: Optional[str] = None) -> int:
+    conn = sqlite3.connect(db_path or DB_PATH)
+    try:
+        row = conn.execute("SELECT value FROM meta WHERE key = 'journal_seq'").fetchone()
+        return int(row[0]) if row else 0
+    finally:
+        conn.close()
+
+def save_changes(pm: PlaylistManager, db_path: Optional[str] = None):
+    # Flush only what changed since the last save, in a single transaction
+    changes = pm.collect_changes()
+    if changes.is_empty():
+        return
+    conn = sqlite3.connect(db_path or DB_PATH)
+    try:
+        with conn:
+            apply_changes(conn, changes)
+    finally:
+        conn.close()
 
-    # ✅ Delete playlists that no longer exist in memory
-    for name in existing_names - current_names:
-        c.execute("DELETE FROM playlists WHERE name = ?", (name,))
+def save_all_playlists(pm: PlaylistManager, db_path: Optional[str] = None):
+    # Full snapshot: rewrites every playlist and song, discarding pending changes.
+    # Tracks are upserted rather than rewritten so the catalog survives.
+    static = [pl for pl in pm.playlists.values() if pl.rules is None]
+    for pl in static:
+        pl.ensure_loaded()
+    pm.collect_changes()
+    conn = sqlite3.connect(db_path or DB_PATH)
+    try:
+        with conn:
+            c = conn.cursor()
+            _release_paths(c, [(t.id, t.path) for t in pm.catalog])
+            # An upsert, not INSERT OR REPLACE: REPLACE deletes without firing the
+            # tracks_fts delete trigger and would leave stale index entries
+            c.executemany(
+                "INSERT INTO tracks (id, path, title, size, mtime, hash, added) "
+                "VALUES (?, ?, ?, ?, ?, ?, CAST(strftime('%s', 'now') AS REAL)) "
+                "ON CONFLICT (id) DO UPDATE SET path = excluded.path, title = excluded.title, "
+                "size = excluded.size, mtime = excluded.mtime, hash = excluded.hash",
+                [(t.id, t.path, t.title, t.size, t.mtime, t.hash) for t in pm.catalog]
+            )
+            c.execute("UPDATE tracks SET missing = 0 WHERE missing")
+            c.executemany("UPDATE tracks SET missing = 1 WHERE id = ?", [(tid,) for tid in pm.catalog.missing])
+            c.execute("DELETE FROM songs")
+            c.execute("DELETE FROM smart_playlists")
+            c.execute("DELETE FROM playlists")
+            c.executemany(
+                "INSERT INTO playlists (id, name) VALUES (?, ?)",
+                [(pl.id, pl.name) for pl in pm.playlists.values()]
+            )
+            c.executemany(
+                "INSERT INTO smart_playlists (playlist_id, rules) VALUES (?, ?)",
+                [(pl.id, pl.rules) for pl in pm.playlists.values() if pl.rules is not None]
+            )
+            rows = []
+            for pl in static:
+                cur = pl.head
+                while cur:
+                    rows.append((cur.id, pl.id, cur.track.id, cur.position))
+                    cur = cur.next
+            c.executemany("INSERT INTO songs (id, playlist_id, track_id, position) VALUES (?, ?, ?, ?)", rows)
+            _set_journal_seq(c, pm.tracker.seq)
+    finally:
+        conn.close()
 
-    # Ensure all playlists exist in table and get ids
-    name_to_id: Dict[str, int] = {}
-    for name in pm.get_all_names():
-        pid = _get_playlist_id(conn, name)
-        name_to_id[name] = pid
+_SONG_PAGE = """
+  SELECT s.id, s.position, t.id, t.path, t.title, t.size, t.mtime, t.hash
+  FROM songs s JOIN tracks t ON t.id = s.track_id
+  WHERE s.playlist_id = ? {} ORDER BY s.position, s.id LIMIT ?
+"""
 
-    # Clear songs for each playlist and re-insert
-    for name, pl in pm.playlists.items():
-        pid = name_to_id[name]
-        c.execute("DELETE FROM songs WHERE playlist_id = ?", (pid,))
-        for item in pl.to_list():
+def iter_song_pages(playlist_id: int, page_size: int = PAGE_SIZE, db_path: Optional[str] = None) -> Iterator[List[Tuple]]:
+    # Keyset pagination over idx_songs_playlist_position: each page is one range scan
+    conn = sqlite3.connect(db_path or DB_PATH)
+    try:
+        c = conn.cursor()
+        c.execute(_SONG_PAGE.format(""), (playlist_id, page_size))
+        rows = c.fetchall()
+        while rows:
+            yield rows
+            if len(rows) < page_size:
+                break
+            last_id, last_pos = rows[-1][:2]
             c.execute(
-                "INSERT INTO songs (playlist_id, title, filepath) VALUES (?, ?, ?)",
-                (pid, item["title"], normalize_path(item["filepath"]))
+                _SONG_PAGE.format("AND (s.position, s.id) > (?, ?)"),
+                (playlist_id, last_pos, last_id, page_size)
             )
+            rows = c.fetchall()
+    finally:
+        conn.close()
 
-    conn.commit()
-    conn.close()
+_SMART_PAGE = """
+  SELECT NULL, 0, t.id, t.path, t.title, t.size, t.mtime, t.hash
+  FROM tracks t LEFT JOIN analysis a ON a.path = t.path
+  WHERE t.id > ? AND EXISTS (SELECT 1 FROM songs s WHERE s.track_id = t.id) AND ({})
+  ORDER BY t.id LIMIT ?
+"""
+
+def iter_smart_pages(where: str, params: List, page_size: int = PAGE_SIZE,
+                     db_path: Optional[str] = None) -> Iterator[List[Tuple]]:
+    # Tracks referenced by any playlist that match a compiled smart playlist
+    # condition over tracks t and analysis a, as song loader pages in track id order
+    sql = _SMART_PAGE.format(where or "1")
+    conn = sqlite3.connect(db_path or DB_PATH)
+    try:
+        c = conn.cursor()
+        last_id = 0
+        while True:
+            c.execute(sql, (last_id, *params, page_size))
+            rows = c.fetchall()
+            if rows:
+                yield rows
+            if len(rows) < page_size:
+                break
+            last_id = rows[-1][2]
+    finally:
+        conn.close()
+
+def track_added_times(track_ids: List[int], db_path: Optional[str] = None) -> Dict[int, Optional[float]]:
+    conn = sqlite3.connect(db_path or DB_PATH)
+    try:
+        times: Dict[int, Optional[float]] = {}
+        for i in range(0, len(track_ids), LOOKUP_CHUNK):
+            chunk = track_ids[i:i + LOOKUP_CHUNK]
+            times.update(conn.execute(
+                f"SELECT id, added FROM tracks WHERE id IN ({','.join('?' * len(chunk))})", chunk
+            ))
+        return times
+    finally:
+        conn.close()
+
+def track_references(track_ids: List[int], db_path: Optional[str] = None) -> List[Tuple[int, int]]:
+    # (track id, playlist id) of every stored song referring to one of the tracks
+    conn = sqlite3.connect(db_path or DB_PATH)
+    try:
+        rows: List[Tuple[int, int]] = []
+        for i in range(0, len(track_ids), LOOKUP_CHUNK):
+            chunk = track_ids[i:i + LOOKUP_CHUNK]
+            rows.extend(conn.execute(
+                f"SELECT track_id, playlist_id FROM songs WHERE track_id IN ({','.join('?' * len(chunk))})", chunk
+            ))
+        return rows
+    finally:
+        conn.close()
+
+def _prefix_range(root: str) -> Tuple[str, str]:
+    # Bounds of every path under root, for a range scan over a path index
+    prefix = os.path.join(root, "")
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+def tracks_under(root: str, db_path: Optional[str] = None) -> Dict[str, Tuple]:
+    # path -> (id, size, mtime, hash, missing) for stored tracks below root
+    conn = sqlite3.connect(db_path or DB_PATH)
+    try:
+        return {row[0]: row[1:] for row in conn.execute(
+            "SELECT path, id, size, mtime, hash, missing FROM tracks WHERE path >= ? AND path < ?",
+            _prefix_range(root)
+        )}
+    finally:
+        conn.close()
+
+def tracks_at(paths: List[str], db_path: Optional[str] = None) -> Dict[str, Tuple]:
+    # Same rows as tracks_under, for exact paths
+    conn = sqlite3.connect(db_path or DB_PATH)
+    try:
+        found: Dict[str, Tuple] = {}
+        for i in range(0, len(paths), LOOKUP_CHUNK):
+            chunk = paths[i:i + LOOKUP_CHUNK]
+            found.update((row[0], row[1:]) for row in conn.execute(
+                "SELECT path, id, size, mtime, hash, missing FROM tracks "
+                f"WHERE path IN ({','.join('?' * len(chunk))})", chunk
+            ))
+        return found
+    finally:
+        conn.close()
+
+def move_cached_paths(moves: List[Tuple[str, str]], db_path: Optional[str] = None):
+    # Scan and analysis results follow files that were moved, (old, new) pairs
+    if not moves:
+        return
+    conn = sqlite3.connect(db_path or DB_PATH)
+    try:
+        with conn:
+            pairs = [(new, old) for old, new in moves]
+            conn.executemany("UPDATE OR REPLACE scan_cache SET path = ? WHERE path = ?", pairs)
+            conn.executemany("UPDATE OR REPLACE analysis SET path = ? WHERE path = ?", pairs)
+    finally:
+        conn.close()
+
+def get_meta(key: str, default=None, db_path: Optional[str] = None):
+    conn = sqlite3.connect(db_path or DB_PATH)
+    try:
+        row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+    finally:
+        conn.close()
+
+def set_meta(key: str, value, db_path: Optional[str] = None):
+    conn = sqlite3.connect(db_path or DB_PATH)
+    try:
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+    finally:
+        conn.close()
+
+def load_scan_cache(root: str, db_path: Optional[str] = None) -> Dict[str, Tuple]:
+    # Paths under root share its prefix, so this is a primary key range scan
+    conn = sqlite3.connect(db_path or DB_PATH)
+    try:
+        c = conn.cursor()
+        c.execute(
+            "SELECT path, size, mtime, title, artist, album, duration, hash FROM scan_cache "
+            "WHERE path >= ? AND path < ?",
+            _prefix_range(root)
+        )
+        return {row[0]: row for row in c.fetchall()}
+    finally:
+        conn.close()
 
-def load_all_playlists() -> PlaylistManager:
-    init_db()
+def update_scan_cache(fresh: List[Tuple], removed: List[str], db_path: Optional[str] = None):
+    # fresh rows are (path, size, mtime, title, artist, album, duration, hash)
+    if not fresh and not removed:
+        return
+    conn = sqlite3.connect(db_path or DB_PATH)
+    try:
+        with conn:
+            c = conn.cursor()
+            c.executemany("DELETE FROM scan_cache WHERE path = ?", [(p,) for p in removed])
+            c.executemany(
+                "INSERT OR REPLACE INTO scan_cache (path, size, mtime, title, artist, album, duration, hash) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                fresh
+            )
+    finally:
+        conn.close()
+
+def referenced_track_paths(db_path: Optional[str] = None) -> List[str]:
+    conn = sqlite3.connect(db_path or DB_PATH)
+    try:
+        return [row[0] for row in conn.execute(
+            "SELECT path FROM tracks t WHERE EXISTS (SELECT 1 FROM songs s WHERE s.track_id = t.id)"
+        )]
+    finally:
+        conn.close()
+
+def load_analysis(db_path: Optional[str] = None) -> Dict[str, Tuple]:
+    # path -> (size, mtime, duration, loudness, gain, bpm)
+    conn = sqlite3.connect(db_path or DB_PATH)
+    try:
+        return {row[0]: row[1:] for row in conn.execute(
+            "SELECT path, size, mtime, duration, loudness, gain, bpm FROM analysis"
+        )}
+    finally:
+        conn.close()
+
+def save_analysis(rows: List[Tuple], db_path: Optional[str] = None):
+    # rows are (path, size, mtime, duration, loudness, gain, bpm)
+    if not rows:
+        return
+    conn = sqlite3.connect(db_path or DB_PATH)
+    try:
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO analysis (path, size, mtime, duration, loudness, gain, bpm) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+    finally:
+        conn.close()
+
+def load_play_stats(db_path: Optional[str] = None) -> List[Tuple]:
+    # (track_id, path, title, plays, skips, last_played) for every track played
+    conn = sqlite3.connect(db_path or DB_PATH)
+    try:
+        return conn.execute(
+            "SELECT s.track_id, t.path, t.title, s.plays, s.skips, s.last_played "
+            "FROM play_stats s JOIN tracks t ON t.id = s.track_id"
+        ).fetchall()
+    finally:
+        conn.close()
+
+def save_play_events(conn: sqlite3.Connection, events: List[Tuple], rollups: List[Tuple]):
+    # events are (track_id, playlist_id, started, ended, skipped); rollups are
+    # (track_id, plays, skips, last_played) increments for the same events.
+    # The caller owns the transaction.
+    conn.executemany(
+        "INSERT INTO play_events (track_id, playlist_id, started, ended, skipped) VALUES (?, ?, ?, ?, ?)",
+        events
+    )
+    conn.executemany(
+        "INSERT INTO play_stats (track_id, plays, skips, last_played) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT (track_id) DO UPDATE SET plays = plays + excluded.plays, skips = skips + excluded.skips, "
+        "last_played = max(coalesce(last_played, 0), excluded.last_played)",
+        rollups
+    )
+
+def track_lookups(db_path: Optional[str] = None) -> Tuple[Callable[[str], Optional[Tuple]], Callable[[List[str]], Iterator[Tuple]]]:
+    # Lets the catalog find stored tracks by normalized path without loading them all.
+    # Only used from the Tk thread; the connection lives as long as the catalog.
+    conn = sqlite3.connect(db_path or DB_PATH, check_same_thread=False)
+
+    def lookup(path: str) -> Optional[Tuple]:
+        return conn.execute(
+            "SELECT id, title, size, mtime, hash FROM tracks WHERE path = ?", (path,)
+        ).fetchone()
+
+    def lookup_many(paths: List[str]) -> Iterator[Tuple]:
+        for i in range(0, len(paths), LOOKUP_CHUNK):
+            chunk = paths[i:i + LOOKUP_CHUNK]
+            yield from conn.execute(
+                "SELECT id, path, title, size, mtime, hash FROM tracks "
+                f"WHERE path IN ({','.join('?' * len(chunk))})", chunk
+            )
+    return lookup, lookup_many
+
+def load_all_playlists(lazy: bool = True, db_path: Optional[str] = None) -> PlaylistManager:
+    # Playlist names and song counts load eagerly; songs are paged in on first use
+    db_path = db_path or DB_PATH
+    init_db(db_path)
     pm = PlaylistManager()
-    conn = sqlite3.connect(DB_PATH)
+    conn = sqlite3.connect(db_path)
     c = conn.cursor()
 
-    c.execute("SELECT id, name FROM playlists ORDER BY name ASC")
+    c.execute("SELECT COALESCE(MAX(id), 0) FROM playlists")
+    max_pid = c.fetchone()[0]
+    c.execute("SELECT COALESCE(MAX(id), 0) FROM songs")
+    max_sid = c.fetchone()[0]
+    c.execute("SELECT COALESCE(MAX(id), 0) FROM tracks")
+    max_tid = c.fetchone()[0]
+    pm.tracker.reserve_ids(max_pid, max_sid, max_tid)
+    # Sequence numbers continue from the last saved mutation
+    c.execute("SELECT value FROM meta WHERE key = 'journal_seq'")
+    row = c.fetchone()
+    pm.tracker.seq = int(row[0]) if row else 0
+    pm.catalog.lookup, pm.catalog.lookup_many = track_lookups(db_path)
+    pm.catalog.missing = {row[0] for row in c.execute("SELECT id FROM tracks WHERE missing")}
+
+    c.execute("""
+      SELECT p.id, p.name, COUNT(s.id), sp.rules
+      FROM playlists p
+        LEFT JOIN songs s ON s.playlist_id = p.id
+        LEFT JOIN smart_playlists sp ON sp.playlist_id = p.id
+      GROUP BY p.id
+      ORDER BY p.name ASC
+    """)
     rows = c.fetchall()
+    conn.close()
 
     # If no playlists, create a default one
     if not rows:
         pm.create_playlist("My Playlist")
-        conn.close()
         return pm
 
-    id_to_name = {}
-    for pid, name in rows:
-        pm.create_playlist(name)
-        id_to_name[pid] = name
-
-    # Load songs per playlist
-    c.execute("SELECT playlist_id, title, filepath FROM songs ORDER BY id ASC")
-    for pid, title, path in c.fetchall():
-        name = id_to_name.get(pid)
-        if name and name in pm.playlists:
-            pm.playlists[name].add_song(title, path)
+    for pid, name, count, rules in rows:
+        if rules is not None:
+            # Imported here: smart.py builds on this module
+            from smart import SmartPlaylist
+            smart = SmartPlaylist(name, rules)
+            smart.db_path = db_path
+            pm.restore_playlist(pid, name, smart)
+            continue
+        pl = pm.restore_playlist(pid, name)
+        pl.set_loader(count, lambda pid=pid: iter_song_pages(pid, db_path=db_path))
+        if not lazy:
+            pl.ensure_loaded()
 
     # Set current playlist to first alphabetically
     names = pm.get_all_names()
     if names:
         pm.switch_playlist(names[0])
 
-    conn.close()
     return pm
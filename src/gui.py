@@ -1,67 +1,116 @@
 import os
-import cv2
+import queue
+import threading
+import time
+from typing import Optional
 import ttkbootstrap as tb
 from ttkbootstrap.constants import *
 import tkinter as tk
 from tkinter import filedialog, messagebox, simpledialog
-from PIL import Image, ImageTk
-from playlist import PlaylistManager
+import database
+from history import PlayHistory
+from journal import UndoHistory
+from smart import ANALYSIS_FIELDS, SmartEngine, SmartPlaylist
+from playlist import SORT_KEYS, PlaylistManager
+from playlist_io import FORMATS, export_file, import_file
 from player import MusicPlayer
+from scanner import LibraryScanner, import_tracks
+from search import SearchIndex
+from songlist import VirtualSongList
+from traversal import MODES, PLAY_MODE_KEY, SEQUENTIAL
+from watcher import LibraryWatcher, apply_batch
 from utils import is_audio_file, pretty_title
 
 BASE_DIR = os.path.dirname(os.path.dirname(__file__))
 SONGS_DIR = os.path.join(BASE_DIR, "songs")
 ASSETS_DIR = os.path.join(BASE_DIR, "assets")
-
-
-class VideoBackground:
-    def __init__(self, canvas, video_path):
-        self.canvas = canvas
-        self.cap = cv2.VideoCapture(video_path)
-        self.image_id = None
-        self.update_frame()
-
-    def update_frame(self):
-        ret, frame = self.cap.read()
-        if ret:
-            frame = cv2.resize(frame, (self.canvas.winfo_screenwidth(), self.canvas.winfo_screenheight()))
-            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            img = ImageTk.PhotoImage(Image.fromarray(frame))
-            if self.image_id is None:
-                self.image_id = self.canvas.create_image(0, 0, anchor="nw", image=img)
-            else:
-                self.canvas.itemconfig(self.image_id, image=img)
-            self.canvas.image = img
-        else:
-            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
-        self.canvas.after(33, self.update_frame)
+# "added within" rules drift as time passes; re-evaluated this often
+SMART_REFRESH_MS = 60 * 60 * 1000
+WATCH_POLL_MS = 500
+# The video background and the songs/ watcher start this long after the
+# window is interactive; OpenCV is only imported then
+DEFERRED_START_MS = 300
+# Sort menu entries: label -> playlist.SORT_KEYS or history.SORT_FIELDS name
+SORT_CHOICES = (("Title", "title"), ("Path", "path"), ("Most played", "plays"), ("Recently played", "last_played"))
+# Songs listed per view in the play history dialog
+HISTORY_VIEW_SIZE = 10
+# meta key of the playlist that files appearing in songs/ are added to
+WATCH_TARGET_KEY = "watch_playlist_id"
 
 
 class GUIManager:
-    def __init__(self, root: tk.Tk, pm: PlaylistManager, player: MusicPlayer, db_save_callback):
+    def __init__(self, root: tk.Tk, pm: PlaylistManager, player: MusicPlayer, db_save_callback,
+                 history: UndoHistory = None, smart: SmartEngine = None, analysis=None,
+                 play_history: PlayHistory = None, startup=None, db_path: Optional[str] = None):
         self.root = root
         self.pm = pm
+        self.db_path = db_path or database.DB_PATH
+        self.history = history or UndoHistory(pm)
         self.player = player
         self.db_save = db_save_callback
+        self.scanner = LibraryScanner(db_path=self.db_path)
+        self.search_index = SearchIndex(db_path=self.db_path)
+        self._search_hits = []
+        self._search_job = None
+        self._scan_thread = None
+        # Created on the first "Analyze"; main.py loads the cache off the Tk thread
+        self.analyzer = None
+        if analysis is None:
+            from analysis import AnalysisCache
+            analysis = AnalysisCache(self.db_path)
+            analysis.reload()
+        self.analysis = analysis
+        from analysis import PlaylistDurations
+        self.durations = PlaylistDurations(pm, analysis)
+        if play_history is None:
+            play_history = PlayHistory(self.db_path)
+            play_history.reload()
+        # What was played, fed from the player's start/end events
+        self.play_history = play_history
+        self.startup = startup
+        self.player.gain_for = self.analysis.gain
+        self.smart = smart or SmartEngine(pm, db_path=self.db_path)
+        self.smart.analysis = self.analysis
+        # songs/ is followed in the background; new files go to the playlist
+        # it was last imported into
+        self.watcher = LibraryWatcher(SONGS_DIR, db_path=self.db_path)
+        self._analysis_thread = None
 
         style = tb.Style("darkly")
         self.root = style.master
         self.root.title("Music Playlist Manager")
         self.root.state("zoomed")
         self.root.bind("<Escape>", lambda e: self.on_exit())
+        self.root.bind("<Control-z>", lambda e: self._undo())
+        self.root.bind("<Control-y>", lambda e: self._redo())
+        self.root.bind("<Control-Z>", lambda e: self._redo())
 
         # Canvas for background + widgets
         self.canvas = tk.Canvas(self.root, highlightthickness=0)
         self.canvas.place(x=0, y=0, relwidth=1, relheight=1)
 
-        # Video background drawn on canvas
-        video_path = os.path.join(ASSETS_DIR, "background.mp4")
-        self.video_bg = VideoBackground(self.canvas, video_path)
+        # Video background drawn on canvas, started once the window is up
+        self.video_bg = None
+        self.root.bind("<F12>", lambda e: self.status.config(text=self._metrics_text()))
 
         # Build layout
         self._build_layout()
         self._refresh_sidebar()
         self._refresh_song_list()
+        self.root.after(100, self._poll_player)
+        self.root.after(SMART_REFRESH_MS, self._refresh_smart_by_age)
+        self.root.after(DEFERRED_START_MS, self._start_deferred)
+
+    def _start_deferred(self):
+        from video import VideoBackground
+        self.video_bg = VideoBackground(self.canvas, os.path.join(ASSETS_DIR, "background.mp4"))
+        self.watcher.start()
+        self.root.after(WATCH_POLL_MS, self._poll_watcher)
+
+    def _metrics_text(self) -> str:
+        video = self.video_bg.metrics.as_dict() if self.video_bg else None
+        startup = self.startup.as_dict() if self.startup else None
+        return f"Startup ms: {startup}  Video: {video}  Audio: {self.player.metrics.as_dict()}"
 
     def _build_layout(self):
         # Top bar
@@ -87,8 +136,11 @@ class GUIManager:
         self.playlist_listbox.pack(fill="y", padx=4, pady=4)
         self.playlist_listbox.bind("<<ListboxSelect>>", lambda e: self._on_switch_playlist())
         tb.Button(self.sidebar, text="+ New", bootstyle=SUCCESS, command=self._new_playlist).pack(fill="x", pady=3)
+        tb.Button(self.sidebar, text="+ Smart", bootstyle=SUCCESS, command=self._new_smart_playlist).pack(fill="x", pady=3)
         tb.Button(self.sidebar, text="Rename", bootstyle=SECONDARY, command=self._rename_playlist).pack(fill="x", pady=3)
         tb.Button(self.sidebar, text="Delete", bootstyle=WARNING, command=self._delete_playlist).pack(fill="x", pady=3)
+        tb.Button(self.sidebar, text="Import File...", bootstyle=INFO, command=self._import_playlist_file).pack(fill="x", pady=3)
+        tb.Button(self.sidebar, text="Export...", bootstyle=INFO, command=self._export_playlist_file).pack(fill="x", pady=3)
 
         # Content
         self.content = tb.Frame(self.main_area, padding=8)
@@ -96,22 +148,40 @@ class GUIManager:
         self.current_label = tb.Label(self.content, text=self._current_name() or "No playlist", font=("Segoe UI", 18))
         self.current_label.pack(anchor="w", pady=(0, 8))
 
-        # Song list
-        list_frame = tb.Frame(self.content)
-        list_frame.pack(fill="both", expand=True)
-        self.song_listbox = tk.Listbox(list_frame, font=("Segoe UI", 12))
-        self.song_listbox.pack(side="left", fill="both", expand=True)
-        scrollbar = tb.Scrollbar(list_frame, orient="vertical", command=self.song_listbox.yview)
-        scrollbar.pack(side="right", fill="y")
-        self.song_listbox.config(yscrollcommand=scrollbar.set)
+        # Search across all playlists as you type
+        self.search_var = tk.StringVar()
+        self.search_entry = tb.Entry(self.content, textvariable=self.search_var)
+        self.search_entry.pack(fill="x", pady=(0, 4))
+        self.search_var.trace_add("write", lambda *_: self._schedule_search())
+        self.search_entry.bind("<Escape>", lambda e: self.search_var.set(""))
+        self.search_results = tk.Listbox(self.content, height=6, font=("Segoe UI", 11))
+        self.search_results.bind("<<ListboxSelect>>", lambda e: self._open_search_hit())
+
+        # Song list: virtualized, only the visible rows are materialized
+        self.song_view = VirtualSongList(self.content, font=("Segoe UI", 12), label=self._song_label)
+        self.song_view.pack(fill="both", expand=True)
 
         # Controls
         controls = tb.Frame(self.content, padding=8)
         controls.pack(fill="x")
         tb.Button(controls, text="Import from songs/", bootstyle=SUCCESS, command=self._import_all_from_songs).pack(side="left", padx=5)
+        tb.Button(controls, text="Analyze", bootstyle=INFO, command=self._analyze_library).pack(side="left", padx=5)
         tb.Button(controls, text="Add Song", bootstyle=PRIMARY, command=self._add_song).pack(side="left", padx=5)
         tb.Button(controls, text="Delete Song", bootstyle=WARNING, command=self._delete_song).pack(side="left", padx=5)
+        tb.Button(controls, text="Copy To...", bootstyle=SECONDARY, command=lambda: self._transfer_songs(False)).pack(side="left", padx=5)
+        tb.Button(controls, text="Move To...", bootstyle=SECONDARY, command=lambda: self._transfer_songs(True)).pack(side="left", padx=5)
+        tb.Button(controls, text="Dedupe", bootstyle=SECONDARY, command=self._dedupe_songs).pack(side="left", padx=5)
+        sort_button = tb.Menubutton(controls, text="Sort", bootstyle=SECONDARY)
+        sort_menu = tk.Menu(sort_button, tearoff=0)
+        for label, field in SORT_CHOICES:
+            sort_menu.add_command(label=label, command=lambda f=field: self._sort_songs(f))
+        sort_button["menu"] = sort_menu
+        sort_button.pack(side="left", padx=5)
         tb.Button(controls, text="Search", bootstyle=INFO, command=self._search_song).pack(side="left", padx=5)
+        tb.Button(controls, text="Move Up", bootstyle=SECONDARY, command=lambda: self._move_song(-1)).pack(side="left", padx=5)
+        tb.Button(controls, text="Move Down", bootstyle=SECONDARY, command=lambda: self._move_song(1)).pack(side="left", padx=5)
+        tb.Button(controls, text="Undo", bootstyle=SECONDARY, command=self._undo).pack(side="left", padx=5)
+        tb.Button(controls, text="Redo", bootstyle=SECONDARY, command=self._redo).pack(side="left", padx=5)
 
         # Playback
         playback = tb.Frame(self.content, padding=8)
@@ -122,6 +192,12 @@ class GUIManager:
         tb.Button(playback, text="Stop", bootstyle=DANGER, command=self.player.stop).pack(side="left", padx=5)
         tb.Button(playback, text="◀ Prev", bootstyle=SECONDARY, command=self._prev_song).pack(side="left", padx=5)
         tb.Button(playback, text="Next ▶", bootstyle=SECONDARY, command=self._next_song).pack(side="left", padx=5)
+        tb.Button(playback, text="History", bootstyle=INFO, command=self._show_play_history).pack(side="left", padx=5)
+        mode = database.get_meta(PLAY_MODE_KEY, SEQUENTIAL, self.db_path)
+        self.play_mode = tk.StringVar(value=mode if mode in MODES else SEQUENTIAL)
+        mode_box = tb.Combobox(playback, textvariable=self.play_mode, values=MODES, state="readonly", width=11)
+        mode_box.pack(side="left", padx=5)
+        mode_box.bind("<<ComboboxSelected>>", lambda e: self._set_play_mode())
 
         # Status
         self.status = tb.Label(self.root, text="Ready", anchor="w")
@@ -152,6 +228,32 @@ class GUIManager:
         else:
             messagebox.showerror("Error", "Invalid or duplicate playlist name.")
 
+    def _new_smart_playlist(self):
+        name = simpledialog.askstring("New Smart Playlist", "Enter playlist name:")
+        if not name:
+            return
+        rules = simpledialog.askstring(
+            "New Smart Playlist",
+            "Rules, joined by ';' or 'and', e.g.\n"
+            "title contains love; path under /music/jazz; duration < 5m; added < 30d\n\n"
+            "Fields: title, path, duration, bpm, loudness, size, added\n"
+            "Ops: contains, under, ~ (regex), =, !=, <, <=, >, >="
+        )
+        if not rules:
+            return
+        try:
+            pl = SmartPlaylist(name, rules)
+        except ValueError as e:
+            messagebox.showerror("Error", f"Invalid rules: {e}")
+            return
+        if self.pm.add_playlist(pl):
+            self.db_save(self.pm)
+            self.pm.switch_playlist(pl.name)
+            self._refresh_sidebar()
+            self._refresh_song_list()
+        else:
+            messagebox.showerror("Error", "Invalid or duplicate playlist name.")
+
     def _rename_playlist(self):
         old = self._current_name()
         if not old:
@@ -183,6 +285,44 @@ class GUIManager:
         else:
             messagebox.showerror("Error", "Could not delete playlist.")
 
+    def _import_playlist_file(self):
+        patterns = " ".join("*" + ext for ext in sorted(FORMATS))
+        path = filedialog.askopenfilename(filetypes=[("Playlists", patterns)])
+        if not path:
+            return
+        self.status.config(text=f"Importing {os.path.basename(path)} ...")
+        self.root.update_idletasks()
+        try:
+            with self.history.group():
+                counts = import_file(self.pm, path)
+        except (OSError, ValueError) as e:
+            messagebox.showerror("Import", f"Could not import playlist: {e}")
+            self.status.config(text="Ready")
+            return
+        self.db_save(self.pm)
+        self._refresh_sidebar()
+        self._refresh_song_list()
+        summary = ", ".join(f"{n} into '{name}'" for name, n in counts.items()) or "nothing"
+        messagebox.showinfo("Import", f"Imported {summary}")
+
+    def _export_playlist_file(self):
+        name = self._current_name()
+        if not name:
+            messagebox.showinfo("Info", "No playlist selected.")
+            return
+        path = filedialog.asksaveasfilename(
+            initialfile=name + ".m3u8", defaultextension=".m3u8",
+            filetypes=[("M3U8", "*.m3u8"), ("M3U", "*.m3u"), ("PLS", "*.pls"), ("JSON lines", "*.jsonl")]
+        )
+        if not path:
+            return
+        try:
+            count = export_file(self.pm, path, [name])
+        except (OSError, ValueError) as e:
+            messagebox.showerror("Export", f"Could not export playlist: {e}")
+            return
+        self.status.config(text=f"Exported {count} song(s) to {os.path.basename(path)}")
+
     def _on_switch_playlist(self):
         idxs = self.playlist_listbox.curselection()
         if not idxs:
@@ -192,22 +332,55 @@ class GUIManager:
             self._refresh_song_list()
 
     # ===== Song management =====
-        # ===== Song management =====
     def _refresh_song_list(self):
-        self.song_listbox.delete(0, tk.END)
+        pl = self.pm.current
+        if self.song_view.playlist is not pl:
+            self.song_view.set_playlist(pl)
+        elif pl is not None and pl.rules is not None:
+            # Smart playlists change underneath the view
+            self.song_view.resync()
+        else:
+            self.song_view.refresh()
+        self._update_song_status()
+
+    def _editable_playlist(self):
+        pl = self.pm.current
+        if not pl:
+            messagebox.showinfo("Info", "Create or select a playlist first.")
+            return None
+        if pl.rules is not None:
+            messagebox.showinfo("Info", f"'{pl.name}' is a smart playlist; its songs follow its rules.")
+            return None
+        return pl
+
+    def _refresh_smart(self, fields):
+        stale = self.smart.refresh(fields)
+        if self.pm.current in stale:
+            self.pm.current.ensure_loaded()
+            self.song_view.set_playlist(self.pm.current)
+            self._update_song_status()
+
+    def _refresh_smart_by_age(self):
+        self._refresh_smart({"added"})
+        self.root.after(SMART_REFRESH_MS, self._refresh_smart_by_age)
+
+    def _update_song_status(self):
         pl = self.pm.current
         self.current_label.config(text=self._current_name() or "No playlist")
         if not pl:
             self.status.config(text="No playlist selected")
             return
-        for item in pl.to_list():
-            self.song_listbox.insert(tk.END, item["title"])
-        self.status.config(text=f"{pl.length} song(s) in '{pl.name}'")
+        total, missing = self.durations.total(pl)
+        text = f"{pl.length} song(s) in '{pl.name}'"
+        if total:
+            text += f" · {_format_duration(total)}"
+            if missing:
+                text += f" (+{missing} not analyzed)"
+        self.status.config(text=text)
 
     def _add_song(self):
-        pl = self.pm.current
+        pl = self._editable_playlist()
         if not pl:
-            messagebox.showinfo("Info", "Create or select a playlist first.")
             return
         path = filedialog.askopenfilename(
             initialdir=SONGS_DIR,
@@ -219,122 +392,389 @@ class GUIManager:
             messagebox.showerror("Error", "Selected file is not a supported audio format.")
             return
         title = pretty_title(os.path.basename(path))
-        pl.add_song(title, path)
-        self._refresh_song_list()
+        node = pl.add_song(title, path)
+        self.song_view.inserted(node)
+        self._update_song_status()
         self.db_save(self.pm)
 
     def _delete_song(self):
-        pl = self.pm.current
+        # Deletes every selected song as one edit: one undo step, one save
+        pl = self._editable_playlist()
         if not pl:
             return
-        idxs = self.song_listbox.curselection()
-        if not idxs:
+        nodes = self.song_view.selected_nodes()
+        if not nodes:
             messagebox.showinfo("Info", "Select a song to delete.")
             return
-        title = self.song_listbox.get(idxs[0])
-        if pl.delete_song(title):
-            self._refresh_song_list()
-            self.db_save(self.pm)
-            if self.player.current_path:
-                current_name = os.path.basename(self.player.current_path)
-                if pretty_title(os.path.splitext(current_name)[0]) == title:
-                    self.player.stop()
-                    self.status.config(text="Stopped (song deleted)")
+        before = self.song_view.is_before_anchor(nodes[0])
+        if not pl.delete_nodes(nodes):
+            messagebox.showerror("Error", f"Could not delete song '{nodes[0].title}'.")
+            return
+        if len(nodes) == 1:
+            self.song_view.removed(nodes[0], before)
         else:
-            messagebox.showerror("Error", f"Could not delete song '{title}'.")
+            self.song_view.resync()
+        self._update_song_status()
+        self.db_save(self.pm)
+        self._stop_if_removed(pl, "deleted")
+
+    def _stop_if_removed(self, pl, why: str):
+        node = self.player.current_node
+        if self.player.playlist is pl and node is not None and not pl.contains(node):
+            self.player.stop()
+            self.status.config(text=f"Stopped (song {why})")
+
+    def _transfer_songs(self, move: bool):
+        pl = self._editable_playlist() if move else self.pm.current
+        if not pl:
+            return
+        nodes = self.song_view.selected_nodes()
+        if not nodes:
+            messagebox.showinfo("Info", "Select the songs first.")
+            return
+        verb = "Move" if move else "Copy"
+        others = [name for name in self.pm.get_all_names() if name != pl.name]
+        name = simpledialog.askstring(f"{verb} Songs", f"{verb} {len(nodes)} song(s) to playlist:",
+                                      initialvalue=others[0] if others else "")
+        if not name:
+            return
+        target = self.pm.playlists.get(name.strip())
+        if target is None or target is pl or target.rules is not None:
+            messagebox.showerror("Error", "Choose another playlist that is not a smart playlist.")
+            return
+        with self.history.group():
+            if move:
+                copies = self.pm.move_songs(pl, nodes, target)
+            else:
+                copies = self.pm.copy_songs(nodes, target)
+        self.db_save(self.pm)
+        if move:
+            self.song_view.resync()
+            self._update_song_status()
+            self._stop_if_removed(pl, "moved")
+        self.status.config(text=f"{'Moved' if move else 'Copied'} {len(copies)} song(s) to '{target.name}'")
+
+    def _dedupe_songs(self):
+        pl = self._editable_playlist()
+        if not pl:
+            return
+        removed = pl.dedupe()
+        if removed:
+            self.song_view.resync()
+            self._update_song_status()
+            self.db_save(self.pm)
+            self._stop_if_removed(pl, "removed as a duplicate")
+        self.status.config(text=f"Removed {removed} duplicate(s) from '{pl.name}'")
+
+    def _sort_songs(self, field: str):
+        pl = self._editable_playlist()
+        if not pl:
+            return
+        key = SORT_KEYS.get(field) or self.play_history.sort_key(field)
+        if pl.sort_by(key):
+            self.song_view.resync()
+            self.db_save(self.pm)
+
+    def _move_song(self, step: int):
+        pl = self._editable_playlist()
+        if not pl:
+            return
+        node = self.song_view.selected
+        if not node:
+            messagebox.showinfo("Info", "Select a song to move.")
+            return
+        neighbour = node.next if step > 0 else node.prev
+        if neighbour is None:
+            return
+        # Moving down goes after the next song; moving up goes after the one before the previous
+        after = neighbour if step > 0 else neighbour.prev
+        before = self.song_view.is_before_anchor(node)
+        if pl.move_song(node, after):
+            self.song_view.moved(node, before)
+            self.song_view.select(node)
+            self.db_save(self.pm)
 
     def _play_selected(self):
         pl = self.pm.current
         if not pl:
             return
-        idxs = self.song_listbox.curselection()
-        if not idxs:
+        node = self.song_view.selected
+        if not node:
             messagebox.showinfo("Info", "Select a song to play.")
             return
-        title = self.song_listbox.get(idxs[0])
-        node = pl.search_song(title)
-        if node:
-            self.player.play(node.filepath)
-            self.status.config(text=f"Playing: {title}")
+        if self.pm.catalog.is_missing(node.track):
+            self.status.config(text=f"File is missing: {node.filepath}")
+            return
+        pl.traversal.set_mode(self.play_mode.get())
+        self.player.play_node(pl, node)
+        self.status.config(text=f"Loading: {node.title}")
 
     def _search_song(self):
-        pl = self.pm.current
+        self.search_entry.focus_set()
+        self._run_search()
+
+    def _schedule_search(self):
+        # Debounce keystrokes so a query runs once typing pauses
+        if self._search_job:
+            self.root.after_cancel(self._search_job)
+        self._search_job = self.root.after(150, self._run_search)
+
+    def _run_search(self):
+        self._search_job = None
+        q = self.search_var.get()
+        self._search_hits = self.search_index.search(q)
+        self.search_results.delete(0, tk.END)
+        for hit in self._search_hits:
+            self.search_results.insert(tk.END, f"{hit.title}  —  {hit.playlist}")
+        if self._search_hits:
+            self.search_results.pack(fill="x", pady=(0, 8), after=self.search_entry)
+        else:
+            self.search_results.pack_forget()
+            if q.strip():
+                self.status.config(text="No match found")
+
+    def _open_search_hit(self):
+        idxs = self.search_results.curselection()
+        if not idxs:
+            return
+        hit = self._search_hits[idxs[0]]
+        pl = next((p for p in self.pm.playlists.values() if p.id == hit.playlist_id), None)
         if not pl:
+            self.status.config(text="That playlist no longer exists")
             return
-        q = simpledialog.askstring("Search", "Enter song title:")
-        if not q:
+        node = pl.node_at(hit.position)
+        if not node or node.id != hit.song_id:
+            # The index lags behind unsaved reorders; fall back to a walk
+            node = next((n for n in pl if n.id == hit.song_id), None)
+        if not node:
+            self.status.config(text=f"'{hit.title}' is no longer in '{pl.name}'")
             return
-        for i in range(self.song_listbox.size()):
-            if q.lower() in self.song_listbox.get(i).lower():
-                self.song_listbox.selection_clear(0, tk.END)
-                self.song_listbox.selection_set(i)
-                self.song_listbox.see(i)
-                self.status.config(text=f"Found: {self.song_listbox.get(i)}")
-                return
-        messagebox.showinfo("Info", "No match found.")
+        if pl is not self.pm.current:
+            self.pm.switch_playlist(pl.name)
+            self._refresh_sidebar()
+            self._refresh_song_list()
+        self.song_view.select(node)
+        self.status.config(text=f"Found: {node.title}")
 
     def _import_all_from_songs(self):
-        pl = self.pm.current
+        pl = self._editable_playlist()
         if not pl:
-            messagebox.showinfo("Info", "Create or select a playlist first.")
             return
-        added = 0
-        for name in sorted(os.listdir(SONGS_DIR)):
-            path = os.path.join(SONGS_DIR, name)
-            if os.path.isfile(path) and is_audio_file(path):
-                title = pretty_title(name)
-                if not pl.search_song(title):
-                    pl.add_song(title, path)
-                    added += 1
+        if self._scan_thread and self._scan_thread.is_alive():
+            self.status.config(text="A library scan is already running")
+            return
+        # Scan on a worker thread; the Tk thread polls for progress and the result
+        events = queue.Queue()
+
+        def work():
+            try:
+                tracks = self.scanner.scan(SONGS_DIR, progress=lambda done, total: events.put(("progress", done, total)))
+                events.put(("done", tracks))
+            except Exception as e:
+                events.put(("error", e))
+
+        self._scan_thread = threading.Thread(target=work, daemon=True)
+        self._scan_thread.start()
+        self.status.config(text="Scanning songs/ ...")
+        self.root.after(100, self._poll_scan, pl, events)
+
+    def _poll_scan(self, pl, events):
+        while True:
+            try:
+                event = events.get_nowait()
+            except queue.Empty:
+                self.root.after(100, self._poll_scan, pl, events)
+                return
+            if event[0] == "progress":
+                self.status.config(text=f"Scanning songs/ ... {event[1]}/{event[2]}")
+            elif event[0] == "error":
+                self.status.config(text="Scan failed")
+                messagebox.showerror("Import", f"Library scan failed: {event[1]}")
+                return
+            else:
+                break
+        if self.pm.playlists.get(pl.name) is not pl:
+            self.status.config(text="Import cancelled (playlist removed)")
+            return
+        with self.history.group():
+            added = import_tracks(pl, event[1])
+        # From now on files appearing in songs/ are added here as well
+        database.set_meta(WATCH_TARGET_KEY, pl.id, self.db_path)
+        # A scan may have refreshed file sizes
+        self._refresh_smart({"size"})
         if added > 0:
             self.db_save(self.pm)
             self._refresh_song_list()
             messagebox.showinfo("Import", f"Imported {added} song(s) into '{pl.name}'")
         else:
+            self.status.config(text="Ready")
             messagebox.showinfo("Import", "No new audio files found or all already added.")
 
+    def _analyze_library(self):
+        if self._analysis_thread and self._analysis_thread.is_alive():
+            self.status.config(text="Analysis is already running")
+            return
+        # Tracks of loaded playlists, including unsaved ones, plus everything stored
+        paths = {track.path for track in self.pm.catalog}
+        events = queue.Queue()
+        if self.analyzer is None:
+            from analysis import AudioAnalyzer
+            self.analyzer = AudioAnalyzer(db_path=self.db_path)
+
+        def work():
+            try:
+                paths.update(database.referenced_track_paths(self.db_path))
+                done = self.analyzer.run(paths, progress=lambda d, t: events.put(("progress", d, t)))
+                events.put(("done", done))
+            except Exception as e:
+                events.put(("error", e))
+
+        self._analysis_thread = threading.Thread(target=work, daemon=True)
+        self._analysis_thread.start()
+        self.status.config(text="Analyzing tracks ...")
+        self.root.after(200, self._poll_analysis, events)
+
+    def _poll_analysis(self, events):
+        while True:
+            try:
+                event = events.get_nowait()
+            except queue.Empty:
+                self.root.after(200, self._poll_analysis, events)
+                return
+            if event[0] == "progress":
+                self.status.config(text=f"Analyzing tracks ... {event[1]}/{event[2]}")
+            elif event[0] == "error":
+                self.status.config(text=f"Analysis failed: {event[1]}")
+                return
+            else:
+                break
+        self.analysis.reload()
+        self._refresh_smart(ANALYSIS_FIELDS)
+        self._update_song_status()
+
+    # ===== songs/ watcher =====
+    def _song_label(self, node) -> str:
+        return ("⚠ " + node.title) if self.pm.catalog.is_missing(node.track) else node.title
+
+    def _watch_target(self):
+        pid = database.get_meta(WATCH_TARGET_KEY, db_path=self.db_path)
+        for pl in self.pm.playlists.values():
+            if pl.id == pid and pl.rules is None:
+                return pl
+        return None
+
+    def _poll_watcher(self):
+        added = relocated = missing = 0
+        target = None
+        while True:
+            try:
+                batch = self.watcher.batches.get_nowait()
+            except queue.Empty:
+                break
+            if target is None:
+                target = self._watch_target()
+            with self.history.group():
+                a, r, m = apply_batch(self.pm, batch, target)
+            added, relocated, missing = added + a, relocated + r, missing + m
+        if added or relocated or missing:
+            self.db_save(self.pm)
+            if relocated:
+                self._refresh_smart({"path"})
+            self._refresh_song_list()
+            parts = [f"{n} {what}" for n, what in ((added, "added"), (relocated, "moved"), (missing, "missing")) if n]
+            self.status.config(text="songs/: " + ", ".join(parts))
+        self.root.after(WATCH_POLL_MS, self._poll_watcher)
+
+    # ===== Undo =====
+    def _undo(self):
+        if self.history.undo():
+            self._after_history("Undone")
+        else:
+            self.status.config(text="Nothing to undo")
+
+    def _redo(self):
+        if self.history.redo():
+            self._after_history("Redone")
+        else:
+            self.status.config(text="Nothing to redo")
+
+    def _after_history(self, what: str):
+        self.db_save(self.pm)
+        self._refresh_sidebar()
+        if self.song_view.playlist is self.pm.current:
+            self.song_view.resync()
+            self._update_song_status()
+        else:
+            self._refresh_song_list()
+        self.status.config(text=f"{what} · {self.status.cget('text')}")
+
     # ===== Playback helpers =====
-    def _get_selected_index(self):
-        sel = self.song_listbox.curselection()
-        return sel[0] if sel else None
+    def _select_and_play(self, node):
+        self.song_view.select(node)
+        self.pm.current.traversal.set_mode(self.play_mode.get())
+        self.player.play_node(self.pm.current, node)
+        self.status.config(text=f"Loading: {node.title}")
+
+    def _set_play_mode(self):
+        mode = self.play_mode.get()
+        for pl in (self.pm.current, self.player.playlist):
+            if pl is not None:
+                pl.traversal.set_mode(mode)
+        database.set_meta(PLAY_MODE_KEY, mode, self.db_path)
+        self.status.config(text=f"Play mode: {mode}")
+
+    def _step_from(self):
+        # The playing song when it is in the shown playlist, else the selection
+        pl = self.pm.current
+        node = self.player.current_node
+        if self.player.playlist is pl and node is not None and pl.contains(node):
+            return node
+        return self.song_view.selected
+
+    def _poll_player(self):
+        # The player runs on its own thread; its events are applied here on the Tk thread
+        for event in self.player.poll_events():
+            if event[0] == "start":
+                _, pl, node = event
+                if node is not None:
+                    self.play_history.started(pl, node)
+                    if pl is self.pm.current and pl.contains(node):
+                        self.song_view.select(node)
+                    self.status.config(text=f"Playing: {node.title}")
+            elif event[0] == "end":
+                self.play_history.ended(event[2], event[3])
+            elif event[0] == "error":
+                self.status.config(text=f"Could not play {os.path.basename(event[1])}: {event[2]}")
+        self.root.after(100, self._poll_player)
+
+    def _show_play_history(self):
+        def lines(entries, detail):
+            return "\n".join(f"  {e.title} ({detail(e)})" for e in entries) or "  nothing yet"
+        most = lines(self.play_history.most_played(HISTORY_VIEW_SIZE),
+                     lambda e: f"{e.plays} plays, {e.skip_rate:.0%} skipped")
+        recent = lines(self.play_history.recently_played(HISTORY_VIEW_SIZE),
+                       lambda e: time.strftime("%Y-%m-%d %H:%M", time.localtime(e.last_played)))
+        messagebox.showinfo("Play History", f"Most played:\n{most}\n\nRecently played:\n{recent}")
 
-    def _select_and_play_by_index(self, index: int):
-        if index < 0 or index >= self.song_listbox.size():
-            return
-        self.song_listbox.selection_clear(0, tk.END)
-        self.song_listbox.selection_set(index)
-        self.song_listbox.see(index)
-        title = self.song_listbox.get(index)
+    def _next_song(self):
         pl = self.pm.current
         if not pl:
             return
-        node = pl.search_song(title)
-        if node:
-            self.player.play(node.filepath)
-            self.status.config(text=f"Playing: {title}")
-
-    def _next_song(self):
-        idx = self._get_selected_index()
-        if idx is None:
-            if self.song_listbox.size() > 0:
-                self._select_and_play_by_index(0)
-            return
-        next_idx = idx + 1
-        if next_idx < self.song_listbox.size():
-            self._select_and_play_by_index(next_idx)
+        pl.traversal.set_mode(self.play_mode.get())
+        node = pl.traversal.peek_next(self._step_from(), manual=True)
+        if node is not None:
+            self._select_and_play(node)
         else:
             self.status.config(text="End of playlist")
 
     def _prev_song(self):
-        idx = self._get_selected_index()
-        if idx is None:
-            size = self.song_listbox.size()
-            if size > 0:
-                self._select_and_play_by_index(size - 1)
-            return
-        prev_idx = idx - 1
-        if prev_idx >= 0:
-            self._select_and_play_by_index(prev_idx)
+        pl = self.pm.current
+        if not pl:
+            return
+        pl.traversal.set_mode(self.play_mode.get())
+        node = pl.traversal.previous(self._step_from())
+        if node is not None:
+            self._select_and_play(node)
         else:
             self.status.config(text="Start of playlist")
 
@@ -342,6 +782,12 @@ class GUIManager:
         return self.pm.current.name if self.pm.current else None
 
     def on_exit(self):
+        self.watcher.stop(timeout=1.0)
+        self.scanner.cancel()
+        if self.analyzer:
+            self.analyzer.cancel()
+        if self.video_bg:
+            self.video_bg.stop()
         try:
             self.db_save(self.pm)
         except Exception:
@@ -349,6 +795,14 @@ class GUIManager:
         try:
             if self.player:
                 self.player.stop()
+                self.player.shutdown()
         except Exception:
             pass
+        self.play_history.close(timeout=2.0)
         self.root.destroy()
+
+
+def _format_duration(seconds: float) -> str:
+    minutes, secs = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{secs:02d}" if hours else f"{minutes}:{secs:02d}"
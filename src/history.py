@@ -0,0 +1,239 @@
+import bisect
+import sqlite3
+import sys
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from itertools import islice
+from typing import Callable, Dict, List, Optional, Tuple
+import database
+from playlist import Playlist, SongNode
+
+# Play events are written in batches: once this many are waiting...
+FLUSH_EVENTS = 200
+# ...or this long after the first of them arrived
+FLUSH_SECONDS = 5.0
+RETRY_SECONDS = 1.0
+# A song stopped by hand before this many seconds counts as skipped
+SKIP_SECONDS = 30.0
+# Orders that sort_key() knows, each highest first
+SORT_FIELDS = ("plays", "last_played", "skip_rate")
+
+class TrackStats:
+    __slots__ = ("track_id", "path", "title", "plays", "skips", "last_played")
+
+    def __init__(self, track_id: int, path: str, title: str, plays: int = 0, skips: int = 0,
+                 last_played: Optional[float] = None):
+        self.track_id = track_id
+        self.path = path
+        self.title = title
+        self.plays = plays
+        self.skips = skips
+        self.last_played = last_played
+
+    @property
+    def skip_rate(self) -> float:
+        total = self.plays + self.skips
+        return self.skips / total if total else 0.0
+
+def _roll_up(events: List[Tuple]) -> List[Tuple]:
+    # One play_stats increment per track for a batch of events
+    rollups: Dict[int, List] = {}
+    for track_id, _, started, _, skipped in events:
+        row = rollups.get(track_id)
+        if row is None:
+            row = rollups[track_id] = [track_id, 0, 0, started]
+        row[2 if skipped else 1] += 1
+        row[3] = max(row[3], started)
+    return [tuple(row) for row in rollups.values()]
+
+class PlayHistory:
+    # Records each play as (track, playlist, start, end, skipped) from the
+    # player's start/end events. Events queue up in memory and a writer thread
+    # appends them, one transaction per batch, along with the per-track rollup
+    # in play_stats. The same rollup is mirrored here: stats_for() is a dict
+    # lookup, recently played is kept in play order and most played is
+    # bucketed by play count, so no view ever scans the history.
+    # started/ended and the views belong to one thread (Tk or the API loop).
+    def __init__(self, db_path: Optional[str] = None, flush_seconds: float = FLUSH_SECONDS):
+        self.db_path = db_path or database.DB_PATH
+        self.flush_seconds = flush_seconds
+        self.last_error: Optional[BaseException] = None
+        self._stats: Dict[int, TrackStats] = {}
+        # Least recently played first
+        self._recent: "OrderedDict[int, TrackStats]" = OrderedDict()
+        # play count -> tracks with that count, in the order they reached it
+        self._by_plays: Dict[int, Dict[int, TrackStats]] = {}
+        self._counts: List[int] = []
+        # (node, playlist id, start) of the song playing now
+        self._open: Optional[Tuple[SongNode, Optional[int], float]] = None
+        self._pending: List[Tuple] = []
+        self._in_flight = 0
+        self._flushing = 0
+        self._closing = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="play-history", daemon=True)
+        self._thread.start()
+
+    def reload(self):
+        # Load the stored rollup; main.py calls this off the Tk thread
+        self._stats, self._recent, self._by_plays, self._counts = {}, OrderedDict(), {}, []
+        rows = database.load_play_stats(self.db_path)
+        rows.sort(key=lambda row: row[5] or 0.0)
+        for track_id, path, title, plays, skips, last_played in rows:
+            stats = TrackStats(track_id, path, title, plays, skips, last_played)
+            self._stats[track_id] = stats
+            self._recent[track_id] = stats
+            if plays:
+                self._bucket(stats)
+
+    # ===== Events =====
+    def started(self, pl: Optional[Playlist], node: SongNode, at: Optional[float] = None):
+        at = time.time() if at is None else at
+        if self._open is not None:
+            self._close(at, naturally=False)
+        if node.track.id is not None:
+            self._open = (node, pl.id if pl is not None else None, at)
+
+    def ended(self, node: Optional[SongNode], naturally: bool, at: Optional[float] = None):
+        if self._open is not None and self._open[0] is node:
+            self._close(time.time() if at is None else at, naturally)
+
+    def _close(self, at: float, naturally: bool):
+        node, playlist_id, began = self._open
+        self._open = None
+        skipped = not naturally and at - began < SKIP_SECONDS
+        track = node.track
+        stats = self._stats.get(track.id)
+        if stats is None:
+            stats = self._stats[track.id] = TrackStats(track.id, track.path, track.title)
+        else:
+            stats.path, stats.title = track.path, track.title
+        if skipped:
+            stats.skips += 1
+        else:
+            self._unbucket(stats)
+            stats.plays += 1
+            self._bucket(stats)
+        stats.last_played = began
+        self._recent[track.id] = stats
+        self._recent.move_to_end(track.id)
+        with self._cond:
+            self._pending.append((track.id, playlist_id, began, at, int(skipped)))
+            self._cond.notify_all()
+
+    def _bucket(self, stats: TrackStats):
+        bucket = self._by_plays.get(stats.plays)
+        if bucket is None:
+            bucket = self._by_plays[stats.plays] = {}
+            bisect.insort(self._counts, stats.plays)
+        bucket[stats.track_id] = stats
+
+    def _unbucket(self, stats: TrackStats):
+        bucket = self._by_plays.get(stats.plays)
+        if bucket is None or bucket.pop(stats.track_id, None) is None:
+            return
+        if not bucket:
+            del self._by_plays[stats.plays]
+            del self._counts[bisect.bisect_left(self._counts, stats.plays)]
+
+    # ===== Views =====
+    def stats_for(self, track_id: Optional[int]) -> Optional[TrackStats]:
+        return self._stats.get(track_id)
+
+    def most_played(self, limit: int = 25) -> List[TrackStats]:
+        # Highest count first; on a tie, whoever got there last
+        out: List[TrackStats] = []
+        for count in reversed(self._counts):
+            out.extend(islice(reversed(self._by_plays[count].values()), limit - len(out)))
+            if len(out) >= limit:
+                break
+        return out
+
+    def recently_played(self, limit: int = 25) -> List[TrackStats]:
+        return list(islice(reversed(self._recent.values()), limit))
+
+    def sort_key(self, field: str) -> Callable[[SongNode], Tuple]:
+        # For sorting songs by their rollup, highest first; unplayed songs last
+        if field not in SORT_FIELDS:
+            raise ValueError(f"unknown sort field: {field}")
+        stats_for = self._stats.get
+
+        def key(node: SongNode) -> Tuple:
+            stats = stats_for(node.track.id)
+            if stats is None:
+                return (1, 0.0)
+            value = getattr(stats, field)
+            return (0, -(value or 0.0))
+        return key
+
+    # ===== Writer =====
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        # Block until every finished play so far is committed
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._flushing += 1
+            self._cond.notify_all()
+            try:
+                while self._pending or self._in_flight:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        return False
+                    self._cond.wait(remaining)
+            finally:
+                self._flushing -= 1
+        return True
+
+    def close(self, timeout: Optional[float] = None):
+        # A song still playing is recorded as stopped now
+        if self._open is not None:
+            self._close(time.time(), naturally=False)
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+    def _take_batch(self) -> Optional[List[Tuple]]:
+        with self._cond:
+            while not self._pending and not self._closing:
+                self._cond.wait()
+            if not self._pending:
+                return None
+            deadline = time.monotonic() + self.flush_seconds
+            while not (self._closing or self._flushing or len(self._pending) >= FLUSH_EVENTS):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            batch, self._pending = self._pending, []
+            self._in_flight = len(batch)
+            return batch
+
+    def _run(self):
+        conn = database.open_connection(self.db_path)
+        try:
+            while True:
+                batch = self._take_batch()
+                if batch is None:
+                    return
+                try:
+                    with conn:
+                        database.save_play_events(conn, batch, _roll_up(batch))
+                    self.last_error = None
+                except sqlite3.Error as e:
+                    # Keep the batch at the front and retry; nothing is dropped
+                    self.last_error = e
+                    traceback.print_exc(file=sys.stderr)
+                    with self._cond:
+                        self._pending[:0] = batch
+                        self._in_flight = 0
+                        if self._closing:
+                            return
+                        self._cond.wait(RETRY_SECONDS)
+                    continue
+                with self._cond:
+                    self._in_flight = 0
+                    self._cond.notify_all()
+        finally:
+            conn.close()
@@ -0,0 +1,361 @@
+import json
+import os
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict, List, Optional, Tuple
+import database
+from playlist import Playlist, PlaylistManager, SongNode
+from smart import SmartPlaylist
+
+BASE_DIR = os.path.dirname(os.path.dirname(__file__))
+JOURNAL_PATH = os.path.join(BASE_DIR, "database", "journal.log")
+
+UNDO_LIMIT = 500
+# A log that never catches up with the database is rewritten without the
+# already-committed records once it grows past this
+COMPACT_BYTES = 4 * 1024 * 1024
+# Records written within this long of each other share one fsync
+SYNC_SECONDS = 0.05
+
+class UndoHistory:
+    # Undo/redo of playlist edits, fed by the change tracker. Each step keeps the
+    # node objects and their neighbours, so undoing relinks them in O(1)
+    # instead of copying lists. Undo and redo go through the ordinary mutation
+    # methods, so they are saved and journaled like any other edit.
+    def __init__(self, pm: PlaylistManager, limit: int = UNDO_LIMIT):
+        self.pm = pm
+        self._undo: Deque[List[Tuple]] = deque(maxlen=limit)
+        self._redo: List[List[Tuple]] = []
+        self._group: Optional[List[Tuple]] = None
+        self._replaying = False
+        pm.tracker.listeners.append(self._on_event)
+
+    def can_undo(self) -> bool:
+        return bool(self._undo)
+
+    def can_redo(self) -> bool:
+        return bool(self._redo)
+
+    @contextmanager
+    def group(self):
+        # Everything inside becomes one undo step, e.g. a whole import
+        if self._group is not None:
+            yield
+            return
+        self._group = []
+        try:
+            yield
+        finally:
+            steps, self._group = self._group, None
+            if steps:
+                self._undo.append(steps)
+
+    def _on_event(self, seq: int, kind: str, pl: Playlist, *details):
+        if self._replaying or pl is None:
+            # Track events (relocations, missing flags) are not undoable
+            return
+        if kind == "add":
+            node = details[0]
+            step = ("add", pl, node, node.prev)
+        elif kind == "remove":
+            step = ("remove", pl, details[0], details[1])
+        elif kind == "remove_many":
+            step = ("remove_many", pl, details[0])
+        elif kind == "reorder":
+            step = ("reorder", pl, details[0], list(pl))
+        elif kind == "move":
+            node, old_prev = details
+            step = ("move", pl, node, old_prev, node.prev)
+        elif kind == "clear":
+            step = ("clear", pl, details[0])
+        elif kind == "rename":
+            step = ("rename", pl, details[0], pl.name)
+        else:
+            step = (kind, pl)
+        self._redo.clear()
+        if self._group is not None:
+            self._group.append(step)
+        else:
+            self._undo.append([step])
+
+    def undo(self) -> bool:
+        if not self._undo:
+            return False
+        steps = self._undo.pop()
+        self._apply(steps, reverse=True)
+        self._redo.append(steps)
+        return True
+
+    def redo(self) -> bool:
+        if not self._redo:
+            return False
+        steps = self._redo.pop()
+        self._apply(steps, reverse=False)
+        self._undo.append(steps)
+        return True
+
+    def _apply(self, steps: List[Tuple], reverse: bool):
+        self._replaying = True
+        try:
+            for step in (reversed(steps) if reverse else steps):
+                (self._revert if reverse else self._reapply)(step)
+        finally:
+            self._replaying = False
+
+    def _revert(self, step: Tuple):
+        kind, pl = step[0], step[1]
+        if kind == "add":
+            pl.delete_node(step[2])
+        elif kind == "remove":
+            pl.relink(step[2], step[3])
+        elif kind == "remove_many":
+            for node, prev in reversed(step[2]):
+                pl.relink(node, prev)
+        elif kind == "reorder":
+            pl.reorder(step[2])
+        elif kind == "move":
+            pl.move_song(step[2], step[3])
+        elif kind == "clear":
+            pl.restore_cleared(step[2])
+        elif kind == "rename":
+            self.pm.rename_playlist(step[3], step[2])
+        elif kind == "create":
+            self.pm.delete_playlist(pl.name)
+        elif kind == "drop":
+            self.pm.reinstate_playlist(pl)
+
+    def _reapply(self, step: Tuple):
+        kind, pl = step[0], step[1]
+        if kind == "add":
+            pl.relink(step[2], step[3])
+        elif kind == "remove":
+            pl.delete_node(step[2])
+        elif kind == "remove_many":
+            pl.delete_nodes([node for node, _ in step[2]])
+        elif kind == "reorder":
+            pl.reorder(step[3])
+        elif kind == "move":
+            pl.move_song(step[2], step[4])
+        elif kind == "clear":
+            pl.clear()
+        elif kind == "rename":
+            self.pm.rename_playlist(step[2], step[3])
+        elif kind == "create":
+            self.pm.reinstate_playlist(pl)
+        elif kind == "drop":
+            self.pm.delete_playlist(pl.name)
+
+
+def _id(node: Optional[SongNode]) -> int:
+    return node.id if node is not None else 0
+
+class JournalLog:
+    # Append-only log of every mutation, one compact JSON array per line, so
+    # edits not yet flushed to SQLite survive a crash. The database records the
+    # sequence number of the last mutation it holds; checkpoint() drops the log
+    # once it is covered and recover() replays whatever is newer.
+    #
+    # Records are written and flushed as the edits happen, but fsynced in
+    # groups: a syncer thread waits SYNC_SECONDS after a record, then fsyncs
+    # everything written by then, so an edit is on disk within SYNC_SECONDS
+    # plus one fsync and never waits for the disk. An fsync per record would put a disk
+    # flush inside every mutation on the Tk thread, e.g. 200k of them for an
+    # import. A crash of the process alone loses nothing either way: flushed
+    # records are in the OS.
+    def __init__(self, path: str = JOURNAL_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._unsynced = threading.Condition(self._lock)
+        self._dirty = False
+        self._closing = threading.Event()
+        self._last_seq = 0
+        self._file = open(path, "a", encoding="utf-8")
+        self._syncer = threading.Thread(target=self._sync_loop, name="journal-sync", daemon=True)
+        self._syncer.start()
+
+    def attach(self, pm: PlaylistManager):
+        pm.tracker.listeners.append(self._on_event)
+
+    def close(self):
+        self._closing.set()
+        with self._lock:
+            self._unsynced.notify()
+        self._syncer.join()
+        with self._lock:
+            self._file.close()
+
+    def _sync_loop(self):
+        while True:
+            with self._lock:
+                while not self._dirty and not self._closing.is_set():
+                    self._unsynced.wait()
+                if not self._dirty:
+                    return
+            # Let the rest of a burst of edits join this fsync
+            self._closing.wait(SYNC_SECONDS)
+            with self._lock:
+                self._dirty = False
+                # Its own descriptor, so writes and checkpoints go on meanwhile
+                fd = os.dup(self._file.fileno())
+            try:
+                os.fsync(fd)
+            except OSError:
+                # Still flushed to the OS; the next record tries again
+                pass
+            finally:
+                os.close(fd)
+
+    def _on_event(self, seq: int, kind: str, pl: Playlist, *details):
+        if kind == "relocate":
+            track = details[0]
+            record = [seq, kind, 0, track.id, details[1], track.path]
+        elif kind == "missing":
+            track = details[0]
+            record = [seq, kind, 0, track.id, track.path, int(details[1])]
+        elif kind == "add":
+            node = details[0]
+            record = [seq, kind, pl.id, node.id, _id(node.prev), node.title, node.filepath]
+        elif kind == "move":
+            node = details[0]
+            record = [seq, kind, pl.id, node.id, _id(node.prev)]
+        elif kind == "remove":
+            record = [seq, kind, pl.id, details[0].id]
+        elif kind == "remove_many":
+            record = [seq, kind, pl.id, [node.id for node, _ in details[0]]]
+        elif kind == "reorder":
+            record = [seq, kind, pl.id, [node.id for node in pl]]
+        elif kind == "create" and pl.rules is not None:
+            record = [seq, kind, pl.id, pl.name, pl.rules]
+        elif kind in ("create", "rename"):
+            record = [seq, kind, pl.id, pl.name]
+        else:
+            record = [seq, kind, pl.id]
+        line = json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            self._last_seq = seq
+            self._dirty = True
+            self._unsynced.notify()
+
+    def checkpoint(self, seq: int):
+        # Called once the database holds every mutation up to seq
+        with self._lock:
+            if seq >= self._last_seq:
+                self._file.truncate(0)
+            elif self._file.tell() > COMPACT_BYTES:
+                self._rewrite_after(seq)
+
+    def _rewrite_after(self, seq: int):
+        self._file.close()
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as out:
+            for record in self._read():
+                if record[0] > seq:
+                    out.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(tmp, self.path)
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    def _read(self) -> List[list]:
+        records = []
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    break  # a torn last line from a crash mid-write
+        return records
+
+    def recover(self, pm: PlaylistManager, store_seq: Optional[int] = None) -> int:
+        # Replay mutations the store does not have yet (store_seq, the SQLite
+        # database's by default). Call before attach(), then save: the
+        # replayed edits are pending in pm's tracker.
+        db_seq = database.load_journal_seq() if store_seq is None else store_seq
+        with self._lock:
+            records = [r for r in self._read() if r[0] > db_seq]
+        pm.tracker.seq = max(pm.tracker.seq, db_seq)
+        if not records:
+            self.checkpoint(db_seq)
+            return 0
+        by_id = {pl.id: pl for pl in pm.playlists.values()}
+        nodes: Dict[int, Dict[int, SongNode]] = {}
+
+        def nodes_of(pl: Playlist) -> Dict[int, SongNode]:
+            if pl.id not in nodes:
+                nodes[pl.id] = {node.id: node for node in pl}
+            return nodes[pl.id]
+
+        replayed = 0
+        for record in records:
+            seq, kind, pid = record[:3]
+            if kind in ("relocate", "missing"):
+                # Found by the path it had then; the catalog pulls it in from storage
+                track = pm.catalog.get(record[4])
+                if track is None or track.id != record[3]:
+                    continue
+                if kind == "relocate":
+                    replayed += pm.catalog.relocate(track, record[5])
+                elif pm.catalog.is_missing(track) != bool(record[5]):
+                    pm.catalog.set_missing(track, bool(record[5]))
+                    replayed += 1
+                continue
+            pl = by_id.get(pid)
+            if kind == "create":
+                if pl is None:
+                    pl = SmartPlaylist(record[3], record[4]) if len(record) > 4 else Playlist(record[3])
+                    pl.id = pid
+                    if pm.reinstate_playlist(pl):
+                        by_id[pid] = pl
+                        pm.tracker.reserve_ids(pid, 0)
+                        replayed += 1
+                continue
+            if pl is None:
+                continue
+            if kind == "rename":
+                replayed += pm.rename_playlist(pl.name, record[3])
+            elif kind == "drop":
+                replayed += pm.delete_playlist(pl.name)
+                by_id.pop(pid, None)
+            elif kind == "clear":
+                pl.clear()
+                nodes[pid] = {}
+                replayed += 1
+            elif kind == "remove_many":
+                known = nodes_of(pl)
+                replayed += bool(pl.delete_nodes([known.pop(sid) for sid in record[3] if sid in known]))
+            elif kind == "reorder":
+                known = nodes_of(pl)
+                order = [known[sid] for sid in record[3] if sid in known]
+                listed = set(order)
+                replayed += pl.reorder(order + [node for node in pl if node not in listed])
+            elif kind == "add":
+                sid, prev_id, title, path = record[3:7]
+                known = nodes_of(pl)
+                if sid in known:
+                    continue
+                node = SongNode(pl.catalog.get_or_create(title, path), sid)
+                prev = known.get(prev_id) if prev_id else None
+                if prev_id and prev is None:
+                    prev = pl.tail
+                if pl.relink(node, prev):
+                    known[sid] = node
+                    pm.tracker.reserve_ids(0, sid)
+                    replayed += 1
+            else:
+                known = nodes_of(pl)
+                node = known.get(record[3])
+                if node is None:
+                    continue
+                if kind == "remove":
+                    replayed += pl.delete_node(node)
+                    del known[node.id]
+                elif kind == "move":
+                    replayed += pl.move_song(node, known.get(record[4]) if record[4] else None)
+        # Everything replayed is covered by the next flush
+        pm.tracker.seq = max(pm.tracker.seq, records[-1][0])
+        with self._lock:
+            self._last_seq = max(self._last_seq, records[-1][0])
+        return replayed
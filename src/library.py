@@ -0,0 +1,227 @@
+import os
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+import database
+from search import DEFAULT_LIMIT, SearchHit, SearchIndex
+
+# A library is one SQLite file with the full schema, e.g. one per studio or
+# user. "main" is the original database/playlist.db; every other library has
+# its own folder under database/libraries/, so its journal sits beside it.
+MAIN_LIBRARY = "main"
+MAIN_DB = os.path.join(database.BASE_DIR, "database", "playlist.db")
+LIBRARIES_DIR = os.path.join(database.BASE_DIR, "database", "libraries")
+DB_NAME = "playlist.db"
+# Libraries attached to the cross-library connection at a time; SQLite's
+# default limit is 10
+ATTACH_LIMIT = 8
+# Per-library connection pools kept open; the least recently used is closed
+OPEN_LIMIT = 4
+_NAME = re.compile(r"[A-Za-z0-9][A-Za-z0-9_.-]{0,63}")
+
+def library_path(name: str) -> str:
+    if name == MAIN_LIBRARY:
+        return MAIN_DB
+    if not _NAME.fullmatch(name):
+        raise ValueError(f"invalid library name: {name!r}")
+    return os.path.join(LIBRARIES_DIR, name, DB_NAME)
+
+def list_libraries() -> List[str]:
+    # Found by their files; nothing is opened
+    names = [MAIN_LIBRARY]
+    if os.path.isdir(LIBRARIES_DIR):
+        names.extend(sorted(
+            entry.name for entry in os.scandir(LIBRARIES_DIR)
+            if entry.is_dir() and _NAME.fullmatch(entry.name) and os.path.isfile(os.path.join(entry.path, DB_NAME))
+        ))
+    return names
+
+def resolve_library(name: str, create: bool = False) -> str:
+    # The file of the library `name`, which must exist unless create is set.
+    # Entry points pass it down as db_path; database.DB_PATH stays the default.
+    path = library_path(name)
+    if not create and name != MAIN_LIBRARY and not os.path.isfile(path):
+        raise ValueError(f"no library named {name!r} (known: {', '.join(list_libraries())})")
+    return path
+
+def _library_at(db_path: str) -> Optional[str]:
+    # The name of the library stored at db_path, if it is one
+    path = os.path.abspath(db_path)
+    if path == os.path.abspath(MAIN_DB):
+        return MAIN_LIBRARY
+    folder, file = os.path.split(path)
+    name = os.path.basename(folder)
+    if file == DB_NAME and os.path.dirname(folder) == os.path.abspath(LIBRARIES_DIR) and _NAME.fullmatch(name):
+        return name
+    return None
+
+def _current(db_path: str) -> bool:
+    try:
+        return os.path.isfile(db_path) and database.schema_version(db_path) == database.SCHEMA_VERSION
+    except sqlite3.DatabaseError:
+        return False
+
+_TOTALS = """
+  SELECT ?, (SELECT COUNT(*) FROM {db}.playlists), (SELECT COUNT(*) FROM {db}.songs),
+         (SELECT COUNT(*) FROM {db}.tracks), (SELECT COALESCE(SUM(plays), 0) FROM {db}.play_stats)
+"""
+_MOST_PLAYED = """
+  SELECT * FROM (
+    SELECT ?, t.title, t.path, s.plays, s.skips, s.last_played
+    FROM {db}.play_stats s JOIN {db}.tracks t ON t.id = s.track_id
+    ORDER BY s.plays DESC LIMIT ?
+  )
+"""
+
+class LibrarySet:
+    # Reads across libraries, opened only as they are used. Each library gets
+    # a ConnectionPool on first use, and past OPEN_LIMIT the least recently
+    # used one is closed. Cross-library queries share one connection that
+    # ATTACHes libraries read-only as queries ask for them, and past
+    # ATTACH_LIMIT the least recently used is detached. A query over more
+    # libraries than that runs in groups and the results are merged.
+    #
+    # Only `active`, the database the caller has open, is brought up to date
+    # (it would be anyway). Every other library is opened read-only and must
+    # already have the current schema: one named in a query is refused
+    # otherwise, and queries over all libraries leave it out. Opening it once
+    # with --library upgrades it.
+    def __init__(self, names: Optional[List[str]] = None, active: Optional[str] = None):
+        # None means every library on disk at query time
+        self.names = names
+        # The active database goes by its library name, or by its path when it
+        # is not one of the libraries (e.g. server.py --db)
+        self.active: Optional[str] = None
+        self._outside: Dict[str, str] = {}
+        if active is not None:
+            self.active = _library_at(active)
+            if self.active is None:
+                self.active = os.path.abspath(active)
+                self._outside[self.active] = self.active
+        self._pools: "OrderedDict[str, database.ConnectionPool]" = OrderedDict()
+        # library name -> schema name on the shared connection
+        self._attached: "OrderedDict[str, str]" = OrderedDict()
+        self._ready: set = set()
+        self._next_schema = 0
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.RLock()
+
+    def close(self):
+        with self._lock:
+            for pool in self._pools.values():
+                pool.close()
+            self._pools.clear()
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+            self._attached.clear()
+
+    def _path(self, name: str) -> str:
+        # The library's file, checked once
+        path = self._outside.get(name) or library_path(name)
+        if name not in self._ready:
+            if not os.path.isfile(path):
+                raise ValueError(f"no library named {name!r}")
+            if name == self.active:
+                database.init_db(path)
+            elif not _current(path):
+                raise ValueError(f"library {name!r} has an older schema; open it once with --library {name} to upgrade it")
+            self._ready.add(name)
+        return path
+
+    def _names(self, names: Optional[List[str]]) -> List[str]:
+        if names or self.names:
+            return list(names or self.names)
+        # Every library on disk that can be read as it is
+        found = [name for name in list_libraries() if name in self._ready or _current(library_path(name))
+                 or name == self.active and os.path.isfile(library_path(name))]
+        if self.active in self._outside:
+            found.insert(0, self.active)
+        return found
+
+    # ===== One library =====
+    def pool(self, name: str) -> database.ConnectionPool:
+        with self._lock:
+            pool = self._pools.get(name)
+            if pool is not None:
+                self._pools.move_to_end(name)
+                return pool
+            pool = database.ConnectionPool(db_path=self._path(name), read_only=name != self.active)
+            self._pools[name] = pool
+            while len(self._pools) > OPEN_LIMIT:
+                _, oldest = self._pools.popitem(last=False)
+                oldest.close()
+            return pool
+
+    # ===== Across libraries =====
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        # The shared connection; callers hold the lock while it is in use, so
+        # what is attached cannot change under a query
+        with self._lock:
+            if self._conn is None:
+                self._conn = sqlite3.connect(":memory:", uri=True, check_same_thread=False)
+            yield self._conn
+
+    def _attach(self, names: List[str]) -> Dict[str, str]:
+        # schema -> library for names, attaching the ones missing
+        conn = self._conn
+        for name in names:
+            if name in self._attached:
+                self._attached.move_to_end(name)
+                continue
+            while len(self._attached) >= ATTACH_LIMIT:
+                _, schema = self._attached.popitem(last=False)
+                conn.execute(f"DETACH DATABASE {schema}")
+            schema = f"lib{self._next_schema}"
+            self._next_schema += 1
+            uri = Path(os.path.abspath(self._path(name))).as_uri() + "?mode=ro"
+            conn.execute(f"ATTACH DATABASE ? AS {schema}", (uri,))
+            self._attached[name] = schema
+        return {self._attached[name]: name for name in names}
+
+    def _groups(self, names: Optional[List[str]]) -> Iterator[List[str]]:
+        names = self._names(names)
+        for i in range(0, len(names), ATTACH_LIMIT):
+            yield names[i:i + ATTACH_LIMIT]
+
+    def _union(self, template: str, params: tuple, names: Optional[List[str]]) -> List[tuple]:
+        rows: List[tuple] = []
+        with self.connection() as conn:
+            for group in self._groups(names):
+                schemas = self._attach(group)
+                sql = " UNION ALL ".join(template.format(db=schema) for schema in schemas)
+                args = tuple(arg for name in schemas.values() for arg in (name, *params))
+                rows.extend(conn.execute(sql, args).fetchall())
+        return rows
+
+    def search(self, text: str, limit: int = DEFAULT_LIMIT, names: Optional[List[str]] = None) -> List[SearchHit]:
+        # The same ranking as one library's search; hits carry their library.
+        # A single library is searched through its own pool, off the shared lock.
+        names = self._names(names)
+        if len(names) == 1:
+            return SearchIndex(pool=self.pool(names[0]), schemas={"main": names[0]}).search(text, limit)
+        hits: List[SearchHit] = []
+        with self.connection():
+            for group in self._groups(names):
+                hits.extend(SearchIndex(pool=self, schemas=self._attach(group)).search(text, limit))
+        hits.sort(key=lambda h: -h.score)
+        return hits[:limit]
+
+    def totals(self, names: Optional[List[str]] = None) -> dict:
+        # {"libraries": {name: counts}, "all": summed counts}
+        libraries: Dict[str, Dict[str, int]] = {}
+        for name, playlists, songs, tracks, plays in self._union(_TOTALS, (), names):
+            libraries[name] = {"playlists": playlists, "songs": songs, "tracks": tracks, "plays": plays}
+        keys = ("playlists", "songs", "tracks", "plays")
+        return {"libraries": libraries, "all": {key: sum(lib[key] for lib in libraries.values()) for key in keys}}
+
+    def most_played(self, limit: int = 25, names: Optional[List[str]] = None) -> List[tuple]:
+        # (library, title, path, plays, skips, last_played), most played first
+        rows = self._union(_MOST_PLAYED, (limit,), names)
+        rows.sort(key=lambda row: -row[3])
+        return rows[:limit]
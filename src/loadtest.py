@@ -0,0 +1,262 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import wave
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import quote
+import database
+from playlist import PlaylistManager
+import server
+
+# Drives server.py with many concurrent keep-alive clients and reports latency
+# per endpoint. With --spawn it serves a generated library from a scratch
+# database, so it never touches the real one.
+
+LOADTEST_PLAYLIST = "Load test"
+SILENCE_SECONDS = 120
+
+
+class ApiClient:
+    # Minimal HTTP/1.1 client on one keep-alive connection
+    def __init__(self, host: str = server.HOST, port: int = server.PORT):
+        self.host = host
+        self.port = port
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+
+    async def connect(self):
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    async def request(self, method: str, path: str, body: Optional[dict] = None) -> Tuple[int, object]:
+        # (status, decoded JSON); a streamed NDJSON reply comes back as a list of its lines
+        reused = self._writer is not None
+        if not reused:
+            await self.connect()
+        data = json.dumps(body).encode("utf-8") if body is not None else b""
+        self._writer.write((f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\n"
+                            f"Content-Type: application/json\r\nContent-Length: {len(data)}\r\n\r\n").encode("latin-1") + data)
+        await self._writer.drain()
+        status_line = await self._reader.readline()
+        if not status_line:
+            await self.close()
+            if reused:
+                # The server dropped the idle connection; try once on a fresh one
+                return await self.request(method, path, body)
+            raise ConnectionError("server closed the connection")
+        status = int(status_line.split()[1])
+        headers: Dict[str, str] = {}
+        while True:
+            line = await self._reader.readline()
+            if line in (b"\r\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        if headers.get("transfer-encoding") == "chunked":
+            parts = []
+            while True:
+                size = int((await self._reader.readline()).strip(), 16)
+                if size == 0:
+                    await self._reader.readline()
+                    break
+                parts.append(await self._reader.readexactly(size))
+                await self._reader.readline()
+            payload = [json.loads(line) for line in b"".join(parts).splitlines() if line]
+        else:
+            raw = await self._reader.readexactly(int(headers.get("content-length", "0")))
+            payload = json.loads(raw) if raw else None
+        if headers.get("connection", "").lower() == "close":
+            await self.close()
+        return status, payload
+
+
+def _percentile(values: List[float], p: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(len(values) * p))], 2)
+
+class Stats:
+    def __init__(self):
+        self.latency_ms: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+
+    def record(self, name: str, ms: float, ok: bool):
+        self.latency_ms.setdefault(name, []).append(ms)
+        if not ok:
+            self.errors[name] = self.errors.get(name, 0) + 1
+
+    def as_dict(self) -> dict:
+        return {name: {"requests": len(ms), "errors": self.errors.get(name, 0),
+                       "p50_ms": _percentile(ms, 0.5), "p95_ms": _percentile(ms, 0.95),
+                       "p99_ms": _percentile(ms, 0.99), "max_ms": round(max(ms), 2)}
+                for name, ms in sorted(self.latency_ms.items())}
+
+
+async def _timed(stats: Stats, name: str, client: ApiClient, method: str, path: str, body=None):
+    t0 = time.perf_counter()
+    try:
+        status, payload = await client.request(method, path, body)
+    except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+        stats.record(name, (time.perf_counter() - t0) * 1000, False)
+        await client.close()
+        return None, None
+    stats.record(name, (time.perf_counter() - t0) * 1000, status < 400)
+    return status, payload
+
+async def _client(host: str, port: int, requests: int, playlist: str, writes: bool, stats: Stats, rng: random.Random):
+    client = ApiClient(host, port)
+    songs = f"/playlists/{quote(playlist, safe='')}/songs"
+    cursor = None
+    for i in range(requests):
+        roll = rng.random()
+        if roll < 0.3:
+            path = songs + "?limit=100" + (f"&after={cursor}" if cursor is not None else "")
+            _, page = await _timed(stats, "page songs", client, "GET", path)
+            cursor = page.get("next") if isinstance(page, dict) else None
+        elif roll < 0.5:
+            await _timed(stats, "search", client, "GET", f"/search?q={quote(rng.choice(['track', 'trak 1', 'tr', 'ack 12']))}&limit=20")
+        elif roll < 0.65:
+            await _timed(stats, "list playlists", client, "GET", "/playlists")
+        elif roll < 0.84:
+            await _timed(stats, "player state", client, "GET", "/player")
+        elif roll < 0.85:
+            # Whole playlist in one response; rare, as clients mostly page
+            await _timed(stats, "stream songs", client, "GET", songs + "?stream=1")
+        elif writes:
+            status, song = await _timed(stats, "add song", client, "POST", songs,
+                                        {"path": f"/loadtest/{rng.getrandbits(48):x}.mp3"})
+            if status == 201:
+                await _timed(stats, "delete song", client, "DELETE", f"{songs}/{song['position']}")
+        else:
+            await _timed(stats, "get playlist", client, "GET", f"/playlists/{quote(playlist, safe='')}")
+    await client.close()
+
+async def _watch_playback(host: str, port: int, done: asyncio.Event, seen: List[str]):
+    client = ApiClient(host, port)
+    while not done.is_set():
+        _, state = await client.request("GET", "/player")
+        if isinstance(state, dict):
+            seen.append(state.get("state"))
+        await asyncio.sleep(0.05)
+    await client.close()
+
+async def run(host: str, port: int, clients: int, requests: int, playlist: str, writes: bool,
+              play_path: Optional[str] = None) -> dict:
+    stats = Stats()
+    rng = random.Random(42)
+    control = ApiClient(host, port)
+    playing = None
+    if play_path is not None:
+        _, page = await control.request("GET", f"/playlists/{quote(playlist, safe='')}/songs?limit=1")
+        status, _ = await control.request("POST", "/player/play",
+                                          {"playlist": playlist, "position": page["songs"][0]["position"]})
+        playing = status == 200
+        await asyncio.sleep(0.5)
+    done = asyncio.Event()
+    seen: List[str] = []
+    watcher = asyncio.ensure_future(_watch_playback(host, port, done, seen)) if playing else None
+    t0 = time.perf_counter()
+    await asyncio.gather(*(_client(host, port, requests, playlist, writes, stats, random.Random(rng.random()))
+                           for _ in range(clients)))
+    elapsed = time.perf_counter() - t0
+    done.set()
+    if watcher is not None:
+        await watcher
+        await control.request("POST", "/player/stop")
+    await control.close()
+    total = sum(len(ms) for ms in stats.latency_ms.values())
+    report = {"clients": clients, "requests": total, "seconds": round(elapsed, 2),
+              "requests_per_s": round(total / elapsed, 1), "endpoints": stats.as_dict()}
+    if playing is not None:
+        # Playback kept going through the whole run if every sample says so
+        report["playback_samples"] = len(seen)
+        report["playback_uninterrupted"] = bool(seen) and all(state == "playing" for state in seen)
+    return report
+
+
+def _write_silence(path: str, seconds: int):
+    with wave.open(path, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(8000)
+        w.writeframes(b"\0\0" * 8000 * seconds)
+
+def build_scratch_db(folder: str, n_songs: int) -> Tuple[str, str]:
+    # A library of n_songs in one playlist; the first song is a real (silent)
+    # file so playback can run during the test
+    db_path = os.path.join(folder, "playlist.db")
+    database.init_db(db_path)
+    play_path = os.path.join(folder, "silence.wav")
+    _write_silence(play_path, SILENCE_SECONDS)
+    pm = PlaylistManager()
+    pm.create_playlist(LOADTEST_PLAYLIST)
+    pl = pm.playlists[LOADTEST_PLAYLIST]
+    pl.add_song("Silence", play_path)
+    for i in range(1, n_songs):
+        pl.add_song(f"Track {i}", f"/music/library/artist_{i % 500}/track_{i}.mp3")
+    database.save_all_playlists(pm, db_path)
+    return db_path, play_path
+
+async def _wait_for_port(host: str, port: int, timeout: float):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            _, writer = await asyncio.open_connection(host, port)
+            writer.close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.1)
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Load-test the local JSON API")
+    parser.add_argument("--host", default=server.HOST)
+    parser.add_argument("--port", type=int, default=server.PORT)
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=50, help="requests per client")
+    parser.add_argument("--playlist", default=LOADTEST_PLAYLIST, help="playlist to page, stream and edit")
+    parser.add_argument("--writes", action="store_true", help="also add and delete songs")
+    parser.add_argument("--spawn", type=int, metavar="SONGS",
+                        help="start server.py on a scratch database of this many songs and play during the test")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    proc = None
+    play_path = None
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.spawn:
+            db_path, play_path = build_scratch_db(tmp, args.spawn)
+            proc = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(__file__), "server.py"),
+                                     "--port", str(args.port), "--db", db_path, "--silent"],
+                                    stdout=subprocess.DEVNULL)
+        try:
+            if proc is not None:
+                asyncio.run(_wait_for_port(args.host, args.port, 30.0))
+            report = asyncio.run(run(args.host, args.port, args.clients, args.requests,
+                                     args.playlist, args.writes, play_path))
+        finally:
+            if proc is not None:
+                proc.terminate()
+                proc.wait(10)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 0 if not any(ep["errors"] for ep in report["endpoints"].values()) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,24 +1,133 @@
-import tkinter as tk
+import time
+BOOT_START = time.perf_counter()
+import argparse
+import json
 import os
-from database import init_db, load_all_playlists, save_all_playlists
+import threading
+import tkinter as tk
+from tkinter import messagebox
+import database
+import library
+from database import init_db
+from history import PlayHistory
+from journal import JournalLog, UndoHistory
+from persistence import PersistenceService
+from smart import SmartEngine
+from store import SqliteStore
 from player import MusicPlayer
-from gui import GUIManager
+from startup import StartupTimer
+
+# How often the Tk thread checks whether the loader thread is done
+LOAD_POLL_MS = 15
 
 def ensure_directories():
     base = os.path.dirname(os.path.dirname(__file__))
     for folder in ["songs", "assets", "database"]:
         os.makedirs(os.path.join(base, folder), exist_ok=True)
 
-def main():
+def load_data(timer: StartupTimer, db_path: str) -> dict:
+    # Runs on a background thread while the splash is up and the UI modules
+    # import; nothing here touches Tk, and pm is not shared until it returns
     ensure_directories()
-    init_db()
+    init_db(db_path)
+    timer.mark("database")
+    store = SqliteStore(db_path)
+    pm = store.load()  # PlaylistManager with all playlists
+    timer.mark("playlists")
+    journal = JournalLog(os.path.join(os.path.dirname(db_path), "journal.log"))
+    persistence = PersistenceService(on_commit=journal.checkpoint, store=store)
+
+    def sync():
+        # Smart playlists are evaluated in SQL, so pending edits go first
+        persistence.schedule(pm)
+        persistence.flush()
+
+    smart = SmartEngine(pm, sync=sync, db_path=db_path)
+    # Edits the last session made after its final save are replayed from the journal
+    journal.recover(pm, store.seq())
+    journal.attach(pm)
+    history = UndoHistory(pm)
+    persistence.schedule(pm)
+    plays = PlayHistory(db_path)
+    plays.reload()
+    # numpy comes with the analysis module; import it here, off the Tk thread
+    from analysis import AnalysisCache
+    analysis = AnalysisCache(db_path)
+    analysis.reload()
+    timer.mark("analysis")
+    return {"db_path": db_path, "pm": pm, "journal": journal, "persistence": persistence, "smart": smart,
+            "history": history, "plays": plays, "analysis": analysis}
 
-    pm = load_all_playlists()  # PlaylistManager with all playlists
-    player = MusicPlayer()
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Music Playlist Manager")
+    parser.add_argument("--startup-report", metavar="PATH",
+                        help="write boot stage timings (ms) to PATH as JSON and quit once interactive")
+    parser.add_argument("--library", help="library name (default: main); a new name creates it")
+    parser.add_argument("--db", help="database file (default: database/playlist.db); the journal sits beside it")
+    args = parser.parse_args(argv)
+    db_path = database.DB_PATH
+    if args.db:
+        db_path = os.path.abspath(args.db)
+    elif args.library:
+        try:
+            db_path = library.resolve_library(args.library, create=True)
+        except ValueError as e:
+            parser.error(str(e))
+    timer = StartupTimer(BOOT_START)
 
+    # The window comes first, with a splash, before anything slow happens
     root = tk.Tk()
-    app = GUIManager(root, pm, player, db_save_callback=save_all_playlists)
-    root.mainloop()
+    root.title("Music Playlist Manager")
+    splash = tk.Label(root, text="Loading playlists ...", font=("Segoe UI", 16), padx=60, pady=40)
+    splash.pack(expand=True, fill="both")
+    root.update()
+    timer.mark("window")
+
+    loaded = {}
+
+    def load():
+        try:
+            loaded.update(load_data(timer, db_path))
+        except Exception as e:
+            loaded["error"] = e
+
+    loader = threading.Thread(target=load, name="boot-loader", daemon=True)
+    loader.start()
+    # ttkbootstrap and the rest of the UI import while the data loads
+    from gui import GUIManager
+    timer.mark("ui_modules")
+
+    def finish_boot():
+        if loader.is_alive():
+            root.after(LOAD_POLL_MS, finish_boot)
+            return
+        if "error" in loaded:
+            messagebox.showerror("Error", f"Could not load the library: {loaded['error']}")
+            root.destroy()
+            return
+        timer.mark("data")
+        app = GUIManager(root, loaded["pm"], MusicPlayer(), db_save_callback=loaded["persistence"].schedule,
+                         history=loaded["history"], smart=loaded["smart"], analysis=loaded["analysis"],
+                         play_history=loaded["plays"], startup=timer, db_path=loaded["db_path"])
+        splash.destroy()
+        root.update_idletasks()
+        timer.mark("interactive")
+        if args.startup_report:
+            with open(args.startup_report, "w") as f:
+                json.dump(timer.as_dict(), f)
+            root.after_idle(app.on_exit)
+
+    root.after(0, finish_boot)
+    try:
+        root.mainloop()
+    finally:
+        loader.join()
+        # Wait for queued writes to become durable before the process exits
+        if "persistence" in loaded:
+            loaded["persistence"].close()
+            loaded["journal"].close()
+        if "plays" in loaded:
+            loaded["plays"].close()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,123 @@
+import sqlite3
+import sys
+import threading
+import time
+import traceback
+from typing import Callable, List, Optional
+from playlist import PlaylistManager, ChangeSet
+from store import PlaylistStore, SqliteStore
+
+# Mutations arriving within this window share one transaction
+DEBOUNCE_SECONDS = 0.25
+# ...but a steady stream of edits is still written at least this often
+MAX_DELAY_SECONDS = 2.0
+RETRY_SECONDS = 1.0
+
+class PersistenceService:
+    def __init__(self, db_path: Optional[str] = None, debounce: float = DEBOUNCE_SECONDS,
+                 on_commit: Optional[Callable[[int], None]] = None, store: Optional[PlaylistStore] = None):
+        # Batches are written to store, the SQLite database at db_path by
+        # default; the service closes it when it is done
+        self.store = store if store is not None else SqliteStore(db_path)
+        self.debounce = debounce
+        # Called on the worker thread with the journal seq of each committed batch
+        self.on_commit = on_commit
+        self.last_error: Optional[BaseException] = None
+        # Failed write attempts so far; flush() gives up when one happens
+        self._failures = 0
+        self._pending: List[ChangeSet] = []
+        self._in_flight = 0
+        self._closing = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="persistence", daemon=True)
+        self._thread.start()
+
+    def schedule(self, pm: PlaylistManager):
+        # Called on the Tk thread: snapshot the deltas now, write them later
+        changes = pm.collect_changes()
+        if changes.is_empty():
+            return
+        with self._cond:
+            self._pending.append(changes)
+            self._cond.notify_all()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        # Block until everything scheduled so far is committed. False when the
+        # timeout runs out or a write fails meanwhile (see last_error); the
+        # batch stays queued and is retried.
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._cond.notify_all()
+            failures = self._failures
+            while self._pending or self._in_flight:
+                if self._failures != failures or not self._thread.is_alive():
+                    return False
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self, timeout: Optional[float] = None) -> bool:
+        # False, after reporting them, when some changes could not be written;
+        # the journal still has them for the next start to replay
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        with self._cond:
+            unwritten = list(self._pending)
+        if not unwritten and not self._thread.is_alive():
+            return True
+        print(f"persistence: {len(unwritten)} change set(s) up to journal seq "
+              f"{max((changes.seq for changes in unwritten), default=0)} were not written"
+              f"{f': {self.last_error}' if self.last_error else ''}", file=sys.stderr)
+        return False
+
+    def _take_batch(self) -> Optional[List[ChangeSet]]:
+        with self._cond:
+            while not self._pending and not self._closing:
+                self._cond.wait()
+            if not self._pending:
+                return None
+            # Coalesce: wait for the burst of edits to settle
+            first_seen = time.monotonic()
+            seen = len(self._pending)
+            while not self._closing:
+                self._cond.wait(self.debounce)
+                if len(self._pending) == seen or time.monotonic() - first_seen >= MAX_DELAY_SECONDS:
+                    break
+                seen = len(self._pending)
+            batch, self._pending = self._pending, []
+            self._in_flight = len(batch)
+            return batch
+
+    def _run(self):
+        try:
+            while True:
+                batch = self._take_batch()
+                if batch is None:
+                    return
+                try:
+                    self.store.apply(batch)
+                    self.last_error = None
+                except (sqlite3.Error, OSError) as e:
+                    # Keep the batch at the front and retry; nothing is dropped
+                    self.last_error = e
+                    traceback.print_exc(file=sys.stderr)
+                    with self._cond:
+                        self._pending[:0] = batch
+                        self._in_flight = 0
+                        self._failures += 1
+                        self._cond.notify_all()
+                        if self._closing:
+                            return
+                        self._cond.wait(RETRY_SECONDS)
+                    continue
+                if self.on_commit:
+                    self.on_commit(max(changes.seq for changes in batch))
+                with self._cond:
+                    self._in_flight = 0
+                    self._cond.notify_all()
+        finally:
+            self.store.close()
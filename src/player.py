@@ -1,25 +1,384 @@
-import pygame
+import io
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, List, Optional, Tuple
+from playlist import Playlist, SongNode
+
+# Loading pygame (SDL) and opening the mixer take a while, so neither happens
+# until the worker thread gets its first command
+pygame = None
+
+POLL_SECONDS = 0.02
+# Files larger than this are streamed from disk instead of pre-buffered in memory
+PREBUFFER_MAX_BYTES = 64 * 1024 * 1024
+# How long to wait for the mixer to report a position after play()
+FIRST_AUDIO_TIMEOUT = 1.0
+
+
+class PlaybackMetrics:
+    def __init__(self):
+        self.load_ms: List[float] = []
+        self.first_audio_ms: List[float] = []
+        self.prebuffer_hits = 0
+        self.prebuffer_misses = 0
+
+    def record(self, load_ms: float, first_audio_ms: Optional[float]):
+        self.load_ms = (self.load_ms + [load_ms])[-100:]
+        if first_audio_ms is not None:
+            self.first_audio_ms = (self.first_audio_ms + [first_audio_ms])[-100:]
+
+    def as_dict(self) -> dict:
+        def avg(xs):
+            return round(sum(xs) / len(xs), 2) if xs else None
+        return {
+            "load_ms_avg": avg(self.load_ms),
+            "first_audio_ms_avg": avg(self.first_audio_ms),
+            "first_audio_ms_last": round(self.first_audio_ms[-1], 2) if self.first_audio_ms else None,
+            "prebuffer_hits": self.prebuffer_hits,
+            "prebuffer_misses": self.prebuffer_misses,
+        }
+
+
+def _read_file(path: str) -> Optional[io.BytesIO]:
+    if os.path.getsize(path) > PREBUFFER_MAX_BYTES:
+        return None
+    with open(path, "rb") as f:
+        return io.BytesIO(f.read())
+
+
+def _load_pygame():
+    global pygame
+    if pygame is None:
+        import pygame as module
+        module.mixer.init()
+        pygame = module
+
 
 class MusicPlayer:
+    # All mixer calls happen on one worker thread, so loading a large file never
+    # blocks the Tk thread. The worker never touches a playlist: poll_events(),
+    # called on the thread that owns the playlists (Tk or the API loop), picks
+    # the next song and sends it down with the play commands. While a track
+    # plays, the next one is read into memory in the background and queued in
+    # the mixer, which starts it the moment the current one ends. The two
+    # threads share no state: the worker keeps its own, and what it does comes
+    # back as events that poll_events() applies to the public fields. Each
+    # play or stop starts a new generation, so events about an older one
+    # (e.g. a gapless switch that crossed a click on another song) never
+    # overwrite what the owner asked for since.
     def __init__(self):
-        pygame.mixer.init()
-        self.current_path = None
+        # Owner thread only
+        self.current_path: Optional[str] = None
+        self.current_node: Optional[SongNode] = None
+        self.playlist: Optional[Playlist] = None
+        self.metrics = PlaybackMetrics()
+        # Picks the track after `node`; follows the playlist's play mode
+        self.next_node: Callable[[Playlist, SongNode], Optional[SongNode]] = lambda pl, node: pl.traversal.peek_next(node)
+        # Loudness normalization: dB to apply to a path, None when unknown
+        self.gain_for: Callable[[str], Optional[float]] = lambda path: None
+        self.volume = 1.0
 
+        self._events: "queue.Queue[Tuple]" = queue.Queue()
+        self._commands: "queue.Queue[Tuple]" = queue.Queue()
+        # Owner thread: the generation asked for, whether its track is
+        # sounding, the (playlist, song) it started and the song sent as next
+        self._generation = 0
+        self._sounding = False
+        self._pause_requested = False
+        self._playing: Optional[Tuple[Playlist, SongNode]] = None
+        self._prepared: Optional[SongNode] = None
+        # Worker thread: the track in the mixer and its generation, the song to
+        # follow, its file being read, and what the mixer has queued (the mixer
+        # can replace its queue but not empty it)
+        self._track: Optional[Tuple[Optional[Playlist], Optional[SongNode], str]] = None
+        self._track_generation = 0
+        self._active = False
+        self._paused = False
+        self._next: Optional[Tuple[Playlist, SongNode, str]] = None
+        self._prefetch = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prebuffer")
+        self._prebuffered: Optional[Tuple[str, Future]] = None
+        self._queued: Optional[Tuple[Playlist, SongNode, str]] = None
+        self._last_pos = 0
+        # (loaded, requested) until the mixer reports a position
+        self._awaiting_audio: Optional[Tuple[float, float]] = None
+        self._thread = threading.Thread(target=self._run, name="player", daemon=True)
+        self._thread.start()
+
+    # ===== Public API (owner thread) =====
     def play(self, path: str):
-        self.stop()
-        pygame.mixer.music.load(path)
-        pygame.mixer.music.play()
-        self.current_path = path
+        self._request(None, None, path)
+
+    def play_node(self, pl: Playlist, node: SongNode):
+        self._request(pl, node, node.filepath)
+
+    def _request(self, pl: Optional[Playlist], node: Optional[SongNode], path: str):
+        self._generation += 1
+        self.playlist, self.current_node, self.current_path = pl, node, path
+        self._pause_requested = False
+        self._commands.put(("play", pl, node, path, time.perf_counter(), self._generation))
 
     def pause(self):
-        pygame.mixer.music.pause()
+        self._pause_requested = True
+        self._commands.put(("pause",))
 
     def resume(self):
-        pygame.mixer.music.unpause()
+        self._pause_requested = False
+        self._commands.put(("resume",))
 
     def stop(self):
-        pygame.mixer.music.stop()
-        self.current_path = None
+        self._generation += 1
+        self.playlist = self.current_node = self.current_path = None
+        self._sounding = False
+        self._playing = self._prepared = None
+        self._commands.put(("stop",))
 
     def is_playing(self) -> bool:
-        return pygame.mixer.music.get_busy()
+        return self._sounding and not self._pause_requested
+
+    def poll_events(self) -> List[Tuple]:
+        # ("start", playlist, node) / ("end", playlist, node, finished_naturally) / ("error", path, exc).
+        # Call on the thread that owns the playlists: this is where the next
+        # song is picked, after a track ran out or whenever edits or the play
+        # mode changed what follows the one playing.
+        out = []
+        while True:
+            try:
+                event = self._events.get_nowait()
+            except queue.Empty:
+                break
+            kind, current = event[0], event[-1] == self._generation
+            if kind == "start":
+                _, pl, node, path, _ = event
+                if current:
+                    self.playlist, self.current_node, self.current_path = pl, node, path
+                    self._sounding = True
+                    self._playing = (pl, node) if pl is not None and node is not None else None
+                    self._prepared = None
+                    if self._playing is not None and pl.contains(node):
+                        pl.traversal.started(node)
+                out.append(("start", pl, node))
+            elif kind == "end":
+                if current:
+                    self._sounding = False
+                    self._playing = None
+                out.append(event[:4])
+            elif kind == "idle":
+                if current:
+                    self._advance(event[1], event[2])
+            else:
+                if current:
+                    self._sounding = False
+                    self._playing = None
+                out.append(event[:3])
+        self._prepare_next()
+        return out
+
+    def shutdown(self):
+        self._commands.put(("quit",))
+        self._thread.join(2.0)
+        self._prefetch.shutdown(wait=False)
+
+    # ===== Owner thread =====
+    def _advance(self, pl: Optional[Playlist], node: Optional[SongNode]):
+        # The track ran out with nothing queued after it
+        nxt = self.next_node(pl, node) if pl is not None and node is not None and pl.contains(node) else None
+        if nxt is None:
+            self.current_path = None
+            self.current_node = None
+            return
+        self.play_node(pl, nxt)
+
+    def _prepare_next(self):
+        playing = self._playing
+        if playing is None:
+            return
+        pl, node = playing
+        nxt = self.next_node(pl, node) if pl.contains(node) else None
+        if nxt is not self._prepared:
+            self._prepared = nxt
+            self._commands.put(("prepare", pl, node, nxt, nxt.filepath if nxt is not None else None,
+                                self._generation))
+
+    # ===== Worker thread =====
+    def _run(self):
+        while True:
+            try:
+                cmd = self._commands.get(timeout=POLL_SECONDS)
+            except queue.Empty:
+                if pygame is not None:
+                    self._tick()
+                continue
+            kind = cmd[0]
+            if kind == "quit" and pygame is None:
+                return
+            try:
+                _load_pygame()
+            except Exception as e:
+                # e.g. no audio device; the next command tries again
+                if kind == "play":
+                    self._events.put(("error", cmd[3], e, cmd[5]))
+                else:
+                    self._events.put(("error", "mixer", e, self._track_generation))
+                continue
+            if kind == "play":
+                _, pl, node, path, requested, generation = cmd
+                self._finish_current(naturally=False)
+                self._track_generation = generation
+                self._start(pl, node, path, requested)
+            elif kind == "prepare":
+                self._prepare(*cmd[1:])
+            elif kind == "pause":
+                pygame.mixer.music.pause()
+                self._paused = True
+            elif kind == "resume":
+                pygame.mixer.music.unpause()
+                self._paused = False
+            elif kind == "stop":
+                self._finish_current(naturally=False)
+                # Also drops whatever the mixer has queued
+                pygame.mixer.music.stop()
+                self._track = None
+            elif kind == "quit":
+                pygame.mixer.music.stop()
+                return
+
+    def _start(self, pl: Optional[Playlist], node: Optional[SongNode], path: str, requested: float):
+        source = self._take_prebuffered(path)
+        # A new load drops the mixer's queue
+        self._next = self._queued = None
+        try:
+            if source is not None:
+                pygame.mixer.music.load(source, os.path.basename(path))
+            else:
+                pygame.mixer.music.load(path)
+            pygame.mixer.music.set_volume(self._track_volume(path))
+            pygame.mixer.music.play()
+        except (pygame.error, OSError) as e:
+            self._active = False
+            self._track = None
+            self._events.put(("error", path, e, self._track_generation))
+            return
+        loaded = time.perf_counter()
+        self._started(pl, node, path)
+        # First audio is measured by _tick, so pause and stop are not held up
+        self._awaiting_audio = (loaded, requested)
+
+    def _started(self, pl: Optional[Playlist], node: Optional[SongNode], path: str):
+        self._track = (pl, node, path)
+        self._active, self._paused = True, False
+        self._last_pos = 0
+        self._events.put(("start", pl, node, path, self._track_generation))
+
+    def _track_volume(self, path: str) -> float:
+        # The mixer cannot amplify, so positive gains are capped at full volume
+        gain = self.gain_for(path)
+        if gain is None:
+            return self.volume
+        return max(0.0, min(1.0, self.volume * 10 ** (gain / 20.0)))
+
+    def _prepare(self, pl: Playlist, after: SongNode, nxt: Optional[SongNode], path: Optional[str],
+                 generation: int):
+        # Picked by the owner thread for the song playing then; stale once the
+        # worker has moved on
+        if (generation != self._track_generation or not self._active or self._track is None
+                or self._track[1] is not after):
+            return
+        self._next = (pl, nxt, path) if nxt is not None else None
+        if nxt is None:
+            self._prebuffered = None
+            return
+        if not (self._prebuffered and self._prebuffered[0] == path):
+            self._prebuffered = (path, self._prefetch.submit(_read_file, path))
+
+    def _take_prebuffered(self, path: str) -> Optional[io.BytesIO]:
+        pending, self._prebuffered = self._prebuffered, None
+        if pending is None or pending[0] != path or not pending[1].done():
+            self.metrics.prebuffer_misses += 1
+            return None
+        try:
+            data = pending[1].result()
+        except OSError:
+            data = None
+        if data is None:
+            self.metrics.prebuffer_misses += 1
+        else:
+            self.metrics.prebuffer_hits += 1
+        return data
+
+    def _finish_current(self, naturally: bool):
+        if self._active and self._track is not None:
+            self._events.put(("end", self._track[0], self._track[1], naturally, self._track_generation))
+        self._active = False
+        self._paused = False
+        self._awaiting_audio = None
+
+    def _tick(self):
+        if self._awaiting_audio is not None:
+            loaded, requested = self._awaiting_audio
+            now = time.perf_counter()
+            if pygame.mixer.music.get_pos() > 0:
+                self._awaiting_audio = None
+                self.metrics.record((loaded - requested) * 1000, (now - requested) * 1000)
+            elif now - loaded > FIRST_AUDIO_TIMEOUT:
+                self._awaiting_audio = None
+                self.metrics.record((loaded - requested) * 1000, None)
+        if not self._active or self._paused:
+            return
+        if self._next is not None and self._queued is not self._next:
+            self._queue_next()
+        if not pygame.mixer.music.get_busy():
+            self._ran_out()
+            return
+        # pygame has no event for a queued track starting that works without a
+        # display (set_endevent posts to the SDL event queue, which needs the
+        # video system and the main thread). Instead this relies on pygame's
+        # music.c resetting the position it reports when its "music finished"
+        # hook starts the queued track, so get_pos() drops back towards 0. That
+        # is how pygame 2 behaves (checked on 2.6 with SDL_mixer 2.8) but it is
+        # not documented; were it to change, the switch would go unseen until
+        # the queued track ends and _ran_out() hands over as usual.
+        pos = pygame.mixer.music.get_pos()
+        if self._queued is not None and pos < self._last_pos:
+            if self._queued is not self._next:
+                # What was queued is no longer what follows; stop it and let
+                # the owner thread start the right song
+                pygame.mixer.music.stop()
+                self._ran_out()
+                return
+            # The mixer went on to the queued track without a gap
+            pl, node, path = self._queued
+            self._finish_current(naturally=True)
+            self._next = self._queued = None
+            pygame.mixer.music.set_volume(self._track_volume(path))
+            self._started(pl, node, path)
+            self.metrics.record(0.0, 0.0)
+            return
+        self._last_pos = pos
+
+    def _ran_out(self):
+        # Nothing (wanted) was queued: the owner thread picks what follows
+        pl, node, _ = self._track
+        self._finish_current(naturally=True)
+        self._next = self._queued = None
+        self._track = None
+        self._events.put(("idle", pl, node, self._track_generation))
+
+    def _queue_next(self):
+        path = self._next[2]
+        pending = self._prebuffered
+        if pending is None or pending[0] != path or not pending[1].done():
+            return
+        source = self._take_prebuffered(path)
+        try:
+            if source is not None:
+                pygame.mixer.music.queue(source, os.path.basename(path))
+            else:
+                pygame.mixer.music.queue(path)
+        except (pygame.error, OSError):
+            # Left to the owner thread when this track runs out
+            self._next = None
+            return
+        self._queued = self._next
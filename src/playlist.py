@@ -1,88 +1,659 @@
-from typing import Optional, Dict, List
+from typing import Any, Optional, Dict, List, Tuple, Iterator, Iterable, Union, Callable
+from catalog import Track, TrackCatalog
+
+# Songs carry gapped integer order labels, so two nodes can be compared and a
+# node found by label in O(1) without walking the list
+POSITION_GAP = 1024
+# Smallest label spacing a crowded range is spread out to when relabeling
+MIN_SPREAD = 16
+
+# Orders for Playlist.sort_by; play history adds its own (see history.py)
+SORT_KEYS: Dict[str, Callable[["SongNode"], Any]] = {
+    "title": lambda node: (node.title.casefold(), node.filepath),
+    "path": lambda node: node.filepath,
+}
+
+# An index bucket holds a single node, or a dict used as an ordered set once a
+# key is shared, so unique titles and tracks cost no extra container
+Bucket = Union["SongNode", Dict["SongNode", None]]
+
+def _bucket_add(index: Dict, key, node: "SongNode"):
+    bucket = index.get(key)
+    if bucket is None:
+        index[key] = node
+    elif isinstance(bucket, dict):
+        bucket[node] = None
+    else:
+        index[key] = {bucket: None, node: None}
+
+def _bucket_remove(index: Dict, key, node: "SongNode"):
+    bucket = index[key]
+    if isinstance(bucket, dict):
+        del bucket[node]
+        if len(bucket) == 1:
+            index[key] = next(iter(bucket))
+    else:
+        del index[key]
+
+def _bucket_nodes(index: Dict, key) -> Tuple["SongNode", ...]:
+    bucket = index.get(key)
+    if bucket is None:
+        return ()
+    if isinstance(bucket, dict):
+        return tuple(bucket)
+    return (bucket,)
 
 class SongNode:
-    def __init__(self, title: str, filepath: str):
-        self.title: str = title
-        self.filepath: str = filepath
+    __slots__ = ("id", "track", "position", "prev", "next")
+
+    def __init__(self, track: Track, song_id: Optional[int] = None):
+        self.id: Optional[int] = song_id
+        # Title and path live on the shared catalog Track
+        self.track: Track = track
+        self.position: int = 0
         self.prev: Optional["SongNode"] = None
         self.next: Optional["SongNode"] = None
 
+    @property
+    def title(self) -> str:
+        return self.track.title
+
+    @property
+    def filepath(self) -> str:
+        return self.track.path
+
+class ChangeSet:
+    def __init__(self):
+        # ("create", id, name, rules) / ("rename", id, name) / ("drop", id), in
+        # mutation order; rules is None except for smart playlists
+        self.playlist_ops: List[Tuple] = []
+        # (id, path, title, size, mtime, hash)
+        self.track_inserts: List[Tuple] = []
+        # (path, size, mtime, hash, id)
+        self.track_updates: List[Tuple] = []
+        # (missing, id)
+        self.track_missing: List[Tuple[int, int]] = []
+        # (id, playlist_id, track_id, position)
+        self.inserts: List[Tuple[int, int, int, int]] = []
+        self.deletes: List[int] = []
+        # (position, id)
+        self.moves: List[Tuple[int, int]] = []
+        # Journal sequence number of the last mutation included
+        self.seq: int = 0
+
+    def is_empty(self) -> bool:
+        return not (self.playlist_ops or self.inserts or self.deletes or self.moves
+                    or self.track_inserts or self.track_updates or self.track_missing)
+
+class ChangeTracker:
+    def __init__(self):
+        self.next_playlist_id: int = 1
+        self.next_song_id: int = 1
+        self.next_track_id: int = 1
+        # Every mutation gets the next sequence number and is passed to each
+        # listener as (seq, kind, playlist, *details)
+        self.seq: int = 0
+        self.listeners: List[Callable[..., None]] = []
+        self._tracks_added: Dict[int, Track] = {}
+        self._tracks_updated: Dict[int, Track] = {}
+        self._tracks_missing: Dict[int, bool] = {}
+        self._playlist_ops: List[Tuple] = []
+        self._dropped: set = set()
+        self._added: Dict[int, Tuple["Playlist", SongNode]] = {}
+        self._deleted: List[int] = []
+        self._moved: Dict[int, Tuple["Playlist", SongNode]] = {}
+
+    def reserve_ids(self, max_playlist_id: int, max_song_id: int, max_track_id: int = 0):
+        self.next_playlist_id = max(self.next_playlist_id, max_playlist_id + 1)
+        self.next_song_id = max(self.next_song_id, max_song_id + 1)
+        self.next_track_id = max(self.next_track_id, max_track_id + 1)
+
+    def track_added(self, track: Track):
+        track.id = self.next_track_id
+        self.next_track_id += 1
+        self._tracks_added[track.id] = track
+
+    def track_updated(self, track: Track):
+        if track.id not in self._tracks_added:
+            self._tracks_updated[track.id] = track
+
+    def track_relocated(self, track: Track, old_path: str):
+        # Track events go to listeners with no playlist: (seq, kind, None, track, ...)
+        self.track_updated(track)
+        self._emit("relocate", None, track, old_path)
+
+    def track_missing(self, track: Track, missing: bool):
+        self._tracks_missing[track.id] = missing
+        self._emit("missing", None, track, missing)
+
+    def _emit(self, *event):
+        self.seq += 1
+        for listener in self.listeners:
+            listener(self.seq, *event)
+
+    def playlist_created(self, pl: "Playlist"):
+        pl.id = self.next_playlist_id
+        self.next_playlist_id += 1
+        self._playlist_ops.append(("create", pl.id, pl.name, pl.rules))
+        self._emit("create", pl)
+
+    def playlist_restored(self, pl: "Playlist"):
+        # A dropped playlist comes back with its id and songs
+        self._playlist_ops.append(("create", pl.id, pl.name, pl.rules))
+        self._dropped.discard(pl.id)
+        self._emit("create", pl)
+        if pl.rules is None:
+            for node in pl:
+                self.song_restored(pl, node)
+
+    def playlist_renamed(self, pl: "Playlist", old_name: str):
+        self._playlist_ops.append(("rename", pl.id, pl.name))
+        self._emit("rename", pl, old_name)
+
+    def playlist_dropped(self, pl: "Playlist"):
+        self._playlist_ops.append(("drop", pl.id))
+        self._dropped.add(pl.id)
+        self._emit("drop", pl)
+
+    def song_added(self, pl: "Playlist", node: SongNode):
+        node.id = self.next_song_id
+        self.next_song_id += 1
+        self._added[node.id] = (pl, node)
+        self._emit("add", pl, node)
+
+    def song_restored(self, pl: "Playlist", node: SongNode):
+        # A removed node linked back in keeps its id; a pending delete of the
+        # same id is applied before the insert
+        self._added[node.id] = (pl, node)
+        self._emit("add", pl, node)
+
+    def _record_removed(self, node: SongNode):
+        # Songs added and removed between two flushes never reach the store
+        if self._added.pop(node.id, None) is None:
+            self._moved.pop(node.id, None)
+            self._deleted.append(node.id)
+
+    def song_removed(self, pl: "Playlist", node: SongNode, prev: Optional[SongNode]):
+        self._record_removed(node)
+        self._emit("remove", pl, node, prev)
+
+    def songs_removed(self, pl: "Playlist", removed: List[Tuple[SongNode, Optional[SongNode]]]):
+        # A batch of (node, prev) in removal order, passed on as one event
+        for node, _ in removed:
+            self._record_removed(node)
+        self._emit("remove_many", pl, removed)
+
+    def songs_reordered(self, pl: "Playlist", old_order: List[SongNode]):
+        # The new labels were recorded one by one with song_relabeled
+        self._emit("reorder", pl, old_order)
+
+    def songs_cleared(self, pl: "Playlist", state: Tuple):
+        node = state[0]
+        while node:
+            self._record_removed(node)
+            node = node.next
+        self._emit("clear", pl, state)
+
+    def song_relabeled(self, pl: "Playlist", node: SongNode):
+        # Pending inserts already carry the node's latest position
+        if node.id not in self._added:
+            self._moved[node.id] = (pl, node)
+
+    def song_moved(self, pl: "Playlist", node: SongNode, old_prev: Optional[SongNode]):
+        self.song_relabeled(pl, node)
+        self._emit("move", pl, node, old_prev)
+
+    def collect(self) -> ChangeSet:
+        changes = ChangeSet()
+        changes.seq = self.seq
+        changes.playlist_ops = self._playlist_ops
+        changes.deletes = self._deleted
+        changes.track_inserts = [
+            (t.id, t.path, t.title, t.size, t.mtime, t.hash) for t in self._tracks_added.values()
+        ]
+        changes.track_updates = [
+            (t.path, t.size, t.mtime, t.hash, t.id) for t in self._tracks_updated.values()
+        ]
+        changes.track_missing = [(int(missing), tid) for tid, missing in self._tracks_missing.items()]
+        changes.inserts = [
+            (node.id, pl.id, node.track.id, node.position)
+            for pl, node in self._added.values()
+            if pl.id not in self._dropped
+        ]
+        changes.moves = [
+            (node.position, node.id)
+            for pl, node in self._moved.values()
+            if pl.id not in self._dropped
+        ]
+        self.clear()
+        return changes
+
+    def clear(self):
+        self._playlist_ops = []
+        self._dropped = set()
+        self._added = {}
+        self._deleted = []
+        self._moved = {}
+        self._tracks_added = {}
+        self._tracks_updated = {}
+        self._tracks_missing = {}
+
+# Yields pages of (song id, position, track id, path, title, size, mtime, hash) rows in playlist order
+SongLoader = Callable[[], Iterable[List[Tuple]]]
+
 class Playlist:
-    def __init__(self, name: str):
+    # Rule text of a smart playlist (see smart.py); None for a hand-built one
+    rules: Optional[str] = None
+
+    def __init__(self, name: str, catalog: Optional[TrackCatalog] = None):
+        self.id: Optional[int] = None
         self.name: str = name
         self.head: Optional[SongNode] = None
         self.tail: Optional[SongNode] = None
         self.length: int = 0
+        self.tracker: Optional[ChangeTracker] = None
+        self.catalog: TrackCatalog = catalog if catalog is not None else TrackCatalog()
+        self._by_title: Dict[str, Bucket] = {}
+        self._by_track: Dict[Track, Bucket] = {}
+        self._by_position: Dict[int, SongNode] = {}
+        self._loader: Optional[SongLoader] = None
+        self._traversal = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._loader is None
+
+    def set_loader(self, count: int, loader: SongLoader):
+        # Defer building nodes until the songs are first needed; length is known up front
+        self.length = count
+        self._loader = loader
+
+    @property
+    def loader(self) -> Optional[SongLoader]:
+        return self._loader
+
+    def ensure_loaded(self):
+        if self._loader is None:
+            return
+        loader, self._loader = self._loader, None
+        self._restore_pages(loader())
+
+    def load_from(self, loader: SongLoader, pages: Iterable[List[Tuple]]) -> bool:
+        # Build the nodes from pages another thread read with loader; False when
+        # the playlist was loaded or invalidated meanwhile
+        if self._loader is not loader:
+            return False
+        self._loader = None
+        self._restore_pages(pages)
+        return True
+
+    def _restore_pages(self, pages: Iterable[List[Tuple]]):
+        self.length = 0
+        for page in pages:
+            for row in page:
+                self.restore_song(row[0], self.catalog.restore(*row[2:]), row[1])
+
+    @property
+    def traversal(self):
+        # Play order (modes, shuffle, history), created on first use
+        if self._traversal is None:
+            from traversal import Traversal
+            self._traversal = Traversal(self)
+        return self._traversal
+
+    def __iter__(self) -> Iterator[SongNode]:
+        self.ensure_loaded()
+        cur = self.head
+        while cur:
+            yield cur
+            cur = cur.next
+
+    def _index(self, node: SongNode):
+        _bucket_add(self._by_title, node.title, node)
+        _bucket_add(self._by_track, node.track, node)
+        self._by_position[node.position] = node
+        if self._traversal is not None:
+            self._traversal.linked(node)
+
+    def _unindex(self, node: SongNode):
+        _bucket_remove(self._by_title, node.title, node)
+        _bucket_remove(self._by_track, node.track, node)
+        del self._by_position[node.position]
+        if self._traversal is not None:
+            self._traversal.unlinked(node)
 
-    def add_song(self, title: str, filepath: str):
-        node = SongNode(title, filepath)
+    def _link_tail(self, node: SongNode):
         if not self.head:
             self.head = self.tail = node
+            if not node.position:
+                node.position = POSITION_GAP
         else:
             assert self.tail is not None
+            if not node.position:
+                node.position = self.tail.position + POSITION_GAP
             self.tail.next = node
             node.prev = self.tail
             self.tail = node
         self.length += 1
+        self._index(node)
 
-    def delete_song(self, title: str) -> bool:
-        cur = self.head
-        while cur:
-            if cur.title == title:
-                if cur.prev:
-                    cur.prev.next = cur.next
-                else:
-                    self.head = cur.next
-                if cur.next:
-                    cur.next.prev = cur.prev
-                else:
-                    self.tail = cur.prev
-                self.length -= 1
-                return True
+    def _link_after(self, prev: Optional[SongNode], node: SongNode):
+        # Link a node that already has its position between prev and prev.next
+        nxt = prev.next if prev else self.head
+        node.prev = prev
+        node.next = nxt
+        if prev:
+            prev.next = node
+        else:
+            self.head = node
+        if nxt:
+            nxt.prev = node
+        else:
+            self.tail = node
+        self.length += 1
+        self._index(node)
+
+    def _position_after(self, prev: Optional[SongNode]) -> int:
+        # A free label between prev and its successor, relabeling nearby songs if crowded
+        nxt = prev.next if prev else self.head
+        lo = prev.position if prev else 0
+        if nxt is None:
+            return lo + POSITION_GAP
+        if nxt.position - lo < 2:
+            self._spread(prev, nxt)
+            lo = prev.position if prev else 0
+        return (lo + nxt.position) // 2
+
+    def _spread(self, left: Optional[SongNode], right: SongNode):
+        # Grow a window around the crowded gap until its label range has room for
+        # MIN_SPREAD per song, then relabel only that window. The window doubles
+        # each round, so the amortized cost per insert is logarithmic.
+        first = left or right
+        last = right
+        count = 2 if left else 1
+        while True:
+            lo = first.prev.position if first.prev else 0
+            if last.next is None:
+                hi = last.position + POSITION_GAP * (count + 1)
+            else:
+                hi = last.next.position
+            if hi - lo >= MIN_SPREAD * (count + 1):
+                break
+            for _ in range(max(1, count // 2)):
+                if first.prev:
+                    first = first.prev
+                    count += 1
+                if last.next:
+                    last = last.next
+                    count += 1
+        step = (hi - lo) // (count + 1)
+        window = []
+        cur = first
+        while True:
+            window.append(cur)
+            del self._by_position[cur.position]
+            if cur is last:
+                break
             cur = cur.next
+        for i, node in enumerate(window, 1):
+            node.position = lo + step * i
+            self._by_position[node.position] = node
+            if self.tracker:
+                self.tracker.song_relabeled(self, node)
+
+    def _unlink(self, node: SongNode):
+        if node.prev:
+            node.prev.next = node.next
+        else:
+            self.head = node.next
+        if node.next:
+            node.next.prev = node.prev
+        else:
+            self.tail = node.prev
+        node.prev = node.next = None
+        self.length -= 1
+        self._unindex(node)
+
+    def add_song(self, title: str, filepath: str) -> SongNode:
+        return self.add_track(self.catalog.get_or_create(title, filepath))
+
+    def add_track(self, track: Track) -> SongNode:
+        self.ensure_loaded()
+        node = SongNode(track)
+        self._link_tail(node)
+        if self.tracker:
+            self.tracker.song_added(self, node)
+        return node
+
+    def insert_after(self, prev: Optional[SongNode], title: str, filepath: str) -> SongNode:
+        # Insert right after prev, or at the head when prev is None
+        self.ensure_loaded()
+        node = SongNode(self.catalog.get_or_create(title, filepath))
+        node.position = self._position_after(prev)
+        self._link_after(prev, node)
+        if self.tracker:
+            self.tracker.song_added(self, node)
+        return node
+
+    def move_song(self, node: SongNode, after: Optional[SongNode]) -> bool:
+        # Move node right after `after`, or to the head when after is None
+        self.ensure_loaded()
+        if not self.contains(node) or node is after or (after and not self.contains(after)):
+            return False
+        if node.prev is after:
+            return True
+        old_prev = node.prev
+        self._unlink(node)
+        node.position = self._position_after(after)
+        self._link_after(after, node)
+        if self.tracker:
+            self.tracker.song_moved(self, node, old_prev)
+        return True
+
+    def relink(self, node: SongNode, prev: Optional[SongNode]) -> bool:
+        # Put a removed node back right after prev (at the head when None),
+        # keeping its id; its old label is reused when it still fits
+        self.ensure_loaded()
+        if self.contains(node) or (prev is not None and not self.contains(prev)):
+            return False
+        nxt = prev.next if prev else self.head
+        lo = prev.position if prev else 0
+        if not (lo < node.position and (nxt is None or node.position < nxt.position)):
+            node.position = self._position_after(prev)
+        self._link_after(prev, node)
+        if self.tracker:
+            self.tracker.song_restored(self, node)
+        return True
+
+    def restore_song(self, song_id: int, track: Track, position: int = 0) -> SongNode:
+        # Append a song that already exists in storage, without recording a change
+        node = SongNode(track, song_id)
+        node.position = position
+        self._link_tail(node)
+        return node
+
+    def delete_node(self, node: SongNode) -> bool:
+        self.ensure_loaded()
+        if self._by_position.get(node.position) is not node:
+            return False
+        prev = node.prev
+        self._unlink(node)
+        if self.tracker:
+            self.tracker.song_removed(self, node, prev)
+        return True
+
+    def delete_nodes(self, nodes: Iterable[SongNode]) -> int:
+        # Unlink many songs in one pass; listeners get a single event
+        self.ensure_loaded()
+        removed = []
+        for node in nodes:
+            if self._by_position.get(node.position) is node:
+                removed.append((node, node.prev))
+                self._unlink(node)
+        if removed and self.tracker:
+            self.tracker.songs_removed(self, removed)
+        return len(removed)
+
+    def dedupe(self) -> int:
+        # Keep the first song of every track; only shared tracks are looked at
+        self.ensure_loaded()
+        dupes = []
+        for bucket in self._by_track.values():
+            if isinstance(bucket, dict):
+                first = min(bucket, key=lambda n: n.position)
+                dupes.extend(node for node in bucket if node is not first)
+        dupes.sort(key=lambda n: n.position)
+        return self.delete_nodes(dupes)
+
+    def sort_by(self, key: Callable[[SongNode], Any], reverse: bool = False) -> bool:
+        self.ensure_loaded()
+        return self.reorder(sorted(self, key=key, reverse=reverse))
+
+    def reorder(self, order: List[SongNode]) -> bool:
+        # Relink every song in the given order with evenly spread labels.
+        # order must hold each song of the playlist exactly once.
+        self.ensure_loaded()
+        if len(order) != self.length or len(set(order)) != len(order) \
+                or any(self._by_position.get(node.position) is not node for node in order):
+            return False
+        old_order = list(self)
+        if all(a is b for a, b in zip(old_order, order)):
+            return True
+        self._by_position = {}
+        prev = None
+        for i, node in enumerate(order, 1):
+            node.prev, node.next = prev, None
+            if prev is None:
+                self.head = node
+            else:
+                prev.next = node
+            node.position = i * POSITION_GAP
+            self._by_position[node.position] = node
+            prev = node
+        self.tail = prev
+        if self.tracker:
+            for node in order:
+                self.tracker.song_relabeled(self, node)
+            self.tracker.songs_reordered(self, old_order)
+        return True
+
+    def delete_song(self, title: str, filepath: Optional[str] = None) -> bool:
+        for node in self.find_songs(title):
+            if filepath is None or node.track is self.catalog.find(filepath):
+                return self.delete_node(node)
         return False
 
     def search_song(self, title: str) -> Optional[SongNode]:
-        cur = self.head
-        while cur:
-            if cur.title == title:
-                return cur
-            cur = cur.next
-        return None
+        self.ensure_loaded()
+        nodes = _bucket_nodes(self._by_title, title)
+        return min(nodes, key=lambda n: n.position) if nodes else None
+
+    def find_songs(self, title: str) -> List[SongNode]:
+        # Every song with this exact title, in playlist order
+        self.ensure_loaded()
+        return sorted(_bucket_nodes(self._by_title, title), key=lambda n: n.position)
+
+    def find_by_path(self, filepath: str) -> Optional[SongNode]:
+        self.ensure_loaded()
+        track = self.catalog.find(filepath)
+        nodes = _bucket_nodes(self._by_track, track) if track else ()
+        return min(nodes, key=lambda n: n.position) if nodes else None
+
+    def node_at(self, position: int) -> Optional[SongNode]:
+        self.ensure_loaded()
+        return self._by_position.get(position)
+
+    def contains(self, node: SongNode) -> bool:
+        self.ensure_loaded()
+        return self._by_position.get(node.position) is node
+
+    def has_track(self, track: Track) -> bool:
+        self.ensure_loaded()
+        return track in self._by_track
 
     def to_list(self) -> List[Dict[str, str]]:
-        out: List[Dict[str, str]] = []
-        cur = self.head
-        while cur:
-            out.append({"title": cur.title, "filepath": cur.filepath})
-            cur = cur.next
-        return out
+        return [{"title": node.title, "filepath": node.filepath} for node in self]
 
     def clear(self):
+        self.ensure_loaded()
+        state = (self.head, self.tail, self.length, self._by_title, self._by_track, self._by_position)
         self.head = self.tail = None
         self.length = 0
+        self._by_title = {}
+        self._by_track = {}
+        self._by_position = {}
+        if self._traversal is not None:
+            self._traversal.reset()
+        if self.tracker:
+            self.tracker.songs_cleared(self, state)
+
+    def restore_cleared(self, state: Tuple) -> bool:
+        # Undo clear() by swapping the old chain and indexes back in
+        self.ensure_loaded()
+        if self.head is not None:
+            return False
+        self.head, self.tail, self.length, self._by_title, self._by_track, self._by_position = state
+        if self._traversal is not None:
+            self._traversal.reset()
+        if self.tracker:
+            node = self.head
+            while node:
+                self.tracker.song_restored(self, node)
+                node = node.next
+        return True
 
 class PlaylistManager:
     def __init__(self):
         self.playlists: Dict[str, Playlist] = {}
         self.current: Optional[Playlist] = None
+        self.tracker: ChangeTracker = ChangeTracker()
+        self.catalog: TrackCatalog = TrackCatalog()
+        self.catalog.tracker = self.tracker
+
+    def _register(self, pl: Playlist):
+        pl.tracker = self.tracker
+        pl.catalog = self.catalog
+        self.playlists[pl.name] = pl
+        if self.current is None:
+            self.current = pl
 
     def create_playlist(self, name: str) -> bool:
-        name = name.strip()
-        if not name:
+        return self.add_playlist(Playlist(name))
+
+    def add_playlist(self, pl: Playlist) -> bool:
+        # Register a new playlist object, e.g. a smart playlist
+        pl.name = pl.name.strip()
+        if not pl.name or pl.name in self.playlists:
             return False
-        if name in self.playlists:
+        self._register(pl)
+        self.tracker.playlist_created(pl)
+        return True
+
+    def reinstate_playlist(self, pl: Playlist) -> bool:
+        # Bring back a deleted playlist object with its id and songs
+        if pl.name in self.playlists or pl.id is None:
             return False
-        pl = Playlist(name)
-        self.playlists[name] = pl
-        if self.current is None:
-            self.current = pl
+        self._register(pl)
+        self.tracker.playlist_restored(pl)
         return True
 
+    def restore_playlist(self, playlist_id: int, name: str, pl: Optional[Playlist] = None) -> Playlist:
+        # Register a playlist that already exists in storage, without recording a change
+        pl = pl if pl is not None else Playlist(name)
+        pl.id = playlist_id
+        self._register(pl)
+        return pl
+
     def delete_playlist(self, name: str) -> bool:
         if name in self.playlists:
             was_current = (self.current and self.current.name == name)
-            del self.playlists[name]
+            # Loaded first so the songs can still be restored after the rows are
+            # gone; smart playlists are re-evaluated when they come back instead
+            if self.playlists[name].rules is None:
+                self.playlists[name].ensure_loaded()
+            pl = self.playlists.pop(name)
+            self.tracker.playlist_dropped(pl)
+            pl.tracker = None
             if was_current:
                 self.current = None
                 # pick another if available
@@ -95,6 +666,7 @@ class PlaylistManager:
     def switch_playlist(self, name: str) -> bool:
         if name in self.playlists:
             self.current = self.playlists[name]
+            self.current.ensure_loaded()
             return True
         return False
 
@@ -105,9 +677,27 @@ class PlaylistManager:
         pl = self.playlists.pop(old_name)
         pl.name = new_name
         self.playlists[new_name] = pl
+        self.tracker.playlist_renamed(pl, old_name)
         if self.current and self.current.name == old_name:
             self.current = pl
         return True
 
+    def copy_songs(self, nodes: Iterable[SongNode], target: Playlist) -> List[SongNode]:
+        # Append the songs (all from one playlist) to target, in playlist order
+        if target.rules is not None:
+            return []
+        return [target.add_track(node.track) for node in sorted(nodes, key=lambda n: n.position)]
+
+    def move_songs(self, source: Playlist, nodes: Iterable[SongNode], target: Playlist) -> List[SongNode]:
+        if target is source or source.rules is not None or target.rules is not None:
+            return []
+        nodes = [node for node in nodes if source.contains(node)]
+        copies = self.copy_songs(nodes, target)
+        source.delete_nodes(nodes)
+        return copies
+
     def get_all_names(self) -> List[str]:
         return sorted(self.playlists.keys())
+
+    def collect_changes(self) -> ChangeSet:
+        return self.tracker.collect()
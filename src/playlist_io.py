@@ -0,0 +1,178 @@
+import json
+import os
+from itertools import groupby
+from operator import itemgetter
+from typing import Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+from playlist import Playlist, PlaylistManager
+from utils import pretty_title
+
+FORMATS = {".m3u": "m3u", ".m3u8": "m3u", ".pls": "pls", ".jsonl": "jsonl", ".json": "jsonl"}
+
+# (playlist name or None for the import target, title, path as written in the file)
+Entry = Tuple[Optional[str], str, str]
+
+def detect_format(path: str) -> str:
+    fmt = FORMATS.get(os.path.splitext(path)[1].lower())
+    if fmt is None:
+        raise ValueError(f"Unsupported playlist format: {path} (expected {', '.join(sorted(FORMATS))})")
+    return fmt
+
+def _is_url(location: str) -> bool:
+    return "://" in location
+
+def _title_for(title: Optional[str], location: str) -> str:
+    return title or pretty_title(os.path.basename(location))
+
+# ===== Streaming readers: one line in memory at a time =====
+def iter_m3u(f: TextIO) -> Iterator[Entry]:
+    title = None
+    for line in f:
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith("#"):
+            if line.startswith("#EXTINF:"):
+                _, _, title = line.partition(",")
+                title = title.strip() or None
+            continue
+        if not _is_url(line):
+            yield None, _title_for(title, line), line
+        title = None
+
+def iter_pls(f: TextIO) -> Iterator[Entry]:
+    # FileN/TitleN keys of one entry are written together; an entry is emitted
+    # as soon as a key for a different number shows up
+    current, location, title = None, None, None
+    for line in f:
+        key, sep, value = line.strip().partition("=")
+        if not sep:
+            continue
+        key = key.strip().lower()
+        for field in ("file", "title"):
+            if key.startswith(field) and key[len(field):].isdigit():
+                number = int(key[len(field):])
+                break
+        else:
+            continue
+        if number != current:
+            if location and not _is_url(location):
+                yield None, _title_for(title, location), location
+            current, location, title = number, None, None
+        if field == "file":
+            location = value.strip()
+        else:
+            title = value.strip() or None
+    if location and not _is_url(location):
+        yield None, _title_for(title, location), location
+
+def iter_jsonl(f: TextIO) -> Iterator[Entry]:
+    for lineno, line in enumerate(f, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            obj = json.loads(line)
+        except ValueError as e:
+            raise ValueError(f"line {lineno}: {e}") from None
+        location = obj.get("path")
+        if not location or _is_url(location):
+            continue
+        yield obj.get("playlist"), _title_for(obj.get("title"), location), location
+
+READERS = {"m3u": iter_m3u, "pls": iter_pls, "jsonl": iter_jsonl}
+
+def read_entries(path: str, fmt: Optional[str] = None) -> Iterator[Entry]:
+    fmt = fmt or detect_format(path)
+    with open(path, "r", encoding="utf-8-sig", errors="replace") as f:
+        yield from READERS[fmt](f)
+
+# ===== Import =====
+def _target(pm: PlaylistManager, name: str) -> Playlist:
+    if name not in pm.playlists:
+        pm.create_playlist(name)
+    elif pm.playlists[name].rules is not None:
+        raise ValueError(f"'{name}' is a smart playlist and cannot be imported into")
+    return pm.playlists[name]
+
+def import_entries(pm: PlaylistManager, entries: Iterable[Entry], default_name: str,
+                   base: Optional[str] = None, replace: bool = False,
+                   skip_existing: bool = False) -> Dict[str, int]:
+    # Runs of entries for the same playlist stream through the catalog, which
+    # normalizes and looks up paths in batches. Returns songs added per playlist.
+    # Entries are appended as they come, so importing a file twice lists its
+    # songs twice. With replace, each playlist the entries go to is emptied
+    # first; with skip_existing, a song whose file the playlist already has
+    # (repeats within the entries included) is left out.
+    counts: Dict[str, int] = {}
+    named = ((((name or "").strip() or default_name), title, location) for name, title, location in entries)
+    for name, run in groupby(named, key=itemgetter(0)):
+        pl = _target(pm, name)
+        if replace and name not in counts:
+            pl.clear()
+        before = pl.length
+        for track in pm.catalog.get_or_create_many(((title, location) for _, title, location in run), base):
+            if not (skip_existing and pl.has_track(track)):
+                pl.add_track(track)
+        counts[name] = counts.get(name, 0) + pl.length - before
+    return counts
+
+def import_file(pm: PlaylistManager, path: str, playlist_name: Optional[str] = None,
+                fmt: Optional[str] = None, replace: bool = False,
+                skip_existing: bool = False) -> Dict[str, int]:
+    # Relative entries resolve against the playlist file's folder; M3U and PLS
+    # entries go to playlist_name (default: the file name)
+    name = playlist_name or os.path.splitext(os.path.basename(path))[0]
+    return import_entries(pm, read_entries(path, fmt), name, os.path.dirname(os.path.abspath(path)),
+                          replace, skip_existing)
+
+# ===== Export =====
+def _location(path: str, base: Optional[str]) -> str:
+    return os.path.relpath(path, base) if base else path
+
+def write_m3u(f: TextIO, pl: Playlist, base: Optional[str] = None) -> int:
+    f.write("#EXTM3U\n")
+    count = 0
+    for node in pl:
+        f.write(f"#EXTINF:-1,{node.title}\n{_location(node.filepath, base)}\n")
+        count += 1
+    return count
+
+def write_pls(f: TextIO, pl: Playlist, base: Optional[str] = None) -> int:
+    f.write("[playlist]\n")
+    count = 0
+    for node in pl:
+        count += 1
+        f.write(f"File{count}={_location(node.filepath, base)}\nTitle{count}={node.title}\nLength{count}=-1\n")
+    f.write(f"NumberOfEntries={count}\nVersion=2\n")
+    return count
+
+def write_jsonl(f: TextIO, playlists: List[Playlist], base: Optional[str] = None) -> int:
+    count = 0
+    for pl in playlists:
+        for node in pl:
+            f.write(json.dumps({"playlist": pl.name, "title": node.title,
+                                "path": _location(node.filepath, base)}, ensure_ascii=False) + "\n")
+            count += 1
+    return count
+
+def export_file(pm: PlaylistManager, path: str, names: List[str], fmt: Optional[str] = None,
+                relative: bool = False) -> int:
+    # M3U and PLS hold one playlist; JSON lines can hold any number
+    fmt = fmt or detect_format(path)
+    missing = [n for n in names if n not in pm.playlists]
+    if missing:
+        raise ValueError(f"No such playlist: {', '.join(missing)}")
+    if fmt != "jsonl" and len(names) != 1:
+        raise ValueError(f"{fmt} files hold exactly one playlist")
+    playlists = [pm.playlists[n] for n in names]
+    base = os.path.dirname(os.path.abspath(path)) if relative else None
+    tmp = path + ".part"
+    with open(tmp, "w", encoding="utf-8", newline="\n") as f:
+        if fmt == "jsonl":
+            count = write_jsonl(f, playlists, base)
+        elif fmt == "pls":
+            count = write_pls(f, playlists[0], base)
+        else:
+            count = write_m3u(f, playlists[0], base)
+    os.replace(tmp, path)
+    return count
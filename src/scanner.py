@@ -0,0 +1,156 @@
+import os
+import struct
+import threading
+import wave
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+import database
+from playlist import Playlist
+from utils import is_audio_file, pretty_title, normalize_path, fast_hash
+
+try:
+    import mutagen
+except ImportError:  # tags fall back to ID3v1 / WAV headers and the filename
+    mutagen = None
+
+SCAN_WORKERS = 8
+# Files handed to the pool at a time; cancel() takes effect between chunks
+SCAN_CHUNK = 64
+
+class TrackInfo:
+    __slots__ = ("path", "size", "mtime", "title", "artist", "album", "duration", "hash")
+
+    def __init__(self, path: str, size: int, mtime: float, title: str,
+                 artist: Optional[str] = None, album: Optional[str] = None,
+                 duration: Optional[float] = None, content_hash: Optional[str] = None):
+        self.path = path
+        self.size = size
+        self.mtime = mtime
+        self.title = title
+        self.artist = artist
+        self.album = album
+        self.duration = duration
+        self.hash = content_hash
+
+    def as_row(self) -> Tuple:
+        return (self.path, self.size, self.mtime, self.title, self.artist, self.album, self.duration, self.hash)
+
+def walk_audio_files(root: str) -> Iterator[os.DirEntry]:
+    stack = [root]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file() and is_audio_file(entry.name):
+                        yield entry
+        except OSError:
+            continue
+
+def _read_id3v1(path: str) -> Dict[str, str]:
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell() < 128:
+            return {}
+        f.seek(-128, os.SEEK_END)
+        block = f.read(128)
+    if block[:3] != b"TAG":
+        return {}
+    fields = struct.unpack("30s30s30s", block[3:93])
+    title, artist, album = (x.split(b"\0", 1)[0].decode("latin-1").strip() for x in fields)
+    return {"title": title, "artist": artist, "album": album}
+
+def read_metadata(path: str, size: int, mtime: float) -> TrackInfo:
+    info = TrackInfo(path, size, mtime, pretty_title(os.path.basename(path)))
+    try:
+        info.hash = fast_hash(path, size)
+    except OSError:
+        pass
+    try:
+        if mutagen is not None:
+            audio = mutagen.File(path, easy=True)
+            if audio is not None:
+                tags = audio.tags or {}
+                info.title = (tags.get("title") or [info.title])[0]
+                info.artist = (tags.get("artist") or [None])[0]
+                info.album = (tags.get("album") or [None])[0]
+                if audio.info is not None:
+                    info.duration = getattr(audio.info, "length", None)
+            return info
+        ext = os.path.splitext(path)[1].lower()
+        if ext == ".mp3":
+            tags = _read_id3v1(path)
+            info.title = tags.get("title") or info.title
+            info.artist = tags.get("artist") or None
+            info.album = tags.get("album") or None
+        elif ext == ".wav":
+            with wave.open(path, "rb") as w:
+                info.duration = w.getnframes() / float(w.getframerate())
+    except Exception:
+        pass  # unreadable headers still import with the filename title
+    return info
+
+class LibraryScanner:
+    def __init__(self, workers: int = SCAN_WORKERS, db_path: Optional[str] = None):
+        self.workers = workers
+        self.db_path = db_path or database.DB_PATH
+        self._cancel = threading.Event()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def scan(self, root: str, progress: Optional[Callable[[int, int], None]] = None) -> List[TrackInfo]:
+        # Walk root, reuse cached metadata for files whose (size, mtime) did not change
+        # and read headers of the rest in a thread pool
+        root = normalize_path(root)
+        self._cancel.clear()
+        cache = database.load_scan_cache(root, self.db_path)
+        found: List[TrackInfo] = []
+        stale: List[Tuple[str, int, float]] = []
+        walked = True
+        for entry in walk_audio_files(root):
+            if self._cancel.is_set():
+                walked = False
+                break
+            st = entry.stat()
+            path = normalize_path(entry.path)
+            row = cache.pop(path, None)
+            if row and row[1] == st.st_size and row[2] == st.st_mtime and row[7]:
+                found.append(TrackInfo(*row))
+            else:
+                stale.append((path, st.st_size, st.st_mtime))
+
+        total = len(found) + len(stale)
+        done = len(found)
+        if progress:
+            progress(done, total)
+        fresh: List[TrackInfo] = []
+        if stale:
+            # Submitted a chunk at a time, so a cancelled scan waits for at
+            # most one chunk instead of every file
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                for i in range(0, len(stale), SCAN_CHUNK):
+                    if self._cancel.is_set():
+                        break
+                    for info in pool.map(lambda args: read_metadata(*args), stale[i:i + SCAN_CHUNK]):
+                        fresh.append(info)
+                        done += 1
+                        if progress and (done % 50 == 0 or done == total):
+                            progress(done, total)
+        # Whatever is left in cache was deleted from disk, unless the walk was cut short
+        database.update_scan_cache([info.as_row() for info in fresh], list(cache) if walked else [],
+                                     self.db_path)
+        found.extend(fresh)
+        found.sort(key=lambda t: t.path)
+        return found
+
+def import_tracks(pl: Playlist, tracks: List[TrackInfo]) -> int:
+    added = 0
+    for info in tracks:
+        # Refreshes the catalog entry's size/mtime/hash even when already in the playlist
+        track = pl.catalog.get_or_create(info.title, info.path, info.size, info.mtime, info.hash)
+        if not pl.find_by_path(track.path):
+            pl.add_track(track)
+            added += 1
+    return added
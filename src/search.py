@@ -0,0 +1,148 @@
+import sqlite3
+from typing import Dict, List, Optional, Set
+import database
+
+DEFAULT_LIMIT = 50
+# A typo breaks at most three consecutive trigrams, so a query split into this
+# many runs keeps at least one run intact for a single typo
+FUZZY_GROUPS = 3
+MIN_FUZZY_SCORE = 0.5
+_ASCII_LOWER = str.maketrans("ABCDEFGHIJKLMNOPQRSTUVWXYZ", "abcdefghijklmnopqrstuvwxyz")
+
+class SearchHit:
+    __slots__ = ("song_id", "playlist_id", "playlist", "title", "filepath", "position", "library", "score")
+
+    def __init__(self, song_id: int, playlist_id: int, playlist: str, title: str,
+                 filepath: str, position: int, library: Optional[str] = None, score: float = 0.0):
+        self.song_id = song_id
+        self.playlist_id = playlist_id
+        self.playlist = playlist
+        self.title = title
+        self.filepath = filepath
+        self.position = position
+        # Set when searching several libraries at once (see library.py)
+        self.library = library
+        self.score = score
+
+def _trigram_list(text: str) -> List[str]:
+    text = text.lower()
+    return [text[i:i + 3] for i in range(len(text) - 2)]
+
+def _trigrams(text: str) -> Set[str]:
+    return set(_trigram_list(text))
+
+def _fold(text: str) -> str:
+    # NOCASE only folds ASCII
+    return text.translate(_ASCII_LOWER)
+
+def _fts_phrase(text: str) -> str:
+    return '"' + text.replace('"', '""') + '"'
+
+# {db} is the schema: "main", or an attached library
+_SELECT = """
+  SELECT s.id, s.playlist_id, p.name, t.title, t.path, s.position, ?
+  FROM {db}.tracks t JOIN {db}.songs s ON s.track_id = t.id JOIN {db}.playlists p ON p.id = s.playlist_id
+"""
+_MATCH = "JOIN {db}.tracks_fts f ON f.rowid = t.id WHERE f.tracks_fts MATCH ? LIMIT ?"
+# Range scan over idx_tracks_title
+_PREFIX = ("WHERE t.title >= ? COLLATE NOCASE AND t.title < ? COLLATE NOCASE "
+           "ORDER BY t.title COLLATE NOCASE LIMIT ?")
+
+class SearchIndex:
+    # Queries the tracks_fts trigram index that init_db keeps in sync through triggers.
+    # With a pool, each query borrows a connection, so searches may run on
+    # several threads at once. schemas maps attached schema names to library
+    # names; each query then runs once per schema in a single UNION ALL.
+    def __init__(self, db_path: Optional[str] = None, pool: Optional[database.ConnectionPool] = None,
+                 schemas: Optional[Dict[str, str]] = None):
+        self.pool = pool
+        self.schemas: Dict[str, Optional[str]] = schemas or {"main": None}
+        self.conn = None if pool else sqlite3.connect(db_path or database.DB_PATH, check_same_thread=False)
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+
+    def _fetch(self, sql: str, params: tuple) -> List[tuple]:
+        if self.pool is None:
+            return self.conn.execute(sql, params).fetchall()
+        with self.pool.connection() as conn:
+            return conn.execute(sql, params).fetchall()
+
+    def _query(self, tail: str, params: tuple) -> List[tuple]:
+        # _SELECT + tail against every schema, each part with its own LIMIT
+        parts, args = [], []
+        for db, library in self.schemas.items():
+            parts.append("SELECT * FROM (" + (_SELECT + tail).format(db=db) + ")")
+            args.extend((library, *params))
+        return self._fetch(" UNION ALL ".join(parts), tuple(args))
+
+    def search(self, text: str, limit: int = DEFAULT_LIMIT) -> List[SearchHit]:
+        q = text.strip()
+        if not q:
+            return []
+        if len(q) < 3:
+            return self._prefix(q, limit)
+        hits = self._substring(q, limit)
+        if len(hits) < limit:
+            seen = {(h.library, h.song_id) for h in hits}
+            hits.extend(h for h in self._fuzzy(q, limit) if (h.library, h.song_id) not in seen)
+        return hits[:limit]
+
+    def _prefix(self, q: str, limit: int) -> List[SearchHit]:
+        # Too short for trigrams
+        rows = self._query(_PREFIX, (q, q + "￿", limit))
+        rows.sort(key=lambda row: _fold(row[3]))
+        return [SearchHit(*row, score=3.0) for row in rows[:limit]]
+
+    def _substring(self, q: str, limit: int) -> List[SearchHit]:
+        # Prefix beats word start beats anywhere, so each is fetched with its
+        # own LIMIT, best first, until there are enough: the title index for
+        # prefixes, then the trigram index, which keeps spaces, for " q" and
+        # for q. No ORDER BY rank: bm25 would score every match before the
+        # LIMIT applies. Each query over-fetches and the rows are ranked here.
+        tiers = ((_PREFIX, (q, q + "￿", limit * 4)),
+                 (_MATCH, (_fts_phrase(" " + q), limit * 4)),
+                 (_MATCH, (_fts_phrase(q), limit * 4)))
+        lq = q.lower()
+        hits, seen = [], set()
+        for tail, params in tiers:
+            for row in self._query(tail, params):
+                if (row[6], row[0]) in seen:
+                    continue
+                seen.add((row[6], row[0]))
+                title = row[3].lower()
+                # Shorter titles are closer matches
+                if title.startswith(lq):
+                    score = 3.0
+                elif (" " + lq) in title:
+                    score = 2.5
+                else:
+                    score = 2.0
+                hits.append(SearchHit(*row, score=score - len(title) / 1000.0))
+            if len(hits) >= limit:
+                break
+        hits.sort(key=lambda h: -h.score)
+        return hits[:limit]
+
+    def _fuzzy(self, q: str, limit: int) -> List[SearchHit]:
+        # Candidates contain every trigram of at least one run of the query,
+        # then are ranked by trigram overlap with the whole query
+        grams = _trigram_list(q)
+        if not grams:
+            return []
+        size = max(1, -(-len(grams) // FUZZY_GROUPS))
+        runs = [grams[i:i + size] for i in range(0, len(grams), size)]
+        match = " OR ".join("(" + " AND ".join(_fts_phrase(g) for g in run) + ")" for run in runs)
+        rows = self._query(_MATCH, (match, limit * 4))
+        query_grams = set(grams)
+        hits = []
+        for row in rows:
+            title_grams = _trigrams(row[3])
+            shared = len(query_grams & title_grams)
+            # Mostly how much of the query is found, then how little else the title has
+            score = shared / len(query_grams) + 0.5 * shared / len(query_grams | title_grams)
+            if shared / len(query_grams) >= MIN_FUZZY_SCORE:
+                hits.append(SearchHit(*row, score=score))
+        hits.sort(key=lambda h: -h.score)
+        return hits[:limit]
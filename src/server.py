@@ -0,0 +1,651 @@
+import argparse
+import asyncio
+import json
+import os
+import re
+import signal
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+import database
+import library
+from history import PlayHistory
+from journal import JournalLog
+from persistence import PersistenceService
+from playlist import Playlist, PlaylistManager, SongNode
+from search import SearchIndex
+from smart import SmartEngine, SmartPlaylist
+from store import SqliteStore
+from traversal import MODES, PLAY_MODE_KEY, SEQUENTIAL
+from utils import pretty_title
+
+# Headless counterpart to main.py: the playlists and the player behind a JSON
+# API on localhost. Like cli.py, run it while the GUI is closed.
+
+HOST = "127.0.0.1"
+PORT = 8765
+DEFAULT_PAGE = 100
+MAX_PAGE = 1000
+# Songs per chunk when a whole playlist is streamed
+STREAM_PAGE = 500
+MAX_BODY_BYTES = 1024 * 1024
+MAX_HEADERS = 100
+# Keep-alive connections with no request for this long are closed
+IDLE_SECONDS = 30.0
+# Threads for database reads; each borrows a pooled connection
+READ_WORKERS = database.POOL_SIZE
+PLAYER_POLL_SECONDS = 0.2
+
+
+class ApiError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class Request:
+    __slots__ = ("method", "path", "query", "headers", "body", "version")
+
+    def __init__(self, method: str, path: str, query: Dict[str, List[str]], headers: Dict[str, str],
+                 body: bytes, version: str = "HTTP/1.1"):
+        self.method = method
+        self.path = path
+        self.query = query
+        self.headers = headers
+        self.body = body
+        self.version = version
+
+    @property
+    def keep_alive(self) -> bool:
+        connection = self.headers.get("connection", "").lower()
+        if self.version == "HTTP/1.0":
+            return connection == "keep-alive"
+        return connection != "close"
+
+    def arg(self, name: str, default=None):
+        values = self.query.get(name)
+        return values[0] if values else default
+
+    def int_arg(self, name: str, default: Optional[int] = None) -> Optional[int]:
+        value = self.arg(name)
+        if value is None:
+            return default
+        try:
+            return int(value)
+        except ValueError:
+            raise ApiError(400, f"{name} must be an integer")
+
+    def json(self) -> dict:
+        if not self.body:
+            return {}
+        try:
+            data = json.loads(self.body)
+        except ValueError:
+            raise ApiError(400, "body is not valid JSON")
+        if not isinstance(data, dict):
+            raise ApiError(400, "body must be a JSON object")
+        return data
+
+
+class Stream:
+    # A handler result sent chunked as NDJSON, one line per item of the async
+    # iterator pages
+    def __init__(self, pages):
+        self.pages = pages
+
+
+# One encoder for every response: json.dumps() with options builds a new one per call
+_encode = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+
+def _dumps(obj) -> bytes:
+    return _encode(obj).encode("utf-8")
+
+def _int_field(data: dict, name: str) -> int:
+    value = data[name]
+    # bool is an int subclass, but true is not a position
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise ApiError(400, f"{name} must be an integer")
+    return value
+
+def _read_pages(loader) -> List[List[Tuple]]:
+    return list(loader())
+
+
+class ApiServer:
+    # Every request is handled on the event loop thread, which owns the
+    # PlaylistManager the way the Tk thread does in the GUI, so handlers need
+    # no locks. Nothing on it blocks for long: searches, song page-ins, smart
+    # playlist queries and settings writes run on reader threads, saves go
+    # through the debounced PersistenceService, playback runs on the player's
+    # own thread, and streamed listings yield to other clients between pages.
+    # Handlers validate their input and raise ApiError; any other exception is
+    # a server fault and answers 500.
+    def __init__(self, pm: PlaylistManager, persistence: PersistenceService, player=None,
+                 pool: Optional[database.ConnectionPool] = None, play_history: Optional[PlayHistory] = None,
+                 db_path: Optional[str] = None):
+        self.pm = pm
+        self.db_path = db_path or (pool.db_path if pool is not None else database.DB_PATH)
+        self.persistence = persistence
+        self.player = player
+        self.play_history = play_history
+        self.pool = pool or database.ConnectionPool(db_path=self.db_path)
+        self.search_index = SearchIndex(pool=self.pool)
+        # This database and the other libraries, opened when a cross-library
+        # request first needs them
+        self.libraries = library.LibrarySet(active=self.db_path)
+        self.readers = ThreadPoolExecutor(max_workers=READ_WORKERS, thread_name_prefix="api-read")
+        mode = database.get_meta(PLAY_MODE_KEY, SEQUENTIAL, self.db_path)
+        self.play_mode = mode if mode in MODES else SEQUENTIAL
+        self.last_error: Optional[str] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._poller: Optional[asyncio.Task] = None
+        self._routes: List[Tuple[str, "re.Pattern", Callable]] = []
+        route = self._route
+        route("GET", r"/playlists", self.list_playlists)
+        route("POST", r"/playlists", self.create_playlist)
+        route("GET", r"/playlists/([^/]+)", self.get_playlist)
+        route("PATCH", r"/playlists/([^/]+)", self.rename_playlist)
+        route("DELETE", r"/playlists/([^/]+)", self.delete_playlist)
+        route("GET", r"/playlists/([^/]+)/songs", self.list_songs)
+        route("POST", r"/playlists/([^/]+)/songs", self.add_song)
+        route("DELETE", r"/playlists/([^/]+)/songs/(\d+)", self.delete_song)
+        route("POST", r"/playlists/([^/]+)/songs/(\d+)/move", self.move_song)
+        route("GET", r"/search", self.search)
+        route("GET", r"/player", self.player_state)
+        route("POST", r"/player/(play|pause|resume|stop|next|prev)", self.player_command)
+        route("POST", r"/player/mode", self.set_mode)
+        route("GET", r"/history/(most-played|recent)", self.history_view)
+        route("GET", r"/libraries", self.list_libraries)
+        route("GET", r"/libraries/search", self.search_libraries)
+
+    def _route(self, method: str, pattern: str, handler: Callable):
+        self._routes.append((method, re.compile(pattern + "/?$"), handler))
+
+    # ===== Lifecycle =====
+    async def start(self, host: str = HOST, port: int = PORT):
+        self._server = await asyncio.start_server(self._serve, host, port, backlog=1024)
+        if self.player is not None:
+            self._poller = asyncio.get_running_loop().create_task(self._poll_player())
+        return self._server
+
+    async def close(self):
+        if self._poller is not None:
+            self._poller.cancel()
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        self.readers.shutdown(wait=True)
+        self.pool.close()
+        self.libraries.close()
+
+    async def _poll_player(self):
+        # Nobody else drains the player's event queue when headless
+        while True:
+            for event in self.player.poll_events():
+                if event[0] == "error":
+                    self.last_error = f"{os.path.basename(event[1])}: {event[2]}"
+                elif event[0] == "start":
+                    self.last_error = None
+                    if self.play_history is not None and event[2] is not None:
+                        self.play_history.started(event[1], event[2])
+                elif event[0] == "end" and self.play_history is not None:
+                    self.play_history.ended(event[2], event[3])
+            await asyncio.sleep(PLAYER_POLL_SECONDS)
+
+    def _save(self):
+        self.persistence.schedule(self.pm)
+
+    # ===== HTTP =====
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(self._read_request(reader), IDLE_SECONDS)
+                except ApiError as e:
+                    await self._send(writer, e.status, {"error": str(e)}, keep_alive=False)
+                    return
+                if request is None:
+                    return
+                keep_alive = request.keep_alive
+                await self._dispatch(request, writer, keep_alive)
+                if not keep_alive:
+                    return
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> Optional[Request]:
+        line = await reader.readline()
+        if not line:
+            return None
+        try:
+            method, target, version = line.decode("latin-1").split(" ", 2)
+        except ValueError:
+            raise ApiError(400, "malformed request line")
+        headers: Dict[str, str] = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            if len(headers) >= MAX_HEADERS:
+                raise ApiError(431, "too many headers")
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        try:
+            length = int(headers.get("content-length", "0"))
+        except ValueError:
+            raise ApiError(400, "bad Content-Length")
+        if length > MAX_BODY_BYTES:
+            raise ApiError(413, "body too large")
+        body = await reader.readexactly(length) if length > 0 else b""
+        url = urlsplit(target)
+        return Request(method.upper(), url.path, parse_qs(url.query), headers, body, version.strip())
+
+    async def _dispatch(self, request: Request, writer: asyncio.StreamWriter, keep_alive: bool):
+        allowed = False
+        for method, pattern, handler in self._routes:
+            match = pattern.match(request.path)
+            if match is None:
+                continue
+            if method != request.method:
+                allowed = True
+                continue
+            try:
+                args = [unquote(group) for group in match.groups()]
+                result = handler(request, *args)
+                if asyncio.iscoroutine(result):
+                    result = await result
+            except ApiError as e:
+                await self._send(writer, e.status, {"error": str(e)}, keep_alive)
+                return
+            except Exception as e:
+                await self._send(writer, 500, {"error": f"{type(e).__name__}: {e}"}, keep_alive)
+                return
+            if isinstance(result, Stream):
+                await self._send_stream(writer, result, keep_alive)
+            else:
+                status, payload = result if isinstance(result, tuple) else (200, result)
+                await self._send(writer, status, payload, keep_alive)
+            return
+        if allowed:
+            await self._send(writer, 405, {"error": "method not allowed"}, keep_alive)
+        else:
+            await self._send(writer, 404, {"error": "not found"}, keep_alive)
+
+    def _head(self, status: int, content_type: str, extra: str, keep_alive: bool) -> bytes:
+        connection = "Connection: keep-alive\r\n" if keep_alive else "Connection: close\r\n"
+        return (f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n"
+                f"Content-Type: {content_type}\r\n{extra}{connection}\r\n").encode("latin-1")
+
+    async def _send(self, writer: asyncio.StreamWriter, status: int, payload, keep_alive: bool):
+        body = _dumps(payload)
+        writer.write(self._head(status, "application/json; charset=utf-8",
+                                f"Content-Length: {len(body)}\r\n", keep_alive) + body)
+        await writer.drain()
+
+    async def _send_stream(self, writer: asyncio.StreamWriter, stream: Stream, keep_alive: bool):
+        writer.write(self._head(200, "application/x-ndjson; charset=utf-8",
+                                "Transfer-Encoding: chunked\r\n", keep_alive))
+        async for page in stream.pages:
+            data = _dumps(page) + b"\n"
+            writer.write(b"%x\r\n%s\r\n" % (len(data), data))
+            # Waits while the client is slow to read, and lets other requests in
+            await writer.drain()
+            await asyncio.sleep(0)
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    # ===== Helpers =====
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.readers, func, *args)
+
+    async def _load(self, pl: Playlist) -> Playlist:
+        # Read a lazy playlist's songs on a reader thread, then link them here.
+        # A smart playlist's loader flushes pending saves first, so they are
+        # scheduled now, on the thread that owns pm. Loops in case a smart
+        # playlist is invalidated while its query runs.
+        while not pl.loaded:
+            loader = pl.loader
+            if pl.rules is not None:
+                self._save()
+            pl.load_from(loader, await self._run(_read_pages, loader))
+        return pl
+
+    async def _loaded(self, name: str) -> Playlist:
+        return await self._load(self._playlist(name))
+
+    def _playlist(self, name: str) -> Playlist:
+        pl = self.pm.playlists.get(name)
+        if pl is None:
+            raise ApiError(404, f"no playlist named {name!r}")
+        return pl
+
+    async def _editable(self, name: str) -> Playlist:
+        pl = self._playlist(name)
+        if pl.rules is not None:
+            raise ApiError(409, f"{name!r} is a smart playlist; its songs come from its rules")
+        return await self._load(pl)
+
+    def _song(self, pl: Playlist, position: int) -> SongNode:
+        node = pl.node_at(position)
+        if node is None:
+            raise ApiError(404, f"no song at position {position}")
+        return node
+
+    def _playlist_json(self, pl: Playlist) -> dict:
+        return {"id": pl.id, "name": pl.name, "length": pl.length, "rules": pl.rules}
+
+    def _song_json(self, node: SongNode) -> dict:
+        return {"position": node.position, "id": node.id, "title": node.title,
+                "path": node.filepath, "missing": self.pm.catalog.is_missing(node.track)}
+
+    def _page(self, pl: Playlist, after: Optional[int], limit: int) -> List[SongNode]:
+        # Keyset paging by order label, so a page costs O(limit) however deep it
+        # is; pl must be loaded (see _load)
+        if after is None:
+            node = pl.head
+        else:
+            anchor = pl.node_at(after)
+            if anchor is not None:
+                node = anchor.next
+            else:
+                # The cursor song went away: resume at the first later label
+                node = pl.head
+                while node is not None and node.position <= after:
+                    node = node.next
+        page = []
+        while node is not None and len(page) < limit:
+            page.append(node)
+            node = node.next
+        return page
+
+    async def _stream_pages(self, pl: Playlist):
+        # Each line is a JSON array of up to STREAM_PAGE songs; a smart playlist
+        # may be invalidated between lines
+        after = None
+        while True:
+            page = self._page(await self._load(pl), after, STREAM_PAGE)
+            if not page:
+                return
+            yield [self._song_json(node) for node in page]
+            after = page[-1].position
+
+    # ===== Playlists =====
+    def list_playlists(self, request: Request):
+        return {"playlists": [self._playlist_json(self.pm.playlists[name]) for name in self.pm.get_all_names()]}
+
+    def create_playlist(self, request: Request):
+        data = request.json()
+        name = data.get("name")
+        if not isinstance(name, str) or not name.strip():
+            raise ApiError(400, "name is required")
+        rules = data.get("rules")
+        if rules is not None:
+            try:
+                pl = SmartPlaylist(name, str(rules))
+            except ValueError as e:
+                raise ApiError(400, f"invalid rules: {e}")
+            created = self.pm.add_playlist(pl)
+        else:
+            created = self.pm.create_playlist(name)
+        if not created:
+            raise ApiError(409, f"a playlist named {name!r} exists or the name is invalid")
+        self._save()
+        return 201, self._playlist_json(self.pm.playlists[name.strip()])
+
+    def get_playlist(self, request: Request, name: str):
+        return self._playlist_json(self._playlist(name))
+
+    def rename_playlist(self, request: Request, name: str):
+        self._playlist(name)
+        new_name = request.json().get("name")
+        if not isinstance(new_name, str) or not self.pm.rename_playlist(name, new_name):
+            raise ApiError(409, "invalid or duplicate playlist name")
+        self._save()
+        return self._playlist_json(self._playlist(new_name.strip()))
+
+    async def delete_playlist(self, request: Request, name: str):
+        pl = self._playlist(name)
+        if pl.rules is None:
+            # delete_playlist() loads it to keep the songs restorable
+            await self._load(pl)
+        if self.player is not None and self.player.playlist is pl:
+            self.player.stop()
+        self.pm.delete_playlist(name)
+        self._save()
+        return {"deleted": name}
+
+    # ===== Songs =====
+    async def list_songs(self, request: Request, name: str):
+        pl = self._playlist(name)
+        if request.arg("stream") in ("1", "true"):
+            return Stream(self._stream_pages(pl))
+        limit = max(1, min(request.int_arg("limit", DEFAULT_PAGE), MAX_PAGE))
+        after = request.int_arg("after")
+        page = self._page(await self._load(pl), after, limit)
+        more = bool(page) and page[-1].next is not None
+        return {"songs": [self._song_json(node) for node in page],
+                "next": page[-1].position if more else None,
+                "length": pl.length}
+
+    async def add_song(self, request: Request, name: str):
+        data = request.json()
+        path = data.get("path")
+        if not isinstance(path, str) or not path:
+            raise ApiError(400, "path is required")
+        title = data.get("title")
+        if title is not None and not isinstance(title, str):
+            raise ApiError(400, "title must be a string")
+        title = title or pretty_title(os.path.basename(path))
+        position = None if data.get("after") is None else _int_field(data, "after")
+        pl = await self._editable(name)
+        if "after" in data:
+            # A position to insert behind, or null for the head
+            after = None if position is None else self._song(pl, position)
+            node = pl.insert_after(after, title, path)
+        else:
+            node = pl.add_song(title, path)
+        self._save()
+        return 201, self._song_json(node)
+
+    async def delete_song(self, request: Request, name: str, position: str):
+        pl = await self._editable(name)
+        node = self._song(pl, int(position))
+        if self.player is not None and self.player.current_node is node:
+            self.player.stop()
+        pl.delete_node(node)
+        self._save()
+        return {"deleted": int(position)}
+
+    async def move_song(self, request: Request, name: str, position: str):
+        data = request.json()
+        after = None if data.get("after") is None else _int_field(data, "after")
+        pl = await self._editable(name)
+        node = self._song(pl, int(position))
+        if not pl.move_song(node, None if after is None else self._song(pl, after)):
+            raise ApiError(409, "cannot move a song after itself")
+        self._save()
+        return self._song_json(node)
+
+    async def search(self, request: Request):
+        q = request.arg("q", "")
+        limit = max(1, min(request.int_arg("limit", 50), MAX_PAGE))
+        hits = await self._run(self.search_index.search, q, limit)
+        return {"hits": [{"playlist": h.playlist, "position": h.position, "id": h.song_id,
+                          "title": h.title, "path": h.filepath, "score": round(h.score, 3)} for h in hits]}
+
+    # ===== Player =====
+    def _require_player(self):
+        if self.player is None:
+            raise ApiError(503, "playback is disabled")
+        return self.player
+
+    def player_state(self, request: Request):
+        player = self._require_player()
+        node, pl = player.current_node, player.playlist
+        if player.is_playing():
+            state = "playing"
+        elif node is None or self.last_error is not None:
+            state = "stopped"
+        else:
+            state = "paused"
+        return {"state": state, "mode": self.play_mode,
+                "playlist": pl.name if pl is not None else None,
+                "song": self._song_json(node) if node is not None else None,
+                "error": self.last_error}
+
+    async def player_command(self, request: Request, command: str):
+        player = self._require_player()
+        if command in ("pause", "resume", "stop"):
+            getattr(player, command)()
+            return self.player_state(request)
+        data = request.json()
+        if command == "play":
+            name = data.get("playlist")
+            if not isinstance(name, str) or not name:
+                raise ApiError(400, "playlist is required")
+            position = _int_field(data, "position") if "position" in data else None
+            pl = await self._loaded(name)
+            node = self._song(pl, position) if position is not None else None
+            if node is None:
+                pl.traversal.set_mode(self.play_mode)
+                node = pl.traversal.peek_next(None)
+        else:
+            pl = player.playlist or self.pm.current
+            if pl is None:
+                raise ApiError(409, "nothing is playing")
+            await self._load(pl)
+            pl.traversal.set_mode(self.play_mode)
+            current = player.current_node if player.current_node is not None and pl.contains(player.current_node) else None
+            if command == "next":
+                node = pl.traversal.peek_next(current, manual=True)
+            else:
+                node = pl.traversal.previous(current)
+        if node is None:
+            raise ApiError(409, "no song to play")
+        if self.pm.catalog.is_missing(node.track):
+            raise ApiError(409, f"file is missing: {node.filepath}")
+        pl.traversal.set_mode(self.play_mode)
+        player.play_node(pl, node)
+        return self.player_state(request)
+
+    async def set_mode(self, request: Request):
+        mode = request.json().get("mode")
+        if mode not in MODES:
+            raise ApiError(400, f"mode must be one of {', '.join(MODES)}")
+        self.play_mode = mode
+        for pl in (self.pm.current, self.player.playlist if self.player else None):
+            if pl is not None:
+                pl.traversal.set_mode(mode)
+        await self._run(database.set_meta, PLAY_MODE_KEY, mode, self.db_path)
+        return {"mode": mode}
+
+    # ===== Libraries =====
+    async def list_libraries(self, request: Request):
+        return await self._run(self.libraries.totals)
+
+    async def search_libraries(self, request: Request):
+        q = request.arg("q", "")
+        limit = max(1, min(request.int_arg("limit", 50), MAX_PAGE))
+        names = request.query.get("library") or None
+        try:
+            hits = await self._run(self.libraries.search, q, limit, names)
+        except ValueError as e:
+            raise ApiError(404, str(e))
+        return {"hits": [{"library": h.library, "playlist": h.playlist, "position": h.position, "id": h.song_id,
+                          "title": h.title, "path": h.filepath, "score": round(h.score, 3)} for h in hits]}
+
+    # ===== History =====
+    def history_view(self, request: Request, view: str):
+        if self.play_history is None:
+            raise ApiError(503, "play history is disabled")
+        limit = max(1, min(request.int_arg("limit", DEFAULT_PAGE), MAX_PAGE))
+        if view == "most-played":
+            entries = self.play_history.most_played(limit)
+        else:
+            entries = self.play_history.recently_played(limit)
+        return {"tracks": [{"id": e.track_id, "title": e.title, "path": e.path, "plays": e.plays,
+                            "skips": e.skips, "skip_rate": round(e.skip_rate, 3),
+                            "last_played": e.last_played} for e in entries]}
+
+
+async def serve(args, db_path: str):
+    store = SqliteStore(db_path)
+    pm = store.load()
+    journal = JournalLog(os.path.join(os.path.dirname(db_path), "journal.log"))
+    persistence = PersistenceService(on_commit=journal.checkpoint, store=store)
+
+    owner = threading.get_ident()
+
+    def sync():
+        # Smart playlists are queried on reader threads (ApiServer._load), which
+        # schedule pending edits on the loop first; only the loop may collect them
+        if threading.get_ident() == owner:
+            persistence.schedule(pm)
+        persistence.flush()
+
+    SmartEngine(pm, sync=sync, db_path=db_path)
+    journal.recover(pm, store.seq())
+    journal.attach(pm)
+    persistence.schedule(pm)
+    player = None
+    play_history = None
+    if not args.no_player:
+        if args.silent:
+            os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+        from player import MusicPlayer
+        player = MusicPlayer()
+        play_history = PlayHistory(db_path)
+        play_history.reload()
+
+    api = ApiServer(pm, persistence, player, play_history=play_history, db_path=db_path)
+    server = await api.start(args.host, args.port)
+    print(f"Listening on http://{args.host}:{args.port}", flush=True)
+    stop = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            asyncio.get_running_loop().add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass  # Windows: Ctrl+C still ends asyncio.run below
+    try:
+        await stop.wait()
+    finally:
+        await api.close()
+        if player is not None:
+            player.shutdown()
+        if play_history is not None:
+            play_history.close()
+        await asyncio.get_running_loop().run_in_executor(None, persistence.close)
+        journal.close()
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Serve playlists and playback as a JSON API on localhost")
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--host", default=HOST, choices=("127.0.0.1", "::1", "localhost"),
+                        help="loopback only; the API has no authentication")
+    parser.add_argument("--no-player", action="store_true", help="run without pygame; player endpoints return 503")
+    parser.add_argument("--silent", action="store_true", help="play through SDL's dummy audio driver")
+    parser.add_argument("--library", help="library name (default: main); a new name creates it")
+    parser.add_argument("--db", help="database file (default: database/playlist.db); the journal sits beside it")
+    args = parser.parse_args(argv)
+    db_path = database.DB_PATH
+    if args.db:
+        db_path = os.path.abspath(args.db)
+    elif args.library:
+        try:
+            db_path = library.resolve_library(args.library, create=True)
+        except ValueError as e:
+            parser.error(str(e))
+    database.init_db(db_path)
+    try:
+        asyncio.run(serve(args, db_path))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,356 @@
+import operator
+import os
+import re
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+import database
+from catalog import Track, TrackCatalog
+from playlist import Playlist, PlaylistManager, SongNode, _bucket_nodes
+from utils import normalize_path
+
+# ===== Rules =====
+# A rule text is clauses joined by ";" or "and", each "<field> <op> <value>":
+#   title contains love; path under /music/jazz; duration < 5m; added < 30d
+# Text values with spaces or the word "and" go in quotes.
+
+TEXT_FIELDS = {"title": "t.title", "path": "t.path"}
+NUMBER_FIELDS = {"duration": "a.duration", "bpm": "a.bpm", "loudness": "a.loudness", "size": "t.size"}
+# Fields that only change when the audio analysis does
+ANALYSIS_FIELDS = {"duration", "bpm", "loudness"}
+COMPARE = {"<": operator.lt, "<=": operator.le, ">": operator.gt, ">=": operator.ge,
+           "=": operator.eq, "!=": operator.ne}
+
+_CLAUSE = re.compile(
+    r"""\s*(\w+)\s+(contains|under|~|<=|>=|!=|<|>|=)\s*("[^"]*"|'[^']*'|.*?)\s*(?:;|\s+and\s+|$)""",
+    re.IGNORECASE
+)
+_SPAN = re.compile(r"(\d+(?:\.\d+)?)\s*([a-z]*)")
+_SECONDS = {"": None, "s": 1, "m": 60, "h": 3600, "d": 86400, "w": 7 * 86400}
+_BYTES = {"": 1, "b": 1, "kb": 1024, "mb": 1024 ** 2, "gb": 1024 ** 3}
+_ASCII_LOWER = str.maketrans("ABCDEFGHIJKLMNOPQRSTUVWXYZ", "abcdefghijklmnopqrstuvwxyz")
+
+def _fold(text: str) -> str:
+    # Case folding that matches SQLite's lower(), which only folds ASCII
+    return text.translate(_ASCII_LOWER)
+
+def _parse_span(text: str, default_unit: int) -> float:
+    # "5m", "4m30s", "90" (in default_unit seconds), "2w"
+    text = text.strip().lower()
+    total, pos = 0.0, 0
+    for m in _SPAN.finditer(text):
+        if m.start() != pos or m.group(2) not in _SECONDS:
+            raise ValueError(f"not a time span: {text!r}")
+        total += float(m.group(1)) * (_SECONDS[m.group(2)] or default_unit)
+        pos = m.end()
+        while pos < len(text) and text[pos] == " ":
+            pos += 1
+    if not text or pos != len(text):
+        raise ValueError(f"not a time span: {text!r}")
+    return total
+
+def _parse_size(text: str) -> float:
+    m = re.fullmatch(r"(\d+(?:\.\d+)?)\s*([a-z]*)", text.strip().lower())
+    if not m or m.group(2) not in _BYTES:
+        raise ValueError(f"not a size: {text!r}")
+    return float(m.group(1)) * _BYTES[m.group(2)]
+
+class Rule:
+    __slots__ = ("field", "op", "value")
+
+    def __init__(self, field: str, op: str, value: Any):
+        self.field = field
+        self.op = op
+        self.value = value
+
+    def sql(self, now: float) -> Optional[Tuple[str, List]]:
+        # (condition, params), or None when the rule can only be checked in Python
+        if self.op == "~":
+            return None
+        if self.field == "added":
+            return f"(? - t.added) {self.op} ?", [now, self.value]
+        if self.field in NUMBER_FIELDS:
+            return f"{NUMBER_FIELDS[self.field]} {self.op} ?", [self.value]
+        column = TEXT_FIELDS[self.field]
+        if self.op == "contains":
+            return f"instr(lower({column}), ?) > 0", [self.value]
+        if self.op == "under":
+            return f"{column} >= ? AND {column} < ?", [self.value, self.value[:-1] + chr(ord(self.value[-1]) + 1)]
+        return f"lower({column}) {self.op} ?", [self.value]
+
+    def test(self, value: Callable[[str], Any], now: float) -> bool:
+        current = value(self.field)
+        if current is None:
+            return False
+        if self.field == "added":
+            return COMPARE[self.op](now - current, self.value)
+        if self.field in NUMBER_FIELDS:
+            return COMPARE[self.op](current, self.value)
+        if self.op == "~":
+            return self.value.search(current) is not None
+        if self.op == "under":
+            return current.startswith(self.value)
+        current = _fold(current)
+        if self.op == "contains":
+            return self.value in current
+        return COMPARE[self.op](current, self.value)
+
+def _make_rule(field: str, op: str, raw: str) -> Rule:
+    if field in TEXT_FIELDS:
+        if op == "under" and field != "path":
+            raise ValueError("'under' only applies to path")
+        if op == "~":
+            try:
+                return Rule(field, op, re.compile(raw, re.IGNORECASE))
+            except re.error as e:
+                raise ValueError(f"bad pattern {raw!r}: {e}") from None
+        if op == "under":
+            return Rule(field, op, os.path.join(normalize_path(raw), ""))
+        if op not in ("contains", "=", "!="):
+            raise ValueError(f"'{op}' does not apply to {field}")
+        return Rule(field, op, _fold(raw))
+    if op not in COMPARE:
+        raise ValueError(f"'{op}' does not apply to {field}")
+    if field == "added":
+        return Rule(field, op, _parse_span(raw, _SECONDS["d"]))
+    if field == "duration":
+        return Rule(field, op, _parse_span(raw, _SECONDS["s"]))
+    if field == "size":
+        return Rule(field, op, _parse_size(raw))
+    if field in NUMBER_FIELDS:
+        try:
+            return Rule(field, op, float(raw))
+        except ValueError:
+            raise ValueError(f"not a number: {raw!r}") from None
+    raise ValueError(f"unknown field {field!r}")
+
+def parse_rules(text: str) -> List[Rule]:
+    rules, pos, text = [], 0, text.strip()
+    while pos < len(text):
+        m = _CLAUSE.match(text, pos)
+        if not m or m.end() == pos:
+            raise ValueError(f"cannot read rule at {text[pos:]!r}")
+        field, op, raw = m.group(1).lower(), m.group(2).lower(), m.group(3)
+        if raw[:1] in "\"'" and len(raw) >= 2 and raw[-1] == raw[0]:
+            raw = raw[1:-1]
+        if not raw:
+            raise ValueError(f"missing value for {field}")
+        rules.append(_make_rule(field, op, raw))
+        pos = m.end()
+    if not rules:
+        raise ValueError("a smart playlist needs at least one rule")
+    return rules
+
+# ===== Playlists =====
+class SmartPlaylist(Playlist):
+    # A read-only playlist of the library tracks (those in any playlist) that
+    # match every rule. Membership is evaluated in SQL when first needed and
+    # then kept current by SmartEngine; invalidate() starts over.
+    def __init__(self, name: str, rules: str, catalog: Optional[TrackCatalog] = None):
+        super().__init__(name, catalog)
+        self.conditions: List[Rule] = parse_rules(rules)
+        self.rules = rules
+        self.fields: Set[str] = {rule.field for rule in self.conditions}
+        # Makes the database current before an evaluation, and the database
+        # evaluated in; both set by SmartEngine
+        self.sync: Optional[Callable[[], None]] = None
+        self.db_path: Optional[str] = None
+        self.invalidate()
+
+    def invalidate(self):
+        self.head = self.tail = None
+        self._by_title, self._by_track, self._by_position = {}, {}, {}
+        if self._traversal is not None:
+            self._traversal.reset()
+        self.set_loader(0, self._evaluate)
+
+    def _evaluate(self) -> Iterator[List[Tuple]]:
+        if self.sync:
+            self.sync()
+        now = time.time()
+        if self.catalog.scan is not None:
+            # A store without SQL: every rule is tested on the loader rows
+            return ([row for row in page if self.matches(_row_value(row), now)] for page in self.catalog.scan())
+        where, params, in_python = [], [], []
+        for rule in self.conditions:
+            compiled = rule.sql(now)
+            if compiled is None:
+                in_python.append(rule)
+            else:
+                where.append(compiled[0])
+                params.extend(compiled[1])
+        pages = database.iter_smart_pages(" AND ".join(where), params, db_path=self.db_path)
+        if not in_python:
+            return pages
+        return ([row for row in page if all(rule.test(_row_value(row), now) for rule in in_python)]
+                for page in pages)
+
+    def matches(self, value: Callable[[str], Any], now: float) -> bool:
+        return all(rule.test(value, now) for rule in self.conditions)
+
+    def _append(self, track: Track):
+        self._link_tail(SongNode(track))
+
+    def _discard(self, track: Track):
+        for node in _bucket_nodes(self._by_track, track):
+            self._unlink(node)
+
+    # Songs come from the rules, so the editing methods refuse
+    def add_track(self, track: Track) -> Optional[SongNode]:
+        return None
+
+    def insert_after(self, prev: Optional[SongNode], title: str, filepath: str) -> Optional[SongNode]:
+        return None
+
+    def move_song(self, node: SongNode, after: Optional[SongNode]) -> bool:
+        return False
+
+    def relink(self, node: SongNode, prev: Optional[SongNode]) -> bool:
+        return False
+
+    def delete_node(self, node: SongNode) -> bool:
+        return False
+
+    def clear(self):
+        pass
+
+    def restore_cleared(self, state: Tuple) -> bool:
+        return False
+
+def _row_value(row: Tuple) -> Callable[[str], Any]:
+    # Loader rows only carry track columns, enough for the Python-only text rules
+    columns = {"path": row[3], "title": row[4], "size": row[5]}
+    return columns.get
+
+class SmartEngine:
+    # Keeps evaluated smart playlists current from the change tracker's events.
+    # A track added anywhere is tested against each smart playlist on its own,
+    # and a removed one only against those it belongs to, instead of rerunning
+    # every query. Rules over facts that change outside the tracker (analysis,
+    # file sizes, the clock) are refreshed per field with refresh().
+    def __init__(self, pm: PlaylistManager, analysis=None, sync: Optional[Callable[[], None]] = None,
+                 db_path: Optional[str] = None):
+        self.pm = pm
+        self.analysis = analysis  # analysis.AnalysisCache
+        self.sync = sync
+        self.db_path = db_path or database.DB_PATH
+        # Tracks allocated from here on were added this session
+        self._new_from = pm.tracker.next_track_id
+        self._added: Dict[int, Optional[float]] = {}
+        self._smart: List[SmartPlaylist] = []
+        self._collect()
+        pm.tracker.listeners.append(self._on_event)
+
+    def _collect(self):
+        self._smart = [pl for pl in self.pm.playlists.values() if isinstance(pl, SmartPlaylist)]
+        for pl in self._smart:
+            pl.sync = self._sync
+            pl.db_path = self.db_path
+
+    def _sync(self):
+        if self.sync:
+            self.sync()
+
+    def refresh(self, fields: Iterable[str]) -> List[SmartPlaylist]:
+        # Re-evaluate (lazily) the smart playlists whose rules use any of fields
+        fields = set(fields)
+        if "added" in fields:
+            self._added = {}
+        stale = [pl for pl in self._smart if pl.fields & fields]
+        for pl in stale:
+            pl.invalidate()
+        return stale
+
+    def _on_event(self, seq: int, kind: str, pl: Playlist, *details):
+        if pl is None:
+            if kind == "relocate" and self._smart:
+                # Path rules may now answer differently
+                self._tracks_removed({details[0]})
+                self._track_added(details[0])
+            return
+        if kind in ("create", "drop") and pl.rules is not None:
+            self._collect()
+            if kind == "create":
+                pl.invalidate()
+            return
+        if not self._smart or pl.rules is not None:
+            return
+        if kind == "add":
+            self._track_added(details[0].track)
+        elif kind == "remove":
+            self._tracks_removed({details[0].track})
+        elif kind == "remove_many":
+            self._tracks_removed({node.track for node, _ in details[0]})
+        elif kind == "clear":
+            self._tracks_removed(set(_chain(details[0][0])))
+        elif kind == "drop":
+            self._tracks_removed({node.track for node in pl})
+
+    def _track_added(self, track: Track):
+        targets = [s for s in self._smart if s.loaded and track not in s._by_track]
+        if not targets:
+            return
+        now = time.time()
+        value = self._facts(track, now)
+        for s in targets:
+            if s.matches(value, now):
+                s._append(track)
+
+    def _tracks_removed(self, tracks: Set[Track]):
+        members = {t for s in self._smart if s.loaded for t in tracks if t in s._by_track}
+        if not members:
+            return
+        gone = members - self._still_referenced(members)
+        for s in self._smart:
+            if s.loaded:
+                for track in gone:
+                    s._discard(track)
+
+    def _still_referenced(self, tracks: Set[Track]) -> Set[Track]:
+        # Loaded playlists are checked in memory; the stored rows of the others
+        # are current because unloaded playlists have no pending edits
+        found: Set[Track] = set()
+        unloaded: Set[int] = set()
+        for pl in self.pm.playlists.values():
+            if pl.rules is not None:
+                continue
+            if pl.loaded:
+                found.update(t for t in tracks if pl.has_track(t))
+            else:
+                unloaded.add(pl.id)
+        rest = {t.id: t for t in tracks - found if t.id is not None and t.id < self._new_from}
+        if unloaded and rest:
+            for track_id, playlist_id in database.track_references(list(rest), self.db_path):
+                if playlist_id in unloaded:
+                    found.add(rest[track_id])
+        return found
+
+    def _facts(self, track: Track, now: float) -> Callable[[str], Any]:
+        def value(field: str) -> Any:
+            if field == "title":
+                return track.title
+            if field == "path":
+                return track.path
+            if field == "size":
+                return track.size
+            if field == "added":
+                return self._added_at(track, now)
+            if self.analysis is None:
+                return None
+            if field == "duration":
+                return self.analysis.duration(track.path)
+            if field == "bpm":
+                return self.analysis.bpm(track.path)
+            return self.analysis.loudness(track.path)
+        return value
+
+    def _added_at(self, track: Track, now: float) -> Optional[float]:
+        if track.id is None or track.id >= self._new_from:
+            return now
+        if track.id not in self._added:
+            self._added.update(database.track_added_times([track.id], self.db_path))
+        return self._added.get(track.id)
+
+def _chain(node: Optional[SongNode]) -> Iterator[Track]:
+    while node:
+        yield node.track
+        node = node.next
@@ -0,0 +1,273 @@
+import tkinter as tk
+import tkinter.font as tkfont
+from typing import Callable, List, Optional, Set
+import ttkbootstrap as tb
+from playlist import Playlist, SongNode
+
+class VirtualSongList:
+    # A Listbox that only ever holds the rows on screen. Rows are read straight
+    # from the Playlist linked list, starting from an anchor (index, node) at the
+    # top of the window, so scrolling and edits cost O(visible rows) instead of
+    # rebuilding the whole list. Selection is kept by node, not by title or row:
+    # `selected` is the focused song and `selection` every highlighted one,
+    # including songs scrolled out of view (Ctrl/Shift-click, Ctrl+A).
+    def __init__(self, master, font=("Segoe UI", 12), on_select: Optional[Callable[[SongNode], None]] = None,
+                 label: Optional[Callable[[SongNode], str]] = None):
+        self.frame = tb.Frame(master)
+        self.listbox = tk.Listbox(self.frame, font=font, activestyle="none", exportselection=False,
+                                  selectmode="extended")
+        self.listbox.pack(side="left", fill="both", expand=True)
+        self.scrollbar = tb.Scrollbar(self.frame, orient="vertical", command=self._on_scrollbar)
+        self.scrollbar.pack(side="right", fill="y")
+        self.on_select = on_select
+        # Row text for a node; the title unless the owner decorates it
+        self.label: Callable[[SongNode], str] = label or (lambda node: node.title)
+
+        self.playlist: Optional[Playlist] = None
+        self.selected: Optional[SongNode] = None
+        self.selection: Set[SongNode] = set()
+        self._anchor_index = 0
+        self._anchor: Optional[SongNode] = None
+        self._window: List[SongNode] = []
+        self._rows = 1
+        self._line_height = tkfont.Font(font=font).metrics("linespace") + 2
+
+        self.listbox.bind("<Configure>", self._on_configure)
+        self.listbox.bind("<<ListboxSelect>>", self._on_listbox_select)
+        self.listbox.bind("<Control-Button-1>", self._on_toggle_click)
+        self.listbox.bind("<Shift-Button-1>", self._on_range_click)
+        self.listbox.bind("<Control-a>", lambda e: self.select_all())
+        self.listbox.bind("<MouseWheel>", lambda e: self._scroll_by(-1 if e.delta > 0 else 1, "units"))
+        self.listbox.bind("<Button-4>", lambda e: self._scroll_by(-1, "units"))
+        self.listbox.bind("<Button-5>", lambda e: self._scroll_by(1, "units"))
+        self.listbox.bind("<Up>", lambda e: self._step_selection(-1))
+        self.listbox.bind("<Down>", lambda e: self._step_selection(1))
+        self.listbox.bind("<Prior>", lambda e: self._scroll_by(-1, "pages"))
+        self.listbox.bind("<Next>", lambda e: self._scroll_by(1, "pages"))
+
+    def pack(self, **kwargs):
+        self.frame.pack(**kwargs)
+
+    # ===== Model =====
+    def set_playlist(self, pl: Optional[Playlist]):
+        self.playlist = pl
+        self.selected = None
+        self.selection = set()
+        self._anchor_index = 0
+        self._anchor = pl.head if pl else None
+        self.refresh()
+
+    def _length(self) -> int:
+        return self.playlist.length if self.playlist else 0
+
+    def _node_at_index(self, index: int) -> Optional[SongNode]:
+        # Walk from whichever of head, tail or the anchor is closest
+        pl = self.playlist
+        if not pl or index < 0 or index >= pl.length:
+            return None
+        pl.ensure_loaded()
+        candidates = [(index, pl.head, 0), (pl.length - 1 - index, pl.tail, pl.length - 1)]
+        if self._anchor is not None:
+            candidates.append((abs(index - self._anchor_index), self._anchor, self._anchor_index))
+        _, node, at = min(candidates, key=lambda c: c[0])
+        while at < index:
+            node, at = node.next, at + 1
+        while at > index:
+            node, at = node.prev, at - 1
+        return node
+
+    def index_of(self, node: SongNode) -> int:
+        # Order labels tell which way to walk from the anchor
+        anchor, at = self._anchor, self._anchor_index
+        if anchor is None:
+            anchor, at = self.playlist.head, 0
+        cur = anchor
+        if node.position >= anchor.position:
+            while cur is not node:
+                cur, at = cur.next, at + 1
+        else:
+            while cur is not node:
+                cur, at = cur.prev, at - 1
+        return at
+
+    # ===== Incremental updates =====
+    def is_before_anchor(self, node: SongNode) -> bool:
+        return self._anchor is not None and node is not self._anchor and node.position < self._anchor.position
+
+    def inserted(self, node: SongNode):
+        if self._anchor is None:
+            self._anchor, self._anchor_index = self.playlist.head, 0
+        elif self.is_before_anchor(node):
+            self._anchor_index += 1
+        self.refresh()
+
+    def removed(self, node: SongNode, was_before_anchor: bool):
+        # Call after the node was unlinked; was_before_anchor from is_before_anchor()
+        self.selection.discard(node)
+        if node is self.selected:
+            self.selected = None
+        if node is self._anchor:
+            following = self._window[1] if len(self._window) > 1 and self._window[0] is node else None
+            if following is not None:
+                self._anchor = following
+            else:
+                self._anchor, self._anchor_index = self.playlist.head, 0
+        elif was_before_anchor:
+            self._anchor_index -= 1
+        self.refresh()
+
+    def moved(self, node: SongNode, was_before_anchor: bool):
+        if node is self._anchor:
+            # Re-anchor on the head rather than track where the anchor went
+            self._anchor, self._anchor_index = self.playlist.head, 0
+        else:
+            if was_before_anchor:
+                self._anchor_index -= 1
+            if self.is_before_anchor(node):
+                self._anchor_index += 1
+        self.refresh()
+
+    def resync(self):
+        # After edits the view wasn't told about one by one (e.g. undo): keep
+        # the anchor if it is still in the list and recount its index
+        pl = self.playlist
+        self.selection = {node for node in self.selection if pl and pl.contains(node)}
+        if self.selected is not None and self.selected not in self.selection:
+            self.selected = None
+        if self._anchor is not None and pl and pl.contains(self._anchor):
+            self._anchor_index = 0
+            cur = pl.head
+            while cur is not self._anchor:
+                cur, self._anchor_index = cur.next, self._anchor_index + 1
+        else:
+            self._anchor, self._anchor_index = (pl.head if pl else None), 0
+        self.refresh()
+
+    # ===== Rendering =====
+    def refresh(self):
+        n = self._length()
+        top = max(0, min(self._anchor_index, n - self._rows))
+        if top != self._anchor_index or self._anchor is None:
+            self._anchor = self._node_at_index(top)
+            self._anchor_index = top
+        self._window = []
+        cur = self._anchor
+        while cur is not None and len(self._window) < self._rows:
+            self._window.append(cur)
+            cur = cur.next
+        self.listbox.delete(0, tk.END)
+        if self._window:
+            self.listbox.insert(tk.END, *(self.label(node) for node in self._window))
+        for i, node in enumerate(self._window):
+            if node in self.selection:
+                self.listbox.selection_set(i)
+        if n:
+            self.scrollbar.set(top / n, min(1.0, (top + len(self._window)) / n))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    def _scroll_to(self, index: int):
+        index = max(0, min(index, self._length() - self._rows))
+        if index != self._anchor_index:
+            self._anchor = self._node_at_index(index)
+            self._anchor_index = index
+        self.refresh()
+
+    def _scroll_by(self, amount: int, what: str):
+        step = self._rows if what == "pages" else 3
+        self._scroll_to(self._anchor_index + amount * step)
+        return "break"
+
+    def _on_scrollbar(self, *args):
+        if args[0] == "moveto":
+            self._scroll_to(int(float(args[1]) * self._length()))
+        elif args[0] == "scroll":
+            self._scroll_by(int(args[1]), args[2])
+
+    def _on_configure(self, event):
+        rows = max(1, event.height // self._line_height)
+        if rows != self._rows:
+            self._rows = rows
+            self.refresh()
+
+    # ===== Selection =====
+    def _on_listbox_select(self, _event=None):
+        # A plain click, or a drag over visible rows
+        nodes = [self._window[i] for i in self.listbox.curselection() if i < len(self._window)]
+        if not nodes:
+            return
+        self.selected = nodes[0]
+        self.selection = set(nodes)
+        if self.on_select:
+            self.on_select(self.selected)
+
+    def _row_node(self, y: int) -> Optional[SongNode]:
+        i = self.listbox.nearest(y)
+        return self._window[i] if 0 <= i < len(self._window) else None
+
+    def _on_toggle_click(self, event):
+        node = self._row_node(event.y)
+        if node is not None:
+            if node in self.selection:
+                self.selection.discard(node)
+                if node is self.selected:
+                    self.selected = next(iter(self.selection), None)
+            else:
+                self.selection.add(node)
+                self.selected = node
+            self.refresh()
+        return "break"
+
+    def _on_range_click(self, event):
+        # Everything between the focused song and the clicked one
+        node = self._row_node(event.y)
+        if node is None:
+            return "break"
+        start = self.selected if self.selected is not None else node
+        first, last = (start, node) if start.position <= node.position else (node, start)
+        self.selection = set()
+        cur = first
+        while cur is not None:
+            self.selection.add(cur)
+            if cur is last:
+                break
+            cur = cur.next
+        self.selected = node
+        self.refresh()
+        return "break"
+
+    def select_all(self):
+        if self.playlist:
+            self.selection = set(self.playlist)
+            if self.selected is None:
+                self.selected = self.playlist.head
+            self.refresh()
+        return "break"
+
+    def selected_nodes(self) -> List[SongNode]:
+        # Every selected song, in playlist order
+        return sorted(self.selection, key=lambda n: n.position)
+
+    def select(self, node: Optional[SongNode]):
+        # Select a node and scroll it into view
+        self.selected = node
+        self.selection = {node} if node is not None else set()
+        if node is None:
+            self.refresh()
+            return
+        if node not in self._window:
+            self._scroll_to(self.index_of(node) - self._rows // 2)
+        else:
+            self.refresh()
+        self.listbox.see(self._window.index(node))
+
+    def _step_selection(self, step: int):
+        if self.selected is None:
+            target = self._anchor
+        else:
+            target = self.selected.next if step > 0 else self.selected.prev
+        if target is not None:
+            self.select(target)
+            if self.on_select:
+                self.on_select(target)
+        return "break"
@@ -0,0 +1,20 @@
+import time
+from typing import Dict
+
+# Boot stages in the order main.py reaches them; "interactive" is time to interactive
+STAGES = ("window", "database", "playlists", "ui_modules", "analysis", "data", "interactive")
+
+class StartupTimer:
+    # Milliseconds from the first line of main.py to each boot stage. The
+    # loader thread marks its own stages, so the order of marks may vary.
+    def __init__(self, start: float):
+        self.start = start
+        self.stages: Dict[str, float] = {}
+
+    def mark(self, stage: str) -> float:
+        ms = round((time.perf_counter() - self.start) * 1000, 1)
+        self.stages[stage] = ms
+        return ms
+
+    def as_dict(self) -> Dict[str, float]:
+        return {stage: self.stages[stage] for stage in STAGES if stage in self.stages}
@@ -0,0 +1,363 @@
+import json
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterator, List, Optional, Tuple
+import database
+from database import PAGE_SIZE
+from playlist import ChangeSet, PlaylistManager
+
+# The log store's file, beside the SQLite database by default
+LOG_PATH = os.path.join(database.BASE_DIR, "database", "playlist.log")
+# The log is compacted into one snapshot record once the batches appended
+# since the last snapshot outgrow both this and the snapshot itself
+COMPACT_BYTES = 8 * 1024 * 1024
+
+class PlaylistStore:
+    # Where playlists live between sessions. load() builds a PlaylistManager,
+    # apply() writes the deltas of collected ChangeSets as one atomic batch,
+    # snapshot() rewrites everything from a PlaylistManager and seq() is the
+    # journal sequence number of the last change the store holds. apply() is
+    # called from the persistence thread, the rest from the owner's thread.
+    def load(self) -> PlaylistManager:
+        raise NotImplementedError
+
+    def apply(self, batch: List[ChangeSet]):
+        raise NotImplementedError
+
+    def snapshot(self, pm: PlaylistManager):
+        raise NotImplementedError
+
+    def seq(self) -> int:
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+class SqliteStore(PlaylistStore):
+    # The playlist database; everything else in the app (search, smart
+    # playlists, analysis, history) reads the same file
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path or database.DB_PATH
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def load(self) -> PlaylistManager:
+        return database.load_all_playlists(db_path=self.db_path)
+
+    def apply(self, batch: List[ChangeSet]):
+        if self._conn is None:
+            self._conn = database.open_connection(self.db_path, check_same_thread=False)
+        with self._conn:
+            for changes in batch:
+                database.apply_changes(self._conn, changes)
+
+    def snapshot(self, pm: PlaylistManager):
+        database.save_all_playlists(pm, self.db_path)
+
+    def seq(self) -> int:
+        return database.load_journal_seq(self.db_path)
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+# ===== In memory =====
+class MemoryStore(PlaylistStore):
+    # The stored rows kept in dicts, for tests and benchmarks. load() pages
+    # songs in lazily like the SQLite store. Smart playlists are evaluated in
+    # Python over the stored tracks, so rules on analysis facts or the time a
+    # track was added never match here.
+    def __init__(self):
+        # id -> [name, rules]
+        self.playlists: Dict[int, List] = {}
+        # id -> [path, title, size, mtime, hash, missing]
+        self.tracks: Dict[int, List] = {}
+        # playlist id -> {song id: [track id, position]}
+        self.songs: Dict[int, Dict[int, List[int]]] = {}
+        self._seq = 0
+        self._owner: Dict[int, int] = {}
+        self._by_path: Dict[str, int] = {}
+        # apply() runs on the persistence thread while pages are read on another
+        self._lock = threading.RLock()
+
+    def seq(self) -> int:
+        return self._seq
+
+    def apply(self, batch: List[ChangeSet]):
+        with self._lock:
+            for changes in batch:
+                self._apply(changes)
+
+    def _apply(self, changes: ChangeSet):
+        # The same order as database.apply_changes
+        for tid, path, title, size, mtime, hash_ in changes.track_inserts:
+            self.tracks[tid] = [path, title, size, mtime, hash_, 0]
+            self._by_path[path] = tid
+        for path, size, mtime, hash_, tid in changes.track_updates:
+            row = self.tracks[tid]
+            if self._by_path.get(row[0]) == tid:
+                del self._by_path[row[0]]
+            row[0], row[2], row[3], row[4] = path, size, mtime, hash_
+            self._by_path[path] = tid
+        for missing, tid in changes.track_missing:
+            self.tracks[tid][5] = int(missing)
+        for op in changes.playlist_ops:
+            if op[0] == "create":
+                self.playlists[op[1]] = [op[2], op[3]]
+                self.songs[op[1]] = {}
+            elif op[0] == "rename":
+                self.playlists[op[1]][0] = op[2]
+            elif op[0] == "drop":
+                self.playlists.pop(op[1], None)
+                for sid in self.songs.pop(op[1], {}):
+                    del self._owner[sid]
+        for sid in changes.deletes:
+            pid = self._owner.pop(sid, None)
+            if pid is not None:
+                del self.songs[pid][sid]
+        for position, sid in changes.moves:
+            pid = self._owner.get(sid)
+            if pid is not None:
+                self.songs[pid][sid][1] = position
+        for sid, pid, tid, position in changes.inserts:
+            self.songs[pid][sid] = [tid, position]
+            self._owner[sid] = pid
+        if changes.seq:
+            self._seq = changes.seq
+
+    def snapshot(self, pm: PlaylistManager):
+        # Tracks are upserted, as in the SQLite store, so the catalog survives
+        static = [pl for pl in pm.playlists.values() if pl.rules is None]
+        for pl in static:
+            pl.ensure_loaded()
+        pm.collect_changes()
+        with self._lock:
+            for track in pm.catalog:
+                self.tracks[track.id] = [track.path, track.title, track.size, track.mtime, track.hash, 0]
+            for tid, row in self.tracks.items():
+                row[5] = int(tid in pm.catalog.missing)
+            self._by_path = {row[0]: tid for tid, row in self.tracks.items()}
+            self.playlists = {pl.id: [pl.name, pl.rules] for pl in pm.playlists.values()}
+            self.songs = {pl.id: {} for pl in pm.playlists.values()}
+            self._owner = {}
+            for pl in static:
+                songs = self.songs[pl.id]
+                for node in pl:
+                    songs[node.id] = [node.track.id, node.position]
+                    self._owner[node.id] = pl.id
+            self._seq = pm.tracker.seq
+
+    def load(self) -> PlaylistManager:
+        # Imported here: smart.py builds on the database module
+        from smart import SmartPlaylist
+        pm = PlaylistManager()
+        with self._lock:
+            pm.tracker.reserve_ids(max(self.playlists, default=0), max(self._owner, default=0),
+                                   max(self.tracks, default=0))
+            pm.tracker.seq = self._seq
+            pm.catalog.lookup, pm.catalog.lookup_many = self._lookup, self._lookup_many
+            pm.catalog.scan = self._scan
+            pm.catalog.missing = {tid for tid, row in self.tracks.items() if row[5]}
+            playlists = sorted(self.playlists.items(), key=lambda item: item[1][0])
+            counts = {pid: len(self.songs[pid]) for pid, _ in playlists}
+        if not playlists:
+            pm.create_playlist("My Playlist")
+            return pm
+        for pid, (name, rules) in playlists:
+            if rules is not None:
+                pm.restore_playlist(pid, name, SmartPlaylist(name, rules))
+                continue
+            pl = pm.restore_playlist(pid, name)
+            pl.set_loader(counts[pid], lambda pid=pid: self._pages(pid))
+        pm.switch_playlist(pm.get_all_names()[0])
+        return pm
+
+    def _pages(self, pid: int) -> Iterator[List[Tuple]]:
+        # Loader rows (song id, position, track id, path, title, size, mtime, hash)
+        with self._lock:
+            tracks = self.tracks
+            rows = [(sid, pos, tid, *tracks[tid][:5]) for sid, (tid, pos) in self.songs.get(pid, {}).items()]
+        rows.sort(key=lambda row: (row[1], row[0]))
+        for i in range(0, len(rows), PAGE_SIZE):
+            yield rows[i:i + PAGE_SIZE]
+
+    def _scan(self) -> Iterator[List[Tuple]]:
+        # Every track some playlist holds, as smart playlist loader rows
+        with self._lock:
+            held = {tid for songs in self.songs.values() for tid, _ in songs.values()}
+            rows = [(None, 0, tid, *self.tracks[tid][:5]) for tid in sorted(held)]
+        for i in range(0, len(rows), PAGE_SIZE):
+            yield rows[i:i + PAGE_SIZE]
+
+    def _lookup(self, path: str) -> Optional[Tuple]:
+        with self._lock:
+            tid = self._by_path.get(path)
+            if tid is None:
+                return None
+            path, title, size, mtime, hash_, _ = self.tracks[tid]
+            return tid, title, size, mtime, hash_
+
+    def _lookup_many(self, paths: List[str]) -> Iterator[Tuple]:
+        with self._lock:
+            found = [(tid, *self.tracks[tid][:5]) for tid in
+                     (self._by_path.get(path) for path in paths) if tid is not None]
+        return iter(found)
+
+# ===== Append-only log =====
+class LogStore(MemoryStore):
+    # A MemoryStore made durable by one append-only file of JSON lines. Each
+    # apply() appends one line holding the whole batch and fsyncs it before
+    # returning, so a batch is either fully on disk or, torn by a crash, cut
+    # off when the file is next opened. Writes never seek or rewrite, which
+    # suits write-heavy use; the price is replaying the log on load. Once the
+    # batches outgrow the last snapshot, compact() writes the current state as
+    # a single snapshot line to a new file and swaps it in atomically.
+    def __init__(self, path: Optional[str] = None, compact_bytes: int = COMPACT_BYTES):
+        super().__init__()
+        self.path = path or LOG_PATH
+        self.compact_bytes = compact_bytes
+        self._file = None
+        self._snapshot_bytes = 0
+        self._log_bytes = 0
+
+    def _open(self):
+        # Replay the file into memory, dropping a torn last line
+        if self._file is not None:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        good = 0
+        # From scratch: this also runs again after a failed _cut()
+        self.playlists, self.tracks, self.songs = {}, {}, {}
+        self._seq, self._owner, self._by_path = 0, {}, {}
+        if os.path.exists(self.path):
+            with open(self.path, "rb") as f:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break
+                    if record[0] == "snapshot":
+                        self._restore(record)
+                        self._snapshot_bytes, self._log_bytes = len(line), 0
+                    else:
+                        for changes in record[1]:
+                            self._apply(_decode(changes))
+                        self._log_bytes += len(line)
+                    good += len(line)
+        self._file = open(self.path, "ab")
+        if self._file.tell() != good:
+            self._file.truncate(good)
+            os.fsync(self._file.fileno())
+
+    def load(self) -> PlaylistManager:
+        with self._lock:
+            self._open()
+        return super().load()
+
+    def seq(self) -> int:
+        with self._lock:
+            self._open()
+            return self._seq
+
+    def apply(self, batch: List[ChangeSet]):
+        line = (json.dumps(["batch", [_encode(changes) for changes in batch]],
+                           ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+        with self._lock:
+            self._open()
+            # Durable first, then visible; a failed write leaves memory as it
+            # was and the file cut back to where the line began, so a retry or
+            # the next batch does not land behind a torn fragment
+            end = self._file.tell()
+            try:
+                self._file.write(line)
+                self._file.flush()
+                os.fsync(self._file.fileno())
+            except BaseException:
+                self._cut(end)
+                raise
+            for changes in batch:
+                self._apply(changes)
+            self._log_bytes += len(line)
+            if self._log_bytes > max(self.compact_bytes, self._snapshot_bytes):
+                self.compact()
+
+    def snapshot(self, pm: PlaylistManager):
+        with self._lock:
+            self._open()
+            super().snapshot(pm)
+            self.compact()
+
+    def compact(self):
+        with self._lock:
+            self._open()
+            songs = [[sid, pid, tid, pos] for pid, rows in self.songs.items() for sid, (tid, pos) in rows.items()]
+            record = ["snapshot", self._seq,
+                      [[pid, name, rules] for pid, (name, rules) in self.playlists.items()],
+                      [[tid, *row] for tid, row in self.tracks.items()], songs]
+            line = (json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+            tmp = self.path + ".tmp"
+            with open(tmp, "wb") as out:
+                out.write(line)
+                out.flush()
+                os.fsync(out.fileno())
+            self._file.close()
+            os.replace(tmp, self.path)
+            _sync_dir(self.path)
+            self._file = open(self.path, "ab")
+            self._snapshot_bytes, self._log_bytes = len(line), 0
+
+    def _cut(self, size: int):
+        # Closing drops whatever the failed write left buffered; if the cut
+        # fails too, _file stays None and the next call replays the file
+        file, self._file = self._file, None
+        try:
+            file.close()
+        except OSError:
+            pass
+        with open(self.path, "r+b") as f:
+            f.truncate(size)
+            os.fsync(f.fileno())
+        self._file = open(self.path, "ab")
+
+    def _restore(self, record: list):
+        _, self._seq, playlists, tracks, songs = record
+        self.playlists = {pid: [name, rules] for pid, name, rules in playlists}
+        self.tracks = {row[0]: row[1:] for row in tracks}
+        self._by_path = {row[1]: row[0] for row in tracks}
+        self.songs = {pid: {} for pid in self.playlists}
+        self._owner = {}
+        for sid, pid, tid, pos in songs:
+            self.songs[pid][sid] = [tid, pos]
+            self._owner[sid] = pid
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+def _encode(changes: ChangeSet) -> list:
+    return [changes.seq, changes.playlist_ops, changes.track_inserts, changes.track_updates,
+            changes.track_missing, changes.inserts, changes.deletes, changes.moves]
+
+def _decode(fields: list) -> ChangeSet:
+    changes = ChangeSet()
+    (changes.seq, changes.playlist_ops, changes.track_inserts, changes.track_updates,
+     changes.track_missing, changes.inserts, changes.deletes, changes.moves) = fields
+    return changes
+
+def _sync_dir(path: str):
+    # Makes the rename itself durable; directories cannot be opened on Windows
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
@@ -0,0 +1,215 @@
+import random
+import threading
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+from playlist import Playlist, SongNode
+
+SEQUENTIAL, REPEAT_ONE, REPEAT_ALL, SHUFFLE = "sequential", "repeat-one", "repeat-all", "shuffle"
+MODES = (SEQUENTIAL, REPEAT_ONE, REPEAT_ALL, SHUFFLE)
+# meta key of the last chosen mode
+PLAY_MODE_KEY = "play_mode"
+# Songs remembered for "previous" in shuffle mode
+HISTORY_LIMIT = 500
+
+class Traversal:
+    # Play order over one playlist. Sequential and repeat modes follow the
+    # linked list. Shuffle is a Fisher–Yates permutation drawn lazily one step
+    # at a time over a live array of the playlist's songs: the songs not heard
+    # this round sit in front, a draw swaps its pick behind them, and a new
+    # round just moves the boundary back, so each step is O(1). The playlist
+    # reports songs linked in or unlinked, which join or leave the array in
+    # place (a new song joins the current round); relabeling does not matter.
+    # The player peeks the upcoming song to prebuffer it and reports what
+    # actually started, so a peek stays put until then.
+    def __init__(self, pl: Playlist, rng: Optional[random.Random] = None):
+        self.pl = pl
+        self.mode = SEQUENTIAL
+        # Playlist edits and the player's owner thread both come through here
+        self._lock = threading.RLock()
+        self._rng = rng or random.Random()
+        self._current: Optional[SongNode] = None
+        self._history: Deque[SongNode] = deque(maxlen=HISTORY_LIMIT)
+        self._forward: List[SongNode] = []
+        # (song it follows, song drawn) until one of them changes
+        self._upcoming: Optional[Tuple[Optional[SongNode], SongNode]] = None
+        # Shuffle only, built on the first draw: every song, those before
+        # _left not heard yet this round, and each song's index in it
+        self._order: Optional[List[SongNode]] = None
+        self._slot: Dict[SongNode, int] = {}
+        self._left = 0
+
+    def set_mode(self, mode: str):
+        if mode not in MODES:
+            raise ValueError(f"unknown play mode: {mode}")
+        with self._lock:
+            if mode == self.mode:
+                return
+            self.mode = mode
+            self._upcoming = None
+            if mode != SHUFFLE:
+                # The round is only kept while shuffling
+                self.reset()
+
+    def reset(self):
+        # Forget the shuffle round, e.g. after the playlist swapped all its songs
+        with self._lock:
+            self._order, self._slot, self._left = None, {}, 0
+
+    # ===== Steps =====
+    def peek_next(self, node: Optional[SongNode], manual: bool = False) -> Optional[SongNode]:
+        # The song after `node` (the first one when None). Repeat-one only
+        # repeats on its own; a manual step moves on like repeat-all.
+        with self._lock:
+            pl = self.pl
+            pl.ensure_loaded()
+            if self.mode == SHUFFLE:
+                return self._next_shuffled(node)
+            if node is None:
+                return pl.head
+            if self.mode == REPEAT_ONE and not manual:
+                return node
+            nxt = node.next
+            if nxt is None and self.mode != SEQUENTIAL:
+                nxt = pl.head
+            return nxt
+
+    def previous(self, node: Optional[SongNode]) -> Optional[SongNode]:
+        # In shuffle mode this walks back through what was played, and next
+        # steps forward again over the same songs
+        with self._lock:
+            pl = self.pl
+            pl.ensure_loaded()
+            if self.mode != SHUFFLE:
+                if node is None:
+                    return pl.tail
+                prv = node.prev
+                if prv is None and self.mode != SEQUENTIAL:
+                    prv = pl.tail
+                return prv
+            while self._history:
+                prv = self._history.pop()
+                if prv is not node and pl.contains(prv):
+                    if self._current is not None:
+                        self._forward.append(self._current)
+                    self._current = prv
+                    self._return_upcoming(None)
+                    return prv
+            return None
+
+    def started(self, node: SongNode):
+        # A song began playing, whether by stepping or picked by hand
+        with self._lock:
+            if node is self._current:
+                return
+            if self._current is not None:
+                self._history.append(self._current)
+            if self._forward and self._forward[-1] is node:
+                self._forward.pop()
+            else:
+                self._forward.clear()
+            self._current = node
+            self._return_upcoming(node)
+            if self.mode == SHUFFLE:
+                self._hear(node)
+
+    def linked(self, node: SongNode):
+        # Called by the playlist for every song it links in; it joins this round
+        if self._order is None:
+            return
+        with self._lock:
+            if self._order is None or node in self._slot:
+                return
+            self._slot[node] = len(self._order)
+            self._order.append(node)
+            self._swap(len(self._order) - 1, self._left)
+            self._left += 1
+
+    def unlinked(self, node: SongNode):
+        # Called by the playlist for every song it unlinks: swap-remove
+        if self._order is None:
+            return
+        with self._lock:
+            if self._order is None:
+                return
+            i = self._slot.pop(node, None)
+            if i is None:
+                return
+            order = self._order
+            if i < self._left:
+                # Fill the hole from the end of the unheard part first
+                self._left -= 1
+                if i != self._left:
+                    order[i] = order[self._left]
+                    self._slot[order[i]] = i
+                i = self._left
+            last = order.pop()
+            if i < len(order):
+                order[i] = last
+                self._slot[last] = i
+
+    # ===== Shuffle =====
+    def _next_shuffled(self, node: Optional[SongNode]) -> Optional[SongNode]:
+        contains = self.pl.contains
+        while self._forward:
+            if contains(self._forward[-1]):
+                return self._forward[-1]
+            self._forward.pop()
+        upcoming = self._upcoming
+        if upcoming is not None and upcoming[0] is node and contains(upcoming[1]):
+            return upcoming[1]
+        self._return_upcoming(None)
+        if self._order is None:
+            self._new_round()
+        if node is not None:
+            self._hear(node)
+        pick = self._draw(node)
+        self._upcoming = (node, pick) if pick is not None else None
+        return pick
+
+    def _return_upcoming(self, started: Optional[SongNode]):
+        # A peeked song that did not start goes back into this round
+        upcoming, self._upcoming = self._upcoming, None
+        if upcoming is not None and upcoming[1] is not started:
+            self._unhear(upcoming[1])
+
+    def _draw(self, avoid: Optional[SongNode]) -> Optional[SongNode]:
+        fresh = self._left == 0
+        if fresh and not self._new_round():
+            return None
+        # A new round keeps the song just played out of its first pick only
+        held = fresh and avoid is not None and self._left > 1 and avoid in self._slot
+        if held:
+            self._hear(avoid)
+        pick = self._order[self._rng.randrange(self._left)]
+        self._hear(pick)
+        if held:
+            self._unhear(avoid)
+        return pick
+
+    def _new_round(self) -> bool:
+        # Everything was heard: start over
+        if self._order is None:
+            self._order = list(self.pl)
+            self._slot = {node: i for i, node in enumerate(self._order)}
+        self._left = len(self._order)
+        return self._left > 0
+
+    def _hear(self, node: SongNode):
+        # Move node behind the unheard part of the round
+        i = self._slot.get(node)
+        if self._order is not None and i is not None and i < self._left:
+            self._left -= 1
+            self._swap(i, self._left)
+
+    def _unhear(self, node: SongNode):
+        i = self._slot.get(node)
+        if self._order is not None and i is not None and i >= self._left:
+            self._swap(i, self._left)
+            self._left += 1
+
+    def _swap(self, i: int, j: int):
+        if i != j:
+            order = self._order
+            order[i], order[j] = order[j], order[i]
+            self._slot[order[i]] = i
+            self._slot[order[j]] = j
@@ -1,4 +1,6 @@
+import hashlib
 import os
+from typing import List, Optional
 
 AUDIO_EXTS = {".mp3", ".wav", ".ogg", ".flac", ".aac", ".m4a"}
 
@@ -12,3 +14,24 @@ def pretty_title(filename: str) -> str:
 
 def normalize_path(path: str) -> str:
     return os.path.abspath(os.path.expanduser(path))
+
+def normalize_paths(paths: List[str], base: Optional[str] = None) -> List[str]:
+    # Same result as normalize_path, with relative paths taken against base
+    # (default: the working directory) and the directory lookup done once
+    base = os.path.abspath(base) if base else os.getcwd()
+    join, normpath, expanduser = os.path.join, os.path.normpath, os.path.expanduser
+    return [normpath(join(base, expanduser(p) if p.startswith("~") else p)) for p in paths]
+
+# Bytes read from each end of a file for its content hash
+HASH_CHUNK = 64 * 1024
+
+def fast_hash(path: str, size: int) -> str:
+    # Size plus head and tail blocks: cheap for large files, and stable across
+    # renames and moves, which only change the path
+    h = hashlib.blake2b(str(size).encode(), digest_size=16)
+    with open(path, "rb") as f:
+        h.update(f.read(HASH_CHUNK))
+        if size > 2 * HASH_CHUNK:
+            f.seek(-HASH_CHUNK, os.SEEK_END)
+            h.update(f.read(HASH_CHUNK))
+    return h.hexdigest()
@@ -0,0 +1,209 @@
+import os
+import queue
+import threading
+import time
+from typing import Dict, Optional
+import cv2
+import numpy as np
+from PIL import Image, ImageTk
+
+BASE_DIR = os.path.dirname(os.path.dirname(__file__))
+CACHE_DIR = os.path.join(BASE_DIR, "assets", ".frame_cache")
+
+TARGET_FPS = 30
+MIN_FPS = 8
+# Decoded frames waiting for the Tk thread; the decoder blocks when this is full
+QUEUE_FRAMES = 3
+# Clips up to this size (at display resolution) are pre-decoded into a memory-mapped cache
+MAX_CACHE_BYTES = 512 * 1024 * 1024
+# A tick arriving this late means the Tk thread is busy with something else
+LATE_MS = 20.0
+# After this many late ticks in a row, hold the current frame until the UI is idle
+STALL_TICKS = 15
+
+
+class FrameMetrics:
+    def __init__(self):
+        self.decoded = 0
+        self.presented = 0
+        self.dropped = 0
+        self.decode_ms = 0.0
+        self.present_ms = 0.0
+        self.lateness_ms = 0.0
+        self.fps = float(TARGET_FPS)
+        self.cached = False
+
+    @staticmethod
+    def _ewma(avg: float, sample: float) -> float:
+        return avg * 0.9 + sample * 0.1
+
+    def as_dict(self) -> Dict[str, float]:
+        return {
+            "decoded": self.decoded,
+            "presented": self.presented,
+            "dropped": self.dropped,
+            "decode_ms": round(self.decode_ms, 2),
+            "present_ms": round(self.present_ms, 2),
+            "lateness_ms": round(self.lateness_ms, 2),
+            "fps": round(self.fps, 1),
+            "cached": self.cached,
+        }
+
+
+class VideoBackground:
+    # Decode, resize and colour-convert on a worker thread into a small pool of
+    # reused buffers; the Tk thread only pastes ready frames into one PhotoImage.
+    # Short clips are decoded once into a memory-mapped cache at display size and
+    # replayed from it. The frame rate backs off while the UI is busy.
+    def __init__(self, canvas, video_path: str, use_cache: bool = True):
+        self.canvas = canvas
+        self.video_path = video_path
+        self.width = canvas.winfo_screenwidth()
+        self.height = canvas.winfo_screenheight()
+        self.metrics = FrameMetrics()
+
+        self._ready: "queue.Queue[np.ndarray]" = queue.Queue(maxsize=QUEUE_FRAMES)
+        self._free: "queue.Queue[np.ndarray]" = queue.Queue()
+        for _ in range(QUEUE_FRAMES + 2):
+            self._free.put(np.empty((self.height, self.width, 3), dtype=np.uint8))
+        self._stop = threading.Event()
+        self._use_cache = use_cache
+
+        self.photo = ImageTk.PhotoImage("RGB", (self.width, self.height))
+        self.image_id = self.canvas.create_image(0, 0, anchor="nw", image=self.photo)
+        self._on_screen: Optional[np.ndarray] = None
+        self._interval_ms = 1000.0 / TARGET_FPS
+        self._expected = time.perf_counter()
+        self._late_streak = 0
+
+        self._thread = threading.Thread(target=self._decode_loop, name="video-decode", daemon=True)
+        self._thread.start()
+        self.canvas.after(0, self.update_frame)
+
+    # ===== Worker thread =====
+    def _cache_path(self) -> str:
+        st = os.stat(self.video_path)
+        name = f"{os.path.basename(self.video_path)}.{st.st_size}.{int(st.st_mtime)}.{self.width}x{self.height}.rgb"
+        return os.path.join(CACHE_DIR, name)
+
+    def _convert(self, frame: np.ndarray, out: np.ndarray):
+        cv2.resize(frame, (self.width, self.height), dst=out, interpolation=cv2.INTER_LINEAR)
+        cv2.cvtColor(out, cv2.COLOR_BGR2RGB, dst=out)
+
+    def _open_cache(self, cap) -> Optional[np.memmap]:
+        count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        frame_bytes = self.width * self.height * 3
+        if not self._use_cache or count <= 0 or count * frame_bytes > MAX_CACHE_BYTES:
+            return None
+        path = self._cache_path()
+        shape = (count, self.height, self.width, 3)
+        if os.path.exists(path) and os.path.getsize(path) == count * frame_bytes:
+            return np.memmap(path, dtype=np.uint8, mode="r", shape=shape)
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp = path + ".part"
+        frames = np.memmap(tmp, dtype=np.uint8, mode="w+", shape=shape)
+        for i in range(count):
+            if self._stop.is_set():
+                del frames
+                os.remove(tmp)
+                return None
+            ret, frame = cap.read()
+            if not ret:
+                del frames
+                os.remove(tmp)
+                return None
+            self._convert(frame, frames[i])
+        frames.flush()
+        del frames
+        os.replace(tmp, path)
+        return np.memmap(path, dtype=np.uint8, mode="r", shape=shape)
+
+    def _put(self, frame: np.ndarray):
+        while not self._stop.is_set():
+            try:
+                self._ready.put(frame, timeout=0.2)
+                return
+            except queue.Full:
+                continue
+
+    def _decode_loop(self):
+        cap = cv2.VideoCapture(self.video_path)
+        try:
+            if not cap.isOpened():
+                return
+            cached = None
+            try:
+                cached = self._open_cache(cap)
+            except OSError:
+                cached = None
+            if cached is not None:
+                # Replay from the page cache: no decoding, no resizing, no copies
+                self.metrics.cached = True
+                cap.release()
+                i = 0
+                while not self._stop.is_set():
+                    self._put(cached[i])
+                    i = (i + 1) % len(cached)
+                return
+            cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            while not self._stop.is_set():
+                t0 = time.perf_counter()
+                ret, frame = cap.read()
+                if not ret:
+                    cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                    continue
+                try:
+                    buf = self._free.get(timeout=0.2)
+                except queue.Empty:
+                    self.metrics.dropped += 1
+                    continue
+                self._convert(frame, buf)
+                self.metrics.decoded += 1
+                self.metrics.decode_ms = FrameMetrics._ewma(self.metrics.decode_ms, (time.perf_counter() - t0) * 1000)
+                self._put(buf)
+        finally:
+            cap.release()
+
+    # ===== Tk thread =====
+    def update_frame(self):
+        if self._stop.is_set():
+            return
+        now = time.perf_counter()
+        late = max(0.0, (now - self._expected) * 1000)
+        self.metrics.lateness_ms = FrameMetrics._ewma(self.metrics.lateness_ms, late)
+        self._adapt(late)
+
+        if self._late_streak < STALL_TICKS:
+            try:
+                frame = self._ready.get_nowait()
+            except queue.Empty:
+                frame = None
+            if frame is not None:
+                t0 = time.perf_counter()
+                self.photo.paste(Image.fromarray(frame))
+                self.metrics.present_ms = FrameMetrics._ewma(self.metrics.present_ms, (time.perf_counter() - t0) * 1000)
+                self.metrics.presented += 1
+                self._release(self._on_screen)
+                self._on_screen = frame
+
+        delay = int(self._interval_ms)
+        self._expected = time.perf_counter() + delay / 1000.0
+        self.canvas.after(delay, self.update_frame)
+
+    def _adapt(self, late_ms: float):
+        # Slow down while ticks arrive late, speed back up once they are on time
+        if late_ms > LATE_MS:
+            self._late_streak += 1
+            self._interval_ms = min(1000.0 / MIN_FPS, self._interval_ms * 1.25)
+        else:
+            self._late_streak = 0
+            self._interval_ms = max(1000.0 / TARGET_FPS, self._interval_ms * 0.95)
+        self.metrics.fps = 1000.0 / self._interval_ms
+
+    def _release(self, frame: Optional[np.ndarray]):
+        # Buffers from the pool go back to it; memmap views are simply dropped
+        if frame is not None and not isinstance(frame, np.memmap):
+            self._free.put(frame)
+
+    def stop(self):
+        self._stop.set()
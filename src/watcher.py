@@ -0,0 +1,342 @@
+import ctypes
+import ctypes.util
+import os
+import queue
+import select
+import struct
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Set, Tuple
+import database
+from playlist import Playlist, PlaylistManager
+from scanner import LibraryScanner, TrackInfo, read_metadata, walk_audio_files
+from utils import is_audio_file, normalize_path
+
+# Events arriving within this window are handled as one batch...
+DEBOUNCE_SECONDS = 0.5
+# ...but a steady stream (e.g. a large copy) is still handled this often
+MAX_DELAY_SECONDS = 3.0
+POLL_SECONDS = 5.0
+
+# inotify(7)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+_EVENT = struct.Struct("iIII")
+
+# Raw events: ("changed", file), ("gone", file or folder), ("rescan", root)
+RawEvent = Tuple[str, str]
+
+class WatchBatch:
+    __slots__ = ("changed", "moved", "missing")
+
+    def __init__(self, changed: List[TrackInfo], moved: List[Tuple[str, TrackInfo]], missing: List[str]):
+        # New or modified files
+        self.changed = changed
+        # (old path, file now holding the same content)
+        self.moved = moved
+        # Paths of stored tracks that disappeared without a match
+        self.missing = missing
+
+    def is_empty(self) -> bool:
+        return not (self.changed or self.moved or self.missing)
+
+# ===== Event sources =====
+class _Inotify:
+    # One watch per folder; new folders are watched as they appear
+    def __init__(self, root: str):
+        self.root = root
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._dirs: Dict[int, str] = {}
+        try:
+            self._add_tree(root)
+        except OSError:
+            self.close()
+            raise
+
+    def _add_tree(self, top: str) -> List[str]:
+        # Watch top and every folder below it; returns the audio files already there
+        files = []
+        for folder, _, names in os.walk(top):
+            wd = self._libc.inotify_add_watch(self.fd, os.fsencode(folder), WATCH_MASK)
+            if wd < 0:
+                # ENOSPC here means fs.inotify.max_user_watches is exhausted
+                raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {folder}")
+            self._dirs[wd] = folder
+            files.extend(os.path.join(folder, n) for n in names if is_audio_file(n))
+        return files
+
+    def _drop_tree(self, top: str):
+        inside = os.path.join(top, "")
+        for wd, folder in list(self._dirs.items()):
+            if folder == top or folder.startswith(inside):
+                self._libc.inotify_rm_watch(self.fd, wd)
+                del self._dirs[wd]
+
+    def read(self, timeout: float) -> List[RawEvent]:
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events: List[RawEvent] = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT.unpack_from(data, offset)
+            name = data[offset + _EVENT.size:offset + _EVENT.size + length].rstrip(b"\0")
+            offset += _EVENT.size + length
+            if mask & IN_Q_OVERFLOW:
+                events.append(("rescan", self.root))
+                continue
+            folder = self._dirs.get(wd)
+            if mask & IN_IGNORED:
+                self._dirs.pop(wd, None)
+                continue
+            if folder is None:
+                continue
+            if mask & IN_DELETE_SELF:
+                if folder == self.root:
+                    events.append(("gone", folder))
+                continue
+            path = os.path.join(folder, os.fsdecode(name))
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    try:
+                        events.extend(("changed", f) for f in self._add_tree(path))
+                    except OSError:
+                        events.append(("rescan", self.root))
+                elif mask & IN_MOVED_FROM:
+                    self._drop_tree(path)
+                    events.append(("gone", path))
+                elif mask & IN_DELETE:
+                    events.append(("gone", path))
+            elif is_audio_file(path):
+                # Files count once fully written; IN_CREATE alone is a half-copied file
+                if mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                    events.append(("changed", path))
+                elif mask & (IN_DELETE | IN_MOVED_FROM):
+                    events.append(("gone", path))
+        return events
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+class _Poller:
+    # Fallback: compare (size, mtime) snapshots of the tree every POLL_SECONDS
+    def __init__(self, root: str, interval: float = POLL_SECONDS):
+        self.root = root
+        self.interval = interval
+        self._snapshot = self._walk()
+        self._next = time.monotonic() + interval
+
+    def _walk(self) -> Dict[str, Tuple[int, float]]:
+        snapshot = {}
+        for entry in walk_audio_files(self.root):
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            snapshot[entry.path] = (st.st_size, st.st_mtime)
+        return snapshot
+
+    def read(self, timeout: float) -> List[RawEvent]:
+        wait = self._next - time.monotonic()
+        if wait > timeout:
+            time.sleep(timeout)
+            return []
+        time.sleep(max(0.0, wait))
+        self._next = time.monotonic() + self.interval
+        old, self._snapshot = self._snapshot, self._walk()
+        events: List[RawEvent] = [("gone", p) for p in old.keys() - self._snapshot.keys()]
+        events.extend(("changed", p) for p, stat in self._snapshot.items() if old.get(p) != stat)
+        return events
+
+    def close(self):
+        pass
+
+# ===== Watcher =====
+class LibraryWatcher:
+    # Follows a music folder on a background thread. Filesystem events are
+    # coalesced per path into batches; each batch reads the new files' headers,
+    # pairs deleted tracks with new files of the same size and content hash
+    # (moves), and is handed to the Tk thread through `batches` for apply_batch().
+    def __init__(self, root: str, use_inotify: bool = True, db_path: Optional[str] = None):
+        self.root = normalize_path(root)
+        self.db_path = db_path or database.DB_PATH
+        self.use_inotify = use_inotify and sys.platform.startswith("linux")
+        self.batches: "queue.Queue[WatchBatch]" = queue.Queue()
+        self.mode: Optional[str] = None  # "inotify" or "polling" once started
+        self.last_error: Optional[BaseException] = None
+        self.scanner = LibraryScanner(db_path=self.db_path)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="watcher", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        self._stop.set()
+        self.scanner.cancel()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _open_source(self):
+        if self.use_inotify:
+            try:
+                source = _Inotify(self.root)
+                self.mode = "inotify"
+                return source
+            except (OSError, AttributeError) as e:
+                self.last_error = e
+        self.mode = "polling"
+        return _Poller(self.root)
+
+    def _run(self):
+        if not os.path.isdir(self.root):
+            return
+        # Watches go up before the baseline, so nothing slips in between
+        source = self._open_source()
+        try:
+            self._reconcile()
+            changed: Set[str] = set()
+            gone: Set[str] = set()
+            first = last = 0.0
+            while not self._stop.is_set():
+                events = source.read(DEBOUNCE_SECONDS if changed or gone else 1.0)
+                now = time.monotonic()
+                for kind, path in events:
+                    if kind == "rescan":
+                        changed.clear()
+                        gone.clear()
+                        self._reconcile()
+                        continue
+                    path = normalize_path(path)
+                    (changed if kind == "changed" else gone).add(path)
+                    if not first:
+                        first = now
+                    last = now
+                if (changed or gone) and (now - last >= DEBOUNCE_SECONDS or now - first >= MAX_DELAY_SECONDS):
+                    batch_changed, batch_gone = changed, gone
+                    changed, gone = set(), set()
+                    first = last = 0.0
+                    self._handle(batch_changed, batch_gone)
+        except Exception as e:
+            self.last_error = e
+        finally:
+            source.close()
+
+    def _reconcile(self):
+        # Full comparison of the folder with the stored tracks under it, at
+        # start-up and whenever inotify dropped events
+        files = self.scanner.scan(self.root)
+        known = database.tracks_under(self.root, self.db_path)
+        on_disk = {info.path for info in files}
+        changed = [info for info in files
+                   if info.path not in known or known[info.path][4]
+                   or known[info.path][1:3] != (info.size, info.mtime)]
+        gone = [path for path, row in known.items() if path not in on_disk and not row[4]]
+        self._publish(self._resolve(changed, gone, known))
+
+    def _handle(self, changed: Set[str], gone: Set[str]):
+        # The latest state on disk decides: a file created then deleted is gone
+        fresh: List[TrackInfo] = []
+        removed: List[str] = []
+        for path in changed | gone:
+            try:
+                st = os.stat(path)
+            except OSError:
+                removed.append(path)
+                continue
+            if os.path.isfile(path) and is_audio_file(path):
+                fresh.append(read_metadata(path, st.st_size, st.st_mtime))
+        known = database.tracks_at([info.path for info in fresh] + removed, self.db_path)
+        # A vanished folder takes every track below it along
+        for path in removed:
+            if path not in known:
+                known.update(database.tracks_under(path, self.db_path))
+        removed_set = set(removed)
+        folders = [os.path.join(r, "") for r in removed]
+        gone_tracks = [p for p in known if p in removed_set or any(p.startswith(f) for f in folders)]
+        database.update_scan_cache([info.as_row() for info in fresh], removed, self.db_path)
+        self._publish(self._resolve(fresh, gone_tracks, known))
+
+    def _resolve(self, changed: List[TrackInfo], gone: List[str], known: Dict[str, Tuple]) -> WatchBatch:
+        # A stored track that vanished while a file with its size and hash
+        # appeared at an unknown path was moved or renamed
+        by_content: Dict[Tuple, List[TrackInfo]] = {}
+        for info in changed:
+            if info.path not in known and info.hash:
+                by_content.setdefault((info.size, info.hash), []).append(info)
+        moved: List[Tuple[str, TrackInfo]] = []
+        missing: List[str] = []
+        for path in gone:
+            row = known.get(path)
+            if row is None or row[4]:
+                continue
+            candidates = by_content.get((row[1], row[3])) if row[3] else None
+            if candidates:
+                moved.append((path, candidates.pop()))
+            else:
+                missing.append(path)
+        taken = {info.path for _, info in moved}
+        database.move_cached_paths([(old, info.path) for old, info in moved], self.db_path)
+        return WatchBatch([info for info in changed if info.path not in taken], moved, missing)
+
+    def _publish(self, batch: WatchBatch):
+        if not batch.is_empty():
+            self.batches.put(batch)
+
+def apply_batch(pm: PlaylistManager, batch: WatchBatch, target: Optional[Playlist] = None) -> Tuple[int, int, int]:
+    # On the Tk thread: relocate moved tracks, flag missing ones, refresh changed
+    # ones and add new files to target (when given). Only a path no track had
+    # yet is new; a known track is refreshed and stays where the user put it,
+    # so one removed from target is not added back. Everything lands in the
+    # tracker, so the next save writes it in one transaction.
+    # Returns (added, relocated, missing).
+    catalog = pm.catalog
+    changed = list(batch.changed)
+    relocated = 0
+    for old, info in batch.moved:
+        track = catalog.get(old)
+        if track is not None and catalog.relocate(track, info.path):
+            catalog.get_or_create(info.title, info.path, info.size, info.mtime, info.hash)
+            catalog.set_missing(track, False)
+            relocated += 1
+        else:
+            if track is not None:
+                catalog.set_missing(track, True)
+            changed.append(info)
+    missing = 0
+    for path in batch.missing:
+        track = catalog.get(path)
+        if track is not None and not catalog.is_missing(track):
+            catalog.set_missing(track, True)
+            missing += 1
+    added = 0
+    for info in changed:
+        new = catalog.get(info.path) is None
+        if new and (target is None or target.rules is not None):
+            continue  # not in any playlist and nowhere to add it
+        track = catalog.get_or_create(info.title, info.path, info.size, info.mtime, info.hash)
+        catalog.set_missing(track, False)
+        if new:
+            target.add_track(track)
+            added += 1
+    return added, relocated, missing
@@ -0,0 +1,36 @@
+import os
+import sys
+import pytest
+
+# The app's modules import each other from src/ by bare name
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+import database
+from store import SqliteStore
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "playlist.db")
+    database.init_db(path)
+    return path
+
+
+@pytest.fixture
+def sqlite_store(db_path):
+    store = SqliteStore(db_path)
+    yield store
+    store.close()
+
+
+def save(store, pm):
+    # What PersistenceService does for one batch
+    changes = pm.collect_changes()
+    if not changes.is_empty():
+        store.apply([changes])
+
+
+def snapshot_of(pm):
+    # name -> [(title, path, position)] in play order
+    return {name: [(node.title, node.filepath, node.position) for node in pl]
+            for name, pl in pm.playlists.items()}
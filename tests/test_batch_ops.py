@@ -0,0 +1,91 @@
+import pytest
+from conftest import save, snapshot_of
+from playlist import PlaylistManager
+from smart import SmartPlaylist
+from store import SqliteStore
+
+
+@pytest.fixture
+def pm():
+    pm = PlaylistManager()
+    pm.create_playlist("Mix")
+    pm.create_playlist("Other")
+    return pm
+
+
+def fill(pl, titles):
+    return [pl.add_song(t, f"/music/{t}.mp3") for t in titles]
+
+
+def titles(pl):
+    return [node.title for node in pl]
+
+
+def test_delete_many_is_one_event(pm):
+    pl = pm.playlists["Mix"]
+    nodes = fill(pl, "abcdef")
+    stranger = fill(pm.playlists["Other"], "x")[0]
+    events = []
+    pm.tracker.listeners.append(lambda seq, kind, *rest: events.append(kind))
+    assert pl.delete_nodes([nodes[4], nodes[1], stranger, nodes[1]]) == 2
+    assert titles(pl) == ["a", "c", "d", "f"]
+    assert events == ["remove_many"]
+
+
+def test_copy_and_move_keep_playlist_order(pm):
+    mix, other = pm.playlists["Mix"], pm.playlists["Other"]
+    nodes = fill(mix, "abcd")
+    copies = pm.copy_songs([nodes[3], nodes[0]], other)
+    assert titles(other) == ["a", "d"]
+    assert copies[0].track is nodes[0].track and copies[0] is not nodes[0]
+    pm.move_songs(mix, [nodes[2], nodes[1]], other)
+    assert titles(mix) == ["a", "d"]
+    assert titles(other) == ["a", "d", "b", "c"]
+
+
+def test_smart_playlists_take_no_batch_edits(pm):
+    smart = SmartPlaylist("Loud", "title contains a", pm.catalog)
+    pm.add_playlist(smart)
+    nodes = fill(pm.playlists["Mix"], "ab")
+    assert pm.copy_songs(nodes, smart) == []
+    assert pm.move_songs(pm.playlists["Mix"], nodes, smart) == []
+    assert titles(pm.playlists["Mix"]) == ["a", "b"]
+
+
+def test_dedupe_keeps_the_first_of_each_track(pm):
+    pl = pm.playlists["Mix"]
+    fill(pl, "abacbda")
+    assert pl.dedupe() == 3
+    assert titles(pl) == ["a", "b", "c", "d"]
+
+
+def test_sort_by_title_and_path(pm):
+    pl = pm.playlists["Mix"]
+    pl.add_song("b", "/music/2.mp3")
+    pl.add_song("c", "/music/1.mp3")
+    pl.add_song("a", "/music/3.mp3")
+    pl.sort_by(lambda node: node.title.lower())
+    assert titles(pl) == ["a", "b", "c"]
+    pl.sort_by(lambda node: node.filepath)
+    assert titles(pl) == ["c", "b", "a"]
+    pl.sort_by(lambda node: node.filepath, reverse=True)
+    assert titles(pl) == ["a", "b", "c"]
+
+
+def test_batch_is_saved_in_one_change_set(sqlite_store, db_path):
+    pm = sqlite_store.load()
+    pm.create_playlist("Other")
+    mix, other = pm.playlists["My Playlist"], pm.playlists["Other"]
+    nodes = fill(mix, [f"song{i}" for i in range(1000)])
+    save(sqlite_store, pm)
+    pm.move_songs(mix, nodes[::2], other)
+    mix.sort_by(lambda node: node.title, reverse=True)
+    changes = pm.collect_changes()
+    assert len(changes.deletes) == 500 and len(changes.inserts) == 500
+    sqlite_store.apply([changes])
+    expected = snapshot_of(pm)
+    sqlite_store.close()
+
+    store = SqliteStore(db_path)
+    assert snapshot_of(store.load()) == expected
+    store.close()
@@ -0,0 +1,81 @@
+import sqlite3
+import pytest
+from conftest import save
+from history import SKIP_SECONDS, PlayHistory, _roll_up
+
+
+@pytest.fixture
+def songs(sqlite_store):
+    # Saved first, so the tracks have ids
+    pm = sqlite_store.load()
+    pl = pm.playlists["My Playlist"]
+    nodes = [pl.add_song(t, f"/music/{t}.mp3") for t in "abcd"]
+    save(sqlite_store, pm)
+    return pl, nodes
+
+
+@pytest.fixture
+def history(db_path):
+    history = PlayHistory(db_path, flush_seconds=60)
+    yield history
+    history.close()
+
+
+def play(history, pl, node, at, seconds, naturally=True):
+    history.started(pl, node, at)
+    history.ended(node, naturally, at + seconds)
+
+
+def summary(stats):
+    return [(s.title, s.plays, s.skips) for s in stats]
+
+
+def test_roll_up_sums_per_track():
+    events = [(1, 9, 10.0, 200.0, 0), (2, 9, 20.0, 25.0, 1), (1, 9, 300.0, 500.0, 0), (1, 9, 600.0, 601.0, 1)]
+    assert sorted(_roll_up(events)) == [(1, 2, 1, 600.0), (2, 0, 1, 20.0)]
+
+
+def test_views_follow_the_plays(history, songs):
+    pl, (a, b, c, d) = songs
+    play(history, pl, a, 100, 200)
+    play(history, pl, b, 400, 200)
+    play(history, pl, a, 700, 200)
+    play(history, pl, c, 1000, SKIP_SECONDS - 1, naturally=False)
+    # Stopped by hand after SKIP_SECONDS still counts as played
+    play(history, pl, b, 1100, SKIP_SECONDS + 1, naturally=False)
+    play(history, pl, b, 1200, 200)
+
+    assert summary(history.most_played(2)) == [("b", 3, 0), ("a", 2, 0)]
+    assert [s.title for s in history.recently_played()] == ["b", "c", "a"]
+    assert history.stats_for(c.track.id).skip_rate == 1.0
+    assert history.stats_for(d.track.id) is None
+    assert sorted(pl, key=history.sort_key("plays")) == [b, a, c, d]
+    with pytest.raises(ValueError):
+        history.sort_key("mood")
+
+
+def test_starting_another_song_closes_the_open_one(history, songs):
+    pl, (a, b, _, _) = songs
+    history.started(pl, a, 100)
+    history.started(pl, b, 105)
+    history.ended(a, True, 300)
+    assert summary(history.recently_played()) == [("a", 0, 1)]
+
+
+def test_rollup_is_stored_and_added_to(history, songs, db_path):
+    pl, (a, b, _, _) = songs
+    play(history, pl, a, 100, 200)
+    play(history, pl, b, 400, 5, naturally=False)
+    assert history.flush(5)
+    play(history, pl, a, 700, 200)
+    assert history.flush(5)
+
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("SELECT COUNT(*) FROM play_events").fetchone()[0] == 3
+    conn.close()
+    reloaded = PlayHistory(db_path)
+    reloaded.reload()
+    assert summary(reloaded.most_played()) == [("a", 2, 0)]
+    assert reloaded.stats_for(a.track.id).last_played == 700
+    assert summary(reloaded.recently_played()) == [("a", 2, 0), ("b", 0, 1)]
+    reloaded.close()
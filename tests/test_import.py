@@ -0,0 +1,48 @@
+import sqlite3
+import database
+from playlist_io import import_file
+
+
+def write_m3u(folder, names):
+    path = folder / "party.m3u8"
+    path.write_text("#EXTM3U\n" + "".join(f"#EXTINF:100,{name}\n{name}.mp3\n" for name in names))
+    return str(path)
+
+
+def titles(pm, name="party"):
+    return [node.title for node in pm.playlists[name]]
+
+
+def test_reimport_appends_by_default(tmp_path, sqlite_store):
+    pm = sqlite_store.load()
+    path = write_m3u(tmp_path, ["a", "b"])
+    import_file(pm, path)
+    assert import_file(pm, path) == {"party": 2}
+    assert titles(pm) == ["a", "b", "a", "b"]
+
+
+def test_replace_empties_the_playlist_first(tmp_path, sqlite_store):
+    pm = sqlite_store.load()
+    import_file(pm, write_m3u(tmp_path, ["a", "b", "c"]))
+    assert import_file(pm, write_m3u(tmp_path, ["c", "d"]), replace=True) == {"party": 2}
+    assert titles(pm) == ["c", "d"]
+
+
+def test_skip_existing_adds_only_new_files(tmp_path, sqlite_store):
+    pm = sqlite_store.load()
+    import_file(pm, write_m3u(tmp_path, ["a", "b"]))
+    assert import_file(pm, write_m3u(tmp_path, ["b", "c", "c", "a", "d"]), skip_existing=True) == {"party": 2}
+    assert titles(pm) == ["a", "b", "c", "d"]
+
+
+def test_bulk_save_restores_the_page_cache(tmp_path, db_path):
+    pm = database.load_all_playlists(db_path=db_path)
+    import_file(pm, write_m3u(tmp_path, [f"song{i}" for i in range(database.BULK_ROWS)]))
+    changes = pm.collect_changes()
+    conn = sqlite3.connect(db_path)
+    cache = conn.execute("PRAGMA cache_size").fetchone()[0]
+    with conn:
+        database.apply_changes(conn, changes)
+    assert conn.execute("PRAGMA cache_size").fetchone()[0] == cache
+    assert conn.execute("SELECT COUNT(*) FROM songs").fetchone()[0] == database.BULK_ROWS
+    conn.close()
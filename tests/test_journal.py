@@ -0,0 +1,207 @@
+import os
+import time
+import pytest
+from conftest import save, snapshot_of
+from journal import JournalLog, UndoHistory
+from playlist import PlaylistManager
+from store import SqliteStore
+
+
+@pytest.fixture
+def journal_path(tmp_path):
+    return str(tmp_path / "journal.log")
+
+
+def crash(journal):
+    # The process dies: nothing more is saved and the log stays as written
+    journal.close()
+
+
+def boot(db_path, journal_path):
+    store = SqliteStore(db_path)
+    pm = store.load()
+    journal = JournalLog(journal_path)
+    replayed = journal.recover(pm, store.seq())
+    journal.attach(pm)
+    return store, pm, journal, replayed
+
+
+# ===== Crash recovery =====
+def test_recover_replays_unsaved_edits(db_path, journal_path):
+    store, pm, journal, _ = boot(db_path, journal_path)
+    pm.create_playlist("Mix")
+    mix = pm.playlists["Mix"]
+    nodes = [mix.add_song(f"Song {i}", f"/music/{i}.mp3") for i in range(6)]
+    save(store, pm)
+    journal.checkpoint(store.seq())
+
+    # Edits the debounced save never got to
+    mix.move_song(nodes[4], None)
+    mix.delete_node(nodes[2])
+    mix.insert_after(nodes[0], "Late", "/music/late.mp3")
+    pm.rename_playlist("Mix", "Mixtape")
+    pm.create_playlist("Fresh")
+    pm.playlists["Fresh"].add_song("New", "/music/new.mp3")
+    expected = snapshot_of(pm)
+    crash(journal)
+    store.close()
+
+    store, pm, journal, replayed = boot(db_path, journal_path)
+    assert replayed > 0
+    assert {name: [song[:2] for song in songs] for name, songs in snapshot_of(pm).items()} == \
+           {name: [song[:2] for song in songs] for name, songs in expected.items()}
+    # The replayed edits are pending like any other
+    save(store, pm)
+    journal.checkpoint(store.seq())
+    crash(journal)
+    store.close()
+
+    store, reloaded, journal, replayed = boot(db_path, journal_path)
+    assert replayed == 0
+    assert snapshot_of(reloaded) == snapshot_of(pm)
+    journal.close()
+    store.close()
+
+
+def test_recover_skips_torn_last_record(db_path, journal_path):
+    store, pm, journal, _ = boot(db_path, journal_path)
+    pl = pm.playlists["My Playlist"]
+    pl.add_song("Kept", "/music/kept.mp3")
+    crash(journal)
+    with open(journal_path, "a", encoding="utf-8") as f:
+        f.write('[99,"add",1,5,0,"Torn","/music/to')
+    store.close()
+
+    store, pm, journal, replayed = boot(db_path, journal_path)
+    assert replayed == 1
+    assert [node.title for node in pm.playlists["My Playlist"]] == ["Kept"]
+    journal.close()
+    store.close()
+
+
+def test_checkpoint_empties_log(db_path, journal_path):
+    store, pm, journal, _ = boot(db_path, journal_path)
+    pm.playlists["My Playlist"].add_song("Saved", "/music/saved.mp3")
+    save(store, pm)
+    journal.checkpoint(store.seq())
+    crash(journal)
+    store.close()
+
+    store, pm, journal, replayed = boot(db_path, journal_path)
+    assert replayed == 0
+    assert [node.title for node in pm.playlists["My Playlist"]] == ["Saved"]
+    journal.close()
+    store.close()
+
+
+def test_recover_replays_track_flags(db_path, journal_path):
+    store, pm, journal, _ = boot(db_path, journal_path)
+    node = pm.playlists["My Playlist"].add_song("Moved", "/music/old.mp3")
+    save(store, pm)
+    journal.checkpoint(store.seq())
+    pm.catalog.relocate(node.track, "/music/new.mp3")
+    pm.catalog.set_missing(node.track, True)
+    crash(journal)
+    store.close()
+
+    store, pm, journal, _ = boot(db_path, journal_path)
+    track = next(iter(pm.playlists["My Playlist"])).track
+    assert track.path == "/music/new.mp3"
+    assert pm.catalog.is_missing(track)
+    journal.close()
+    store.close()
+
+
+def test_records_are_fsynced_in_groups(db_path, journal_path, monkeypatch):
+    synced = []
+    fsync = os.fsync
+
+    def slow_fsync(fd):
+        # A disk that takes a while, so edits pile up behind each fsync
+        time.sleep(0.005)
+        fsync(fd)
+        synced.append(os.fstat(fd).st_size)
+
+    monkeypatch.setattr(os, "fsync", slow_fsync)
+    store, pm, journal, _ = boot(db_path, journal_path)
+    pl = pm.playlists["My Playlist"]
+    for i in range(500):
+        pl.add_song(f"Song {i}", f"/music/{i}.mp3")
+    journal.close()
+    store.close()
+    assert 1 <= len(synced) < 500
+    # Everything written was fsynced by the time close() returned
+    assert synced[-1] == os.path.getsize(journal_path)
+
+
+# ===== Undo =====
+def titles(pl):
+    return [node.title for node in pl]
+
+
+@pytest.fixture
+def history():
+    pm = PlaylistManager()
+    pm.create_playlist("Mix")
+    return UndoHistory(pm)
+
+
+def test_undo_delete_relinks_same_node(history):
+    pl = history.pm.playlists["Mix"]
+    a, b, c = (pl.add_song(t, f"/music/{t}.mp3") for t in "abc")
+    pl.delete_node(b)
+    assert history.undo()
+    assert titles(pl) == ["a", "b", "c"]
+    assert pl.contains(b) and b.prev is a and b.next is c
+    assert history.redo()
+    assert titles(pl) == ["a", "c"]
+
+
+def test_undo_move_and_bulk_delete(history):
+    pl = history.pm.playlists["Mix"]
+    nodes = [pl.add_song(t, f"/music/{t}.mp3") for t in "abcde"]
+    pl.move_song(nodes[4], None)
+    pl.delete_nodes([nodes[1], nodes[3]])
+    assert titles(pl) == ["e", "a", "c"]
+    history.undo()
+    assert titles(pl) == ["e", "a", "b", "c", "d"]
+    history.undo()
+    assert titles(pl) == list("abcde")
+    history.redo()
+    history.redo()
+    assert titles(pl) == ["e", "a", "c"]
+
+
+def test_undo_clear_and_group(history):
+    pm = history.pm
+    pl = pm.playlists["Mix"]
+    with history.group():
+        for t in "abc":
+            pl.add_song(t, f"/music/{t}.mp3")
+    pl.clear()
+    history.undo()
+    assert titles(pl) == list("abc")
+    # The grouped adds go in one step
+    history.undo()
+    assert titles(pl) == []
+    assert not history.can_undo()
+    history.redo()
+    assert titles(pl) == list("abc")
+
+
+def test_undo_drop_playlist(history):
+    pm = history.pm
+    pl = pm.playlists["Mix"]
+    pl.add_song("a", "/music/a.mp3")
+    pm.delete_playlist("Mix")
+    history.undo()
+    assert pm.playlists["Mix"] is pl
+    assert titles(pl) == ["a"]
+
+
+def test_new_edit_drops_redo(history):
+    pl = history.pm.playlists["Mix"]
+    pl.add_song("a", "/music/a.mp3")
+    history.undo()
+    pl.add_song("b", "/music/b.mp3")
+    assert not history.can_redo()
@@ -0,0 +1,76 @@
+import sqlite3
+import pytest
+import database
+import library
+from conftest import save
+from store import SqliteStore
+
+
+@pytest.fixture
+def libraries(tmp_path, monkeypatch):
+    monkeypatch.setattr(library, "MAIN_DB", str(tmp_path / "database" / "playlist.db"))
+    monkeypatch.setattr(library, "LIBRARIES_DIR", str(tmp_path / "database" / "libraries"))
+    return tmp_path
+
+
+def make_library(path, titles):
+    database.init_db(path)
+    store = SqliteStore(path)
+    pm = store.load()
+    for title in titles:
+        pm.playlists["My Playlist"].add_song(title, f"/music/{title}.mp3")
+    save(store, pm)
+    store.close()
+    return path
+
+
+def age(path):
+    # What a database from before schema versions looks like
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA user_version = 0")
+    conn.close()
+
+
+def contents(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def test_out_of_date_library_is_left_as_it_is(libraries):
+    make_library(library.MAIN_DB, ["Blue Train"])
+    old = make_library(library.library_path("old"), ["Blue Moon"])
+    age(old)
+    before = contents(old)
+
+    libs = library.LibrarySet()
+    assert list(libs.totals()["libraries"]) == ["main"]
+    assert [hit.library for hit in libs.search("blue")] == ["main"]
+    with pytest.raises(ValueError, match="older schema"):
+        libs.search("blue", names=["old"])
+    libs.close()
+    assert contents(old) == before
+    assert database.schema_version(old) == 0
+
+
+def test_other_libraries_are_not_written(libraries):
+    main = make_library(library.MAIN_DB, ["Blue Train"])
+    make_library(library.library_path("studio"), ["Blue Moon"])
+    before = contents(main)
+    libs = library.LibrarySet(active=library.library_path("studio"))
+    assert libs.totals()["all"]["songs"] == 2
+    assert {hit.library for hit in libs.search("blue", names=["main"])} == {"main"}
+    libs.close()
+    assert contents(main) == before
+
+
+def test_active_database_outside_the_libraries_is_included(libraries):
+    make_library(library.MAIN_DB, ["Blue Train"])
+    outside = make_library(str(libraries / "elsewhere.db"), ["Blue Moon", "Kind of Blue"])
+    age(outside)
+
+    libs = library.LibrarySet(active=outside)
+    totals = libs.totals()["libraries"]
+    assert totals[libs.active]["songs"] == 2 and totals["main"]["songs"] == 1
+    libs.close()
+    # The active database is the one that is brought up to date
+    assert database.schema_version(outside) == database.SCHEMA_VERSION
@@ -0,0 +1,129 @@
+import os
+import pytest
+from conftest import save, snapshot_of
+from store import LogStore
+
+
+def fill(store, batches=3, songs=20):
+    pm = store.load()
+    pl = pm.playlists["My Playlist"]
+    for b in range(batches):
+        for i in range(songs):
+            pl.add_song(f"Song {b}.{i}", f"/music/{b}/{i}.mp3")
+        pl.delete_node(pl.head)
+        save(store, pm)
+    return pm
+
+
+def lines(path):
+    with open(path, "rb") as f:
+        return f.read().splitlines()
+
+
+def test_torn_tail_is_cut_on_open(tmp_path):
+    path = str(tmp_path / "playlists.log")
+    store = LogStore(path)
+    pm = fill(store)
+    expected, seq = snapshot_of(pm), store.seq()
+    store.close()
+    good = os.path.getsize(path)
+    with open(path, "ab") as f:
+        f.write(b'["batch",[[99,[],[[1,"/music/torn.mp3"')
+
+    store = LogStore(path)
+    assert snapshot_of(store.load()) == expected
+    assert store.seq() == seq
+    assert os.path.getsize(path) == good
+    store.close()
+
+
+def test_writes_after_a_torn_tail_replay(tmp_path):
+    path = str(tmp_path / "playlists.log")
+    store = LogStore(path)
+    fill(store)
+    store.close()
+    with open(path, "ab") as f:
+        f.write(b'["batch",[')
+
+    store = LogStore(path)
+    pm = store.load()
+    pm.playlists["My Playlist"].add_song("After", "/music/after.mp3")
+    save(store, pm)
+    expected = snapshot_of(pm)
+    store.close()
+
+    store = LogStore(path)
+    assert snapshot_of(store.load()) == expected
+    store.close()
+
+
+def test_compaction_keeps_state(tmp_path):
+    path = str(tmp_path / "playlists.log")
+    store = LogStore(path, compact_bytes=2048)
+    pm = fill(store, batches=12)
+    expected, seq = snapshot_of(pm), store.seq()
+    records = lines(path)
+    # Compacted at least once: the file starts with a snapshot, and fewer
+    # batches follow it than were written
+    assert records[0].startswith(b'["snapshot"')
+    assert len(records) < 12
+    store.close()
+    assert not os.path.exists(path + ".tmp")
+
+    store = LogStore(path)
+    assert snapshot_of(store.load()) == expected
+    assert store.seq() == seq
+    store.close()
+
+
+def test_snapshot_replaces_log(tmp_path):
+    path = str(tmp_path / "playlists.log")
+    store = LogStore(path)
+    pm = fill(store)
+    store.snapshot(pm)
+    assert len(lines(path)) == 1
+    pm.playlists["My Playlist"].add_song("Later", "/music/later.mp3")
+    save(store, pm)
+    expected = snapshot_of(pm)
+    store.close()
+
+    store = LogStore(path)
+    assert snapshot_of(store.load()) == expected
+    store.close()
+
+
+class TornFile:
+    # Writes half of what it is given, then fails like a full disk
+    def __init__(self, file):
+        self.file = file
+
+    def write(self, data):
+        self.file.write(data[:len(data) // 2])
+        self.file.flush()
+        raise OSError("No space left on device")
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+
+def test_failed_write_is_cut_before_the_retry(tmp_path):
+    path = str(tmp_path / "playlists.log")
+    store = LogStore(path)
+    pm = fill(store, batches=1)
+    size = os.path.getsize(path)
+    pm.playlists["My Playlist"].add_song("Retried", "/music/retried.mp3")
+    changes = pm.collect_changes()
+    store._file = TornFile(store._file)
+    with pytest.raises(OSError):
+        store.apply([changes])
+    assert os.path.getsize(path) == size
+    # What PersistenceService does: the batch stays queued and is retried
+    store.apply([changes])
+    pm.playlists["My Playlist"].add_song("Later", "/music/later.mp3")
+    save(store, pm)
+    expected = snapshot_of(pm)
+    store.close()
+
+    store = LogStore(path)
+    assert snapshot_of(store.load()) == expected
+    store.close()
@@ -0,0 +1,80 @@
+import queue
+from player import MusicPlayer
+from playlist import PlaylistManager
+
+
+def make():
+    pm = PlaylistManager()
+    pm.create_playlist("Mix")
+    pl = pm.playlists["Mix"]
+    return pl, [pl.add_song(t, f"/music/{t}.mp3") for t in "abc"]
+
+
+def idle_player():
+    player = MusicPlayer()
+    # Nothing consumes the commands: the tests play the worker's part
+    player.shutdown()
+    return player
+
+
+def commands(player):
+    out = []
+    while True:
+        try:
+            out.append(player._commands.get_nowait())
+        except queue.Empty:
+            return out
+
+
+def test_events_from_an_older_play_are_not_adopted():
+    pl, (a, b, c) = make()
+    player = idle_player()
+    player.play_node(pl, a)
+    older = player._generation
+    player.play_node(pl, b)
+    # The worker started a and ran out of it before it saw the click on b
+    player._events.put(("start", pl, a, a.filepath, older))
+    player._events.put(("end", pl, a, True, older))
+    player._events.put(("idle", pl, a, older))
+    assert [event[0] for event in player.poll_events()] == ["start", "end"]
+    assert player.current_node is b and player.current_path == b.filepath
+    assert not player.is_playing()
+
+    commands(player)
+    player._events.put(("start", pl, b, b.filepath, player._generation))
+    assert player.poll_events() == [("start", pl, b)]
+    assert player.current_node is b and player.is_playing()
+    assert [cmd[:4] for cmd in commands(player)] == [("prepare", pl, b, c)]
+
+
+def test_idle_of_the_current_play_advances():
+    pl, (a, b, c) = make()
+    player = idle_player()
+    player.play_node(pl, a)
+    player._events.put(("start", pl, a, a.filepath, player._generation))
+    player._events.put(("end", pl, a, True, player._generation))
+    player._events.put(("idle", pl, a, player._generation))
+    player.poll_events()
+    assert player.current_node is b
+    assert commands(player)[-1][:3] == ("play", pl, b)
+
+
+def test_stop_ignores_a_late_start():
+    pl, (a, b, c) = make()
+    player = idle_player()
+    player.play_node(pl, a)
+    started = player._generation
+    player.stop()
+    player._events.put(("start", pl, a, a.filepath, started))
+    player.poll_events()
+    assert player.playlist is None and player.current_node is None
+    assert not player.is_playing()
+
+
+def test_worker_drops_a_prepare_for_another_song():
+    pl, (a, b, c) = make()
+    player = idle_player()
+    player._track_generation, player._active, player._track = 2, True, (pl, b, b.filepath)
+    player._prepare(pl, a, c, c.filepath, 2)
+    player._prepare(pl, b, c, c.filepath, 1)
+    assert player._next is None
@@ -0,0 +1,71 @@
+from conftest import save, snapshot_of
+from playlist import MIN_SPREAD, POSITION_GAP
+from store import SqliteStore
+
+
+def filled(pm, count=100):
+    pl = pm.playlists["My Playlist"]
+    nodes = [pl.add_song(f"Song {i}", f"/music/{i}.mp3") for i in range(count)]
+    pm.collect_changes()
+    return pl, nodes
+
+
+def labels(pl):
+    return [node.position for node in pl]
+
+
+def test_edits_touch_only_their_own_rows(sqlite_store):
+    pm = sqlite_store.load()
+    pl, nodes = filled(pm)
+    before = {node: node.position for node in pl}
+    pl.move_song(nodes[90], nodes[10])
+    pl.delete_node(nodes[50])
+    new = pl.insert_after(nodes[20], "New", "/music/new.mp3")
+    changes = pm.collect_changes()
+    assert changes.moves == [(nodes[90].position, nodes[90].id)]
+    assert changes.deletes == [nodes[50].id]
+    assert [row[0] for row in changes.inserts] == [new.id]
+    assert all(node.position == position for node, position in before.items() if node is not nodes[90])
+
+
+def test_crowded_gap_relabels_a_small_window(sqlite_store):
+    pm = sqlite_store.load()
+    pl, nodes = filled(pm)
+    # Every insert lands right after the same song, halving the gap each time
+    relabeled = 0
+    for i in range(200):
+        pl.insert_after(nodes[40], f"Crowd {i}", f"/music/crowd/{i}.mp3")
+        relabeled += len(pm.collect_changes().moves)
+    found = labels(pl)
+    assert found == sorted(found) and len(set(found)) == len(found)
+    # Spreading doubles its window, so relabels stay far below one full
+    # renumbering (300 rows) per crowded insert
+    assert relabeled < 200 * 16
+    assert nodes[0].position == POSITION_GAP and nodes[-1].position == 100 * POSITION_GAP
+
+
+def test_relabels_are_saved(sqlite_store, db_path):
+    pm = sqlite_store.load()
+    pl = pm.playlists["My Playlist"]
+    nodes = [pl.add_song(f"Song {i}", f"/music/{i}.mp3") for i in range(20)]
+    save(sqlite_store, pm)
+    for i in range(40):
+        pl.insert_after(nodes[5], f"Crowd {i}", f"/music/crowd/{i}.mp3")
+    pl.move_song(nodes[19], None)
+    save(sqlite_store, pm)
+    expected = snapshot_of(pm)
+    sqlite_store.close()
+
+    store = SqliteStore(db_path)
+    assert snapshot_of(store.load()) == expected
+    store.close()
+
+
+def test_reorder_spreads_labels_evenly(sqlite_store):
+    pm = sqlite_store.load()
+    pl, nodes = filled(pm, 10)
+    for i in range(MIN_SPREAD * 4):
+        pl.insert_after(nodes[0], f"Crowd {i}", f"/music/crowd/{i}.mp3")
+    pl.reorder(list(pl)[::-1])
+    assert labels(pl) == [i * POSITION_GAP for i in range(1, pl.length + 1)]
+    assert list(pl)[-1] is nodes[0]
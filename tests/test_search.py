@@ -0,0 +1,38 @@
+import pytest
+from conftest import save
+from search import SearchIndex
+
+
+@pytest.fixture
+def index(sqlite_store, db_path):
+    # Far more substring matches than one query over-fetches, all stored
+    # before the better ones
+    pm = sqlite_store.load()
+    pl = pm.playlists["My Playlist"]
+    for i in range(1000):
+        pl.add_song(f"Track {i:04d} xbluex", f"/music/filler/{i}.mp3")
+    for title in ["Kind of Blue", "Blue Train", "Blues for Alice", "Blue"]:
+        pl.add_song(title, f"/music/{title}.mp3")
+    save(sqlite_store, pm)
+    index = SearchIndex(db_path=db_path)
+    yield index
+    index.close()
+
+
+def test_prefix_and_word_matches_beat_earlier_rows(index):
+    hits = index.search("blue", limit=10)
+    assert [h.title for h in hits[:4]] == ["Blue", "Blue Train", "Blues for Alice", "Kind of Blue"]
+    assert len(hits) == 10
+    assert all(h.title.endswith("xbluex") for h in hits[4:])
+
+
+def test_word_match_beats_substring(index):
+    assert index.search("of blue", limit=5)[0].title == "Kind of Blue"
+
+
+def test_short_query_is_a_title_prefix(index):
+    assert [h.title for h in index.search("Bl", limit=3)] == ["Blue", "Blue Train", "Blues for Alice"]
+
+
+def test_typo_falls_back_to_fuzzy(index):
+    assert index.search("Blue Trian", limit=5)[0].title == "Blue Train"
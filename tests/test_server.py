@@ -0,0 +1,122 @@
+import asyncio
+import threading
+import pytest
+from conftest import save
+from loadtest import ApiClient
+from persistence import PersistenceService
+from server import ApiServer
+from smart import SmartEngine
+from store import SqliteStore
+
+
+@pytest.fixture
+def api(db_path):
+    # Runs a scenario against a server on an ephemeral port, wired up the way
+    # server.serve() does it, without a player
+    store = SqliteStore(db_path)
+    pm = store.load()
+    pl = pm.playlists["My Playlist"]
+    for i in range(25):
+        pl.add_song(f"Track {i:02d}", f"/music/{i:02d}.mp3")
+    save(store, pm)
+    persistence = PersistenceService(store=store, debounce=0.01)
+    owner = threading.get_ident()
+
+    def sync():
+        if threading.get_ident() == owner:
+            persistence.schedule(pm)
+        persistence.flush()
+
+    SmartEngine(pm, sync=sync, db_path=db_path)
+
+    def run(scenario):
+        async def main():
+            server = ApiServer(pm, persistence, db_path=db_path)
+            listening = await server.start("127.0.0.1", 0)
+            client = ApiClient("127.0.0.1", listening.sockets[0].getsockname()[1])
+            try:
+                return await scenario(client.request)
+            finally:
+                await client.close()
+                # Let the server see the connection end before it shuts down
+                await asyncio.sleep(0.05)
+                await server.close()
+        return asyncio.run(main())
+
+    yield run
+    persistence.close()
+
+
+def test_playlist_crud_is_saved(api, db_path):
+    async def scenario(request):
+        assert (await request("POST", "/playlists", {"name": "Mix"}))[0] == 201
+        assert (await request("POST", "/playlists", {"name": "Mix"}))[0] == 409
+        status, first = await request("POST", "/playlists/Mix/songs", {"path": "/music/a.mp3", "title": "A"})
+        assert status == 201
+        _, second = await request("POST", "/playlists/Mix/songs", {"path": "/music/b.mp3", "title": "B"})
+        moved = await request("POST", f"/playlists/Mix/songs/{first['position']}/move", {"after": second["position"]})
+        assert moved[0] == 200
+        assert (await request("PATCH", "/playlists/Mix", {"name": "Mix 2"}))[0] == 200
+        status, page = await request("GET", "/playlists/Mix%202/songs")
+        return [song["title"] for song in page["songs"]]
+
+    assert api(scenario) == ["B", "A"]
+    store = SqliteStore(db_path)
+    assert [node.title for node in store.load().playlists["Mix 2"]] == ["B", "A"]
+    store.close()
+
+
+def test_listing_pages_and_streams(api):
+    async def scenario(request):
+        titles, after = [], None
+        while True:
+            status, page = await request("GET", "/playlists/My%20Playlist/songs?limit=10"
+                                         + (f"&after={after}" if after else ""))
+            assert status == 200 and page["length"] == 25
+            titles.extend(song["title"] for song in page["songs"])
+            after = page["next"]
+            if after is None:
+                break
+        status, lines = await request("GET", "/playlists/My%20Playlist/songs?stream=1")
+        # One JSON array of songs per line
+        streamed = [song["title"] for line in lines for song in line]
+        return titles, streamed
+
+    titles, streamed = api(scenario)
+    assert titles == [f"Track {i:02d}" for i in range(25)]
+    assert streamed == titles
+
+
+def test_bad_requests_get_4xx(api):
+    async def scenario(request):
+        return [
+            (await request("GET", "/nothing"))[0],
+            (await request("PUT", "/playlists"))[0],
+            (await request("GET", "/playlists/Nope"))[0],
+            (await request("POST", "/playlists", {"name": ""}))[0],
+            (await request("POST", "/playlists", {"name": "Bad", "rules": "mood = happy"}))[0],
+            (await request("POST", "/playlists/My%20Playlist/songs", {"path": "/m/q.mp3", "title": 5}))[0],
+            (await request("GET", "/playlists/My%20Playlist/songs?limit=x"))[0],
+            (await request("DELETE", "/playlists/My%20Playlist/songs/1"))[0],
+        ]
+
+    assert api(scenario) == [404, 405, 404, 400, 400, 400, 400, 404]
+
+
+def test_search_smart_playlists_and_libraries(api, db_path):
+    async def scenario(request):
+        _, found = await request("GET", "/search?q=Track%201&limit=3")
+        await request("POST", "/playlists", {"name": "Teens", "rules": "title contains track 1"})
+        _, smart = await request("GET", "/playlists/Teens/songs")
+        refused = (await request("POST", "/playlists/Teens/songs", {"path": "/m/x.mp3"}))[0]
+        player = (await request("GET", "/player"))[0]
+        _, libraries = await request("GET", "/libraries")
+        return found, smart, refused, player, libraries
+
+    found, smart, refused, player, libraries = api(scenario)
+    assert [hit["title"] for hit in found["hits"]] == ["Track 10", "Track 11", "Track 12"]
+    assert [song["title"] for song in smart["songs"]] == [f"Track {i}" for i in range(10, 20)]
+    assert refused == 409
+    # Headless without a player
+    assert player == 503
+    assert libraries["libraries"][db_path]["songs"] == 25
@@ -0,0 +1,82 @@
+import time
+import pytest
+from conftest import save
+from smart import SmartPlaylist, parse_rules
+
+NOW = 1_700_000_000.0
+
+
+def compiled(text):
+    return [rule.sql(NOW) for rule in parse_rules(text)]
+
+
+# ===== Parsing =====
+def test_clauses_split_on_semicolon_and_and():
+    rules = parse_rules("title contains Love; bpm >= 120 and duration < 4m30s")
+    assert [(r.field, r.op, r.value) for r in rules] == [
+        ("title", "contains", "love"), ("bpm", ">=", 120.0), ("duration", "<", 270.0)]
+
+
+def test_quoted_values_keep_spaces_and_the_word_and():
+    rule, = parse_rules('title = "Rock and Roll"')
+    assert rule.value == "rock and roll"
+
+
+@pytest.mark.parametrize("text, value", [
+    ("added < 30", 30 * 86400.0),
+    ("added < 2w", 14 * 86400.0),
+    ("duration > 90", 90.0),
+    ("size >= 1.5mb", 1.5 * 1024 ** 2),
+])
+def test_units(text, value):
+    assert parse_rules(text)[0].value == value
+
+
+@pytest.mark.parametrize("text", [
+    "", "title", "mood = happy", "title < b", "bpm contains 3", "title under /music",
+    "duration < soon", "size > 3 parsecs", "title ~ (", "bpm > fast",
+])
+def test_invalid_rules_raise(text):
+    with pytest.raises(ValueError):
+        parse_rules(text)
+
+
+# ===== SQL =====
+def test_compiled_conditions():
+    assert compiled("title contains Love") == [("instr(lower(t.title), ?) > 0", ["love"])]
+    assert compiled("bpm > 120") == [("a.bpm > ?", [120.0])]
+    assert compiled("added < 1d") == [("(? - t.added) < ?", [NOW, 86400.0])]
+    (condition, params), = compiled("path under /music/jazz")
+    assert condition == "t.path >= ? AND t.path < ?"
+    assert params[0].endswith("jazz/") and params[1] == params[0][:-1] + chr(ord("/") + 1)
+
+
+def test_regex_rules_stay_in_python():
+    assert compiled("title ~ ^intro") == [None]
+
+
+@pytest.mark.parametrize("rules", [
+    "title contains love",
+    "title = élan",
+    "title = ÉLAN",
+    "title != love song",
+    "path under /music/jazz",
+    "title ~ ^l",
+    "path under /music/jazz; title contains o",
+])
+def test_sql_and_python_agree(sqlite_store, db_path, rules):
+    pm = sqlite_store.load()
+    pl = pm.playlists["My Playlist"]
+    for title, path in [("Love Song", "/music/pop/love.mp3"), ("LOVE SONG", "/music/jazz/love.mp3"),
+                        ("Élan", "/music/jazz/elan.mp3"), ("élan", "/music/pop/elan.mp3"),
+                        ("Blue", "/music/jazzy/blue.mp3"), ("Solo", "/music/jazz/solo/solo.mp3")]:
+        pl.add_song(title, path)
+    save(sqlite_store, pm)
+
+    smart = SmartPlaylist("Smart", rules, pm.catalog)
+    smart.db_path = db_path
+    from_sql = sorted(node.filepath for node in smart)
+    now = time.time()
+    in_python = sorted(node.filepath for node in pl if smart.matches(
+        {"title": node.title, "path": node.filepath}.get, now))
+    assert from_sql and from_sql == in_python
@@ -0,0 +1,77 @@
+import pytest
+from conftest import save, snapshot_of
+from store import LogStore, MemoryStore, SqliteStore
+
+
+@pytest.fixture(params=["sqlite", "memory", "log"])
+def reopen(request, db_path, tmp_path):
+    # A function returning the store as a new process would see it
+    if request.param == "sqlite":
+        return lambda: SqliteStore(db_path)
+    if request.param == "log":
+        return lambda: LogStore(str(tmp_path / "playlists.log"))
+    store = MemoryStore()
+    return lambda: store
+
+
+def edit(pm):
+    pm.create_playlist("Road")
+    pm.create_playlist("Gym")
+    road, gym = pm.playlists["Road"], pm.playlists["Gym"]
+    nodes = [road.add_song(f"Song {i}", f"/music/road/{i}.mp3") for i in range(10)]
+    road.insert_after(None, "Opener", "/music/road/opener.mp3")
+    road.move_song(nodes[7], nodes[1])
+    road.delete_node(nodes[3])
+    road.delete_nodes([nodes[4], nodes[5]])
+    # A track shared with another playlist
+    gym.add_song("Song 0", "/music/road/0.mp3")
+    gym.add_song("Lift", "/music/gym/lift.mp3")
+    pm.rename_playlist("Gym", "Weights")
+
+
+def test_roundtrip(reopen):
+    store = reopen()
+    pm = store.load()
+    edit(pm)
+    save(store, pm)
+    expected = snapshot_of(pm)
+    store.close()
+
+    store = reopen()
+    loaded = store.load()
+    assert snapshot_of(loaded) == expected
+    assert loaded.collect_changes().is_empty()
+    road, weights = loaded.playlists["Road"], loaded.playlists["Weights"]
+    assert next(iter(weights)).track is road.find_by_path("/music/road/0.mp3").track
+    store.close()
+
+
+def test_edits_after_reload_continue_ids(reopen):
+    store = reopen()
+    pm = store.load()
+    edit(pm)
+    save(store, pm)
+    store.close()
+
+    store = reopen()
+    pm = store.load()
+    road = pm.playlists["Road"]
+    ids = {node.id for node in road}
+    node = road.add_song("Encore", "/music/road/encore.mp3")
+    assert node.id not in ids
+    road.reorder(list(road)[::-1])
+    pm.delete_playlist("Weights")
+    save(store, pm)
+    expected = snapshot_of(pm)
+    store.close()
+
+    store = reopen()
+    assert snapshot_of(store.load()) == expected
+    store.close()
+
+
+def test_seq_follows_saves(sqlite_store):
+    pm = sqlite_store.load()
+    edit(pm)
+    save(sqlite_store, pm)
+    assert sqlite_store.seq() == pm.tracker.seq > 0
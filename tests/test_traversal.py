@@ -0,0 +1,122 @@
+import random
+import time
+from collections import Counter
+from playlist import PlaylistManager
+from traversal import REPEAT_ALL, SHUFFLE, Traversal
+
+
+def make(count, seed=1):
+    pm = PlaylistManager()
+    pm.create_playlist("Mix")
+    pl = pm.playlists["Mix"]
+    for i in range(count):
+        pl.add_song(f"Song {i}", f"/music/{i}.mp3")
+    pl._traversal = Traversal(pl, random.Random(seed))
+    pl.traversal.set_mode(SHUFFLE)
+    return pl
+
+
+def play(pl, steps, node=None):
+    # What the player does: peek, then report the start
+    played = []
+    for _ in range(steps):
+        node = pl.traversal.peek_next(node)
+        if node is None:
+            break
+        pl.traversal.started(node)
+        played.append(node)
+    return played
+
+
+def test_round_plays_every_song_once():
+    pl = make(500)
+    first = play(pl, 500)
+    assert len(set(first)) == 500 == len(first)
+    # The next round starts over without repeating the last song first
+    second = play(pl, 500, first[-1])
+    assert second[0] is not first[-1]
+    assert set(second) == set(pl)
+
+
+def test_round_is_uniform():
+    # Where each song lands in a round of 5, over many rounds
+    counts = Counter()
+    rounds = 6000
+    for seed in range(rounds):
+        pl = make(5, seed)
+        for place, node in enumerate(play(pl, 5)):
+            counts[node.title, place] += 1
+    expected = rounds / 5
+    chi2 = sum((counts[f"Song {i}", p] - expected) ** 2 / expected for i in range(5) for p in range(5))
+    # 16 degrees of freedom; p < 0.001 beyond 39.3
+    assert chi2 < 39.3
+
+
+def test_inserted_song_joins_the_round():
+    pl = make(50)
+    played = play(pl, 20)
+    late = pl.insert_after(played[3], "Late", "/music/late.mp3")
+    rest = play(pl, 31, played[-1])
+    assert late in rest
+    assert set(played + rest) == set(pl)
+
+
+def test_deleted_songs_are_never_drawn():
+    pl = make(200)
+    played = play(pl, 10)
+    gone = [node for node in pl if node not in played][:120]
+    pl.delete_nodes(gone)
+    rest = play(pl, 70, played[-1])
+    assert not set(rest) & set(gone)
+    assert set(played + rest) == set(pl)
+
+
+def test_relabeled_songs_stay_in_the_round():
+    pl = make(40)
+    played = play(pl, 10)
+    # Crowd one gap until the labels around it are spread, then reorder all
+    anchor = pl.head
+    for i in range(30):
+        pl.insert_after(anchor, f"Crowd {i}", f"/music/crowd{i}.mp3")
+    pl.reorder(list(pl)[::-1])
+    rest = play(pl, pl.length - 10, played[-1])
+    assert set(played + rest) == set(pl)
+    assert len(set(rest)) == len(rest)
+
+
+def test_peeked_song_that_never_started_goes_back():
+    pl = make(3)
+    node = pl.traversal.peek_next(None)
+    other = pl.head if node is not pl.head else pl.tail
+    pl.traversal.started(other)
+    played = [other] + play(pl, 2, other)
+    assert set(played) == set(pl)
+
+
+def test_step_cost_does_not_depend_on_labels():
+    pl = make(20000)
+    play(pl, 100)
+    pl.delete_nodes([node for node in list(pl)[10:]])
+    t0 = time.perf_counter()
+    played = play(pl, 1000)
+    assert time.perf_counter() - t0 < 0.5
+    assert set(played) <= set(pl)
+
+
+def test_clear_and_undo_restart_the_round():
+    pl = make(10)
+    play(pl, 3)
+    state_nodes = list(pl)
+    pl.clear()
+    assert pl.traversal.peek_next(None) is None
+    pl.add_song("Only", "/music/only.mp3")
+    assert play(pl, 1)[0].title == "Only"
+    assert not set(state_nodes) & set(pl)
+
+
+def test_leaving_shuffle_drops_the_round():
+    pl = make(10)
+    play(pl, 3)
+    pl.traversal.set_mode(REPEAT_ALL)
+    assert pl.traversal._order is None
+    assert pl.traversal.peek_next(pl.tail) is pl.head
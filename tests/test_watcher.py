@@ -0,0 +1,57 @@
+from conftest import save
+from playlist import PlaylistManager
+from watcher import LibraryWatcher, WatchBatch, apply_batch
+from scanner import TrackInfo
+
+
+def write(folder, name, data=b"\0" * 64):
+    path = folder / name
+    path.write_bytes(data)
+    return str(path)
+
+
+def reconcile(root, db_path):
+    watcher = LibraryWatcher(str(root), use_inotify=False, db_path=db_path)
+    watcher._reconcile()
+    # Nothing is published once the folder and the stored tracks agree
+    return WatchBatch([], [], []) if watcher.batches.empty() else watcher.batches.get_nowait()
+
+
+def test_startup_adds_only_new_files_to_target(tmp_path, sqlite_store, db_path):
+    root = tmp_path / "songs"
+    root.mkdir()
+    elsewhere = write(root, "elsewhere.mp3")
+    removed = write(root, "removed.mp3")
+    fresh = write(root, "fresh.mp3")
+    pm = sqlite_store.load()
+    pm.create_playlist("Target")
+    pm.create_playlist("Other")
+    target, other = pm.playlists["Target"], pm.playlists["Other"]
+    # Added by hand, so stored without size or mtime
+    other.add_song("Elsewhere", elsewhere)
+    target.delete_node(target.add_song("Removed", removed))
+    other.add_song("Removed", removed)
+    save(sqlite_store, pm)
+
+    added, relocated, missing = apply_batch(pm, reconcile(root, db_path), target)
+    assert [node.filepath for node in target] == [fresh]
+    assert (added, relocated, missing) == (1, 0, 0)
+    # Known tracks still get the file facts they lacked
+    track = other.find_by_path(elsewhere).track
+    assert track.size == 64 and track.mtime is not None
+
+    save(sqlite_store, pm)
+    assert reconcile(root, db_path).is_empty()
+    assert target.length == 1
+
+
+def test_known_track_is_refreshed_not_added():
+    pm = PlaylistManager()
+    pm.create_playlist("Target")
+    pm.create_playlist("Other")
+    node = pm.playlists["Other"].add_song("Song", "/music/song.mp3")
+    pm.catalog.set_missing(node.track, True)
+    info = TrackInfo("/music/song.mp3", 100, 5.0, "Song", None, None, None, "abc")
+    assert apply_batch(pm, WatchBatch([info], [], []), pm.playlists["Target"]) == (0, 0, 0)
+    assert pm.playlists["Target"].length == 0
+    assert node.track.size == 100 and not pm.catalog.is_missing(node.track)